@@ -71,6 +71,9 @@ from magic import *
 from stdp import *
 from stp import *
 from timedarray import *
+from noisebuffer import *
+from randomstreams import *
+from gapjunction import *
 from deprecated.multiplespikegeneratorgroup import *
 from tests.simpletest import *
 
@@ -165,6 +168,23 @@ define_global_preference(
          ''')
 set_global_preferences(usecstdp=False)
 
+define_global_preference(
+    'usecspikequeue', 'True',
+    desc='''
+         Whether or not to use the C++ spike queue for Synapses, if the
+         extension module in ``brian.experimental.cspikequeue`` is compiled.
+         ''')
+set_global_preferences(usecspikequeue=True)
+
+define_global_preference(
+    'synapses_max_candidates', '2**20',
+    desc='''
+         The maximum number of candidate synapses (pairs of pre and
+         postsynaptic neurons) considered at once when Synapses are created
+         with a probability, a string condition or ``connect_random``.
+         ''')
+set_global_preferences(synapses_max_candidates=2 ** 20)
+
 define_global_preference(
     'brianhears_usegpu', 'False',
     desc='''
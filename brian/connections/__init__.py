@@ -5,3 +5,4 @@ from connectionmatrix import *
 from connection import *
 from delayconnection import *
 from otherconnections import *
+from connectionfile import *
@@ -3,9 +3,11 @@ from sparsematrix import *
 from connectionvector import *
 from constructionmatrix import *
 from connectionmatrix import *
+from connectionmatrix import dense_propagation_strategies
 from construction import *
 from propagation_c_code import *
 from scipy.sparse import issparse
+from ..randomstreams import RandomStream
 import gc
 # we do this at the bottom because of order of import issues
 #from delayconnection import * 
@@ -71,8 +73,11 @@ class Connection(magic.InstanceTracker, ObjectContainer):
         probability ``p`` and weight ``weight`` (this is the amount that
         gets added to the target state variable). If ``fixed`` is True, then
         the number of presynaptic neurons per neuron is constant. If ``seed``
-        is given, it is used as the seed to the random number generators, for
-        exactly repeatable results.
+        is given, it is used as the seed of the
+        :class:`~brian.randomstreams.RandomStream` used to draw the
+        connections, for exactly repeatable results. Each row is drawn from
+        its own substream, so that the result does not depend on how the
+        matrix is built.
     ``connect_full(P,Q[,weight=1])``
         Connect every neuron in ``P`` to every neuron in ``Q`` with the given
         weight.
@@ -128,6 +133,11 @@ class Connection(magic.InstanceTracker, ObjectContainer):
         there were previously none. Memory requirements are ``8NM``
         bytes where ``(N,M)`` are the dimensions. (A ``double`` float
         value uses 8 bytes.)
+        The ``propagation`` keyword selects how spikes are propagated
+        (row by row or with BLAS matrix-vector products), by default
+        this is chosen automatically at each timestep, see
+        :class:`DenseConnectionMatrix` for details. It is an error to
+        give it for the other structures.
     ``sparse``
         A sparse matrix. See :class:`SparseConnectionMatrix` for
         details on implementation. This class features very fast row
@@ -193,6 +203,11 @@ class Connection(magic.InstanceTracker, ObjectContainer):
             self._nstate_mod = modulation # source state index
         if isinstance(structure, str):
             structure = construction_matrix_register[structure]
+        if 'propagation' in kwds:
+            if kwds['propagation'] not in dense_propagation_strategies:
+                raise ValueError('Unknown propagation strategy ' + str(kwds['propagation']))
+            if not (isinstance(structure, type) and issubclass(structure, DenseConstructionMatrix)):
+                raise ValueError('The propagation keyword can only be used with a dense structure')
         self.W = structure((len(source), len(target)), **kwds)
         self.iscompressed = False # True if compress() has been called
         source.set_max_delay(delay)
@@ -230,6 +245,16 @@ class Connection(magic.InstanceTracker, ObjectContainer):
             # If specified, modulation state variable
             if self._nstate_mod is not None:
                 sv_pre = self.source._S[self._nstate_mod]
+            # Dense matrices can use BLAS if there are enough spikes
+            if isinstance(self.W, DenseConnectionMatrix):
+                strategy = self.W.propagation_strategy(len(spikes), self._useaccel)
+                if strategy != 'rows':
+                    spikes = asarray(spikes, dtype=int)
+                    if self._nstate_mod is None:
+                        self.W.propagate_blas(sv, spikes, strategy)
+                    else:
+                        self.W.propagate_blas(sv, spikes, strategy, sv_pre)
+                    return
             # Get the rows of the connection matrix, each row will be either a
             # DenseConnectionVector or a SparseConnectionVector.
             rows = self.W.get_rows(spikes)
@@ -326,9 +351,7 @@ class Connection(magic.InstanceTracker, ObjectContainer):
         P = source or self.source
         Q = target or self.target
         if sparseness is not None: p = sparseness # synonym
-        if seed is not None:
-            numpy.random.seed(seed) # numpy's random number seed
-            pyrandom.seed(seed) # Python's random number seed
+        rng = RandomStream(seed)
         if fixed:
             random_matrix_function = random_matrix_fixed_column
         else:
@@ -343,14 +366,14 @@ class Connection(magic.InstanceTracker, ObjectContainer):
                     weight() + Q._S0[self.nstate]
             except DimensionMismatchError, inst:
                 raise DimensionMismatchError("Incorrects unit for the synaptic weights.", *inst._dims)
-            self.connect(P, Q, random_matrix_function(len(P), len(Q), p, value=weight))
+            self.connect(P, Q, random_matrix_function(len(P), len(Q), p, value=weight, rng=rng))
         else:
             # Check units
             try:
                 weight + Q._S0[self.nstate]
             except DimensionMismatchError, inst:
                 raise DimensionMismatchError("Incorrects unit for the synaptic weights.", *inst._dims)
-            self.connect(P, Q, random_matrix_function(len(P), len(Q), p, value=float(weight)))
+            self.connect(P, Q, random_matrix_function(len(P), len(Q), p, value=float(weight), rng=rng))
 
     def connect_full(self, source=None, target=None, weight=1.):
         '''
@@ -435,6 +458,26 @@ class Connection(magic.InstanceTracker, ObjectContainer):
         set_connection_from_sparse(self, W, delay=delay,
                                    column_access=column_access)
 
+    def save(self, filename):
+        '''
+        Saves the connectivity (weights and delays) to the binary file
+        ``filename``, which can be memory mapped when it is loaded with
+        :meth:`Connection.load`. See :func:`save_connection`.
+        '''
+        from connectionfile import save_connection
+        save_connection(self, filename)
+
+    @staticmethod
+    def load(filename, source, target, mmap_mode='r'):
+        '''
+        Returns a :class:`Connection` (or :class:`DelayConnection`) between
+        ``source`` and ``target`` loaded from a file saved with
+        :meth:`Connection.save`. By default the file is memory mapped
+        read-only, see :func:`load_connection` for details.
+        '''
+        from connectionfile import load_connection
+        return load_connection(filename, source, target, mmap_mode=mmap_mode)
+
     def __getitem__(self, i):
         return self.W.__getitem__(i)
 
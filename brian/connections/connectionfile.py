@@ -0,0 +1,211 @@
+'''
+Binary files storing the connectivity of :class:`Connection` objects
+
+The file starts with the magic string ``BRIANCON``, followed by the length
+of the header (8 bytes, little endian) and the header itself, which is the
+``repr`` of a dictionary describing the connection and the arrays stored in
+the file. The arrays follow, each of them aligned on a 64 bytes boundary, so
+that they can be memory mapped with ``numpy.memmap``. For sparse matrices,
+the arrays are the CSR arrays of the weight matrix (and the values of the
+delay matrix, which has the same structure), and the column access arrays
+if present.
+
+The same layout is used for :class:`Synapses` objects (see
+:func:`~brian.synapses.synapsesfile.save_synapses`), through
+:func:`write_array_file` and :func:`read_array_file`.
+'''
+from base import *
+from connectionmatrix import *
+from connection import *
+from delayconnection import *
+from ast import literal_eval
+
+__all__ = ['save_connection', 'load_connection']
+
+MAGIC = 'BRIANCON'
+VERSION = 1
+ALIGNMENT = 64
+
+
+def _aligned(n):
+    return ((n + ALIGNMENT - 1) // ALIGNMENT) * ALIGNMENT
+
+
+def _matrix_arrays(W, prefix):
+    '''
+    Returns the structure name and a dictionary of the arrays to store for the
+    connection matrix ``W``.
+    '''
+    if isinstance(W, DenseConnectionMatrix):
+        return 'dense', {prefix + 'data': asarray(W)}
+    elif isinstance(W, SparseConnectionMatrix):
+        arrays = {prefix + 'data': W.alldata,
+                  prefix + 'rowind': W.rowind,
+                  prefix + 'allj': W.allj}
+        if W.column_access:
+            arrays[prefix + 'colind'] = W.colind
+            arrays[prefix + 'colalli'] = W.colalli
+            arrays[prefix + 'allcoldataindices'] = W.allcoldataindices
+        return 'sparse', arrays
+    elif isinstance(W, DynamicConnectionMatrix):
+        # stored as a CSR matrix, the free memory is not saved
+        rowind = hstack(([0], cumsum([len(r) for r in W.rowj])))
+        if W.nnz:
+            allj = hstack(W.rowj)
+            data = W.alldata[hstack(W.rowdataind)]
+        else:
+            allj = zeros(0, dtype=int)
+            data = zeros(0)
+        return 'dynamic', {prefix + 'data': data,
+                           prefix + 'rowind': rowind,
+                           prefix + 'allj': allj}
+    else:
+        raise TypeError('Cannot save connection matrices of type ' + W.__class__.__name__)
+
+
+def save_connection(C, filename):
+    '''
+    Saves the connectivity (weights, and delays for a :class:`DelayConnection`)
+    of the :class:`Connection` ``C`` to the file ``filename``.
+
+    The connection is compressed first if necessary. The file can be loaded
+    with :func:`load_connection`.
+    '''
+    if not C.iscompressed:
+        C.compress()
+    header = {'version': VERSION,
+              'class': C.__class__.__name__,
+              'shape': tuple(int(n) for n in C.W.shape),
+              'state': int(C.nstate),
+              'modulation': C._nstate_mod if C._nstate_mod is None else int(C._nstate_mod),
+              }
+    structure, arrays = _matrix_arrays(C.W, 'W_')
+    header['structure'] = structure
+    header['column_access'] = structure == 'sparse' and bool(C.W.column_access)
+    if isinstance(C, DelayConnection):
+        dt = float(C.target.clock.dt)
+        # half a timestep is added so that the number of timesteps is
+        # recovered exactly when loading
+        header['max_delay'] = (C._max_delay - 1 + 0.5) * dt
+        if structure == 'dense':
+            arrays['delay_data'] = asarray(C.delayvec)
+        elif structure == 'sparse':
+            arrays['delay_data'] = C.delayvec.alldata
+        else:
+            arrays['delay_data'] = _matrix_arrays(C.delayvec, 'delay_')[1]['delay_data']
+    else:
+        header['delay'] = C.delay * float(C.source.clock.dt)
+    write_array_file(filename, MAGIC, header, arrays)
+
+
+def write_array_file(filename, magic, header, arrays):
+    '''
+    Writes the magic string ``magic``, the dictionary ``header`` and the
+    arrays in the dictionary ``arrays`` to the file ``filename``. The layout
+    of the arrays is added to the header (key ``arrays``).
+    '''
+    # layout of the arrays, offsets are relative to the start of the data
+    layout = {}
+    offset = 0
+    names = sorted(arrays.keys())
+    for name in names:
+        arrays[name] = ascontiguousarray(arrays[name])
+        layout[name] = (arrays[name].dtype.str, arrays[name].shape, offset)
+        offset = _aligned(offset + arrays[name].nbytes)
+    header['arrays'] = layout
+    header = repr(header)
+    start = _aligned(len(magic) + 8 + len(header))
+    f = open(filename, 'wb')
+    try:
+        f.write(magic)
+        f.write(numpy.array([len(header)], dtype='<u8').tostring())
+        f.write(header)
+        for name in names:
+            f.seek(start + layout[name][2])
+            f.write(arrays[name].tostring())
+        f.truncate(start + offset)
+    finally:
+        f.close()
+
+
+def read_array_file(filename, magic, version, mmap_mode='r'):
+    '''
+    Reads a file written by :func:`write_array_file`, checking the magic
+    string ``magic`` and that the file version is not newer than
+    ``version``. Returns the header and a dictionary of arrays, which are
+    memory mapped with mode ``mmap_mode`` (or loaded in memory if it is
+    ``None``).
+    '''
+    f = open(filename, 'rb')
+    try:
+        if f.read(len(magic)) != magic:
+            raise IOError('File ' + str(filename) + ' is not a ' + magic + ' file')
+        n = int(numpy.fromstring(f.read(8), dtype='<u8')[0])
+        header = literal_eval(f.read(n))
+    finally:
+        f.close()
+    if header['version'] > version:
+        raise IOError('File ' + str(filename) + ' was saved with a newer version of Brian')
+    start = _aligned(len(magic) + 8 + n)
+    arrays = {}
+    for name, (dtype, shape, offset) in header['arrays'].iteritems():
+        if mmap_mode is None or numpy.prod(shape) == 0:
+            f = open(filename, 'rb')
+            try:
+                f.seek(start + offset)
+                arrays[name] = numpy.fromfile(f, dtype=dtype,
+                                              count=int(numpy.prod(shape))).reshape(shape)
+            finally:
+                f.close()
+        else:
+            arrays[name] = numpy.memmap(filename, dtype=dtype, mode=mmap_mode,
+                                        offset=start + offset, shape=shape)
+    return header, arrays
+
+
+def load_connection(filename, source, target, mmap_mode='r'):
+    '''
+    Loads a connection saved with :func:`save_connection` (or
+    :meth:`Connection.save`) between the groups ``source`` and ``target``.
+
+    By default the arrays are memory mapped read-only (``mmap_mode='r'``), so
+    that many processes loading the same file share the same memory. This is
+    fine for propagating spikes, but the weights cannot be modified (e.g. with
+    STDP); use ``mmap_mode='c'`` (copy-on-write) or ``mmap_mode=None`` (load
+    in memory) in that case. Dynamic matrices are always loaded in memory.
+    '''
+    header, arrays = read_array_file(filename, MAGIC, VERSION, mmap_mode=mmap_mode)
+    N, M = header['shape']
+    if len(source) != N or len(target) != M:
+        raise ValueError('Source and target groups should have sizes ' + str((N, M)))
+    structure = header['structure']
+    kwds = {'state': header['state'], 'modulation': header['modulation'],
+            'structure': structure}
+    if header['class'] == 'DelayConnection':
+        C = DelayConnection(source, target, max_delay=header['max_delay'] * second, **kwds)
+    else:
+        C = Connection(source, target, delay=header['delay'] * second, **kwds)
+
+    def matrix(data):
+        if structure == 'dense':
+            return DenseConnectionMatrix(data)
+        rowind = arrays['W_rowind']
+        allj = arrays['W_allj']
+        if structure == 'dynamic':
+            return DynamicConnectionMatrix(sparse.csr_matrix((array(data), array(allj),
+                                                              array(rowind)),
+                                                             shape=(N, M)))
+        if header['column_access']:
+            return make_sparse_connection_matrix_from_csr((N, M), data, rowind, allj,
+                                column_access=True,
+                                colind=arrays['W_colind'],
+                                colalli=arrays['W_colalli'],
+                                allcoldataindices=arrays['W_allcoldataindices'])
+        return make_sparse_connection_matrix_from_csr((N, M), data, rowind, allj,
+                                                      column_access=False)
+
+    C.W = matrix(arrays['W_data'])
+    if isinstance(C, DelayConnection):
+        C.delayvec = matrix(arrays['delay_data'])
+    C.iscompressed = True
+    return C
@@ -9,8 +9,17 @@ __all__ = [
          'DenseConnectionMatrix',
          'DynamicConnectionMatrix',
          'set_connection_from_sparse',
+         'make_sparse_connection_matrix_from_csr',
          ]
 
+# Parameters for the automatic selection of the dense propagation strategy
+# (see DenseConnectionMatrix.propagation_strategy)
+dense_propagation_strategies = ['auto', 'rows', 'gather', 'indicator']
+DENSE_BLAS_MIN_SPIKES = 4 # below this number of spikes, loop over rows
+DENSE_BLAS_MIN_SPIKES_ACCEL = 32 # same, with the compiled row loop
+DENSE_INDICATOR_FRACTION = 0.25 # above this fraction of spiking rows, use the indicator vector
+DENSE_GATHER_MAX_ELEMENTS = 2**22 # maximum size of the gathered rows (number of values)
+
 class ConnectionMatrix(object):
     '''
     Base class for connection matrix objects
@@ -34,6 +43,8 @@ class ConnectionMatrix(object):
     ``insert(i,j,x)``, ``remove(i,j)``
         For sparse connection matrices which support it, insert a new
         entry or remove an existing one.
+    ``insert_many(i,j,x)``, ``remove_many(i,j)``
+        Same with arrays of indices, for structural plasticity.
     ``getnnz()``
         Return the number of nonzero entries.
     ``todense()``
@@ -148,18 +159,90 @@ class DenseConnectionMatrix(ConnectionMatrix, numpy.ndarray):
     This matrix implements a dense connection matrix. It is just
     a numpy array. The ``get_row`` and ``get_col`` methods return
     :class:`DenseConnectionVector`` objects.
+
+    The ``propagation`` keyword selects how :class:`Connection` propagates
+    spikes through the matrix:
+
+    ``'rows'``
+        Each spiking row is added to the target one by one.
+    ``'gather'``
+        The spiking rows are gathered and summed with a single BLAS
+        ``gemv`` call (weighted by the modulation variable if any).
+    ``'indicator'``
+        The spikes are written into an indicator vector (containing the
+        modulation values if any) which is multiplied with the whole
+        matrix with a single BLAS ``gemv`` call. No copy of the rows is
+        made, this is best when a large fraction of the source neurons
+        spike.
+    ``'auto'``
+        The default, selects one of the strategies above at each
+        timestep depending on the number of spikes and the shape of the
+        matrix, see :meth:`propagation_strategy`.
     '''
     def __new__(subtype, data, **kwds):
+        kwds = dict(kwds.iteritems())
+        kwds.pop('propagation', None)
         if 'copy' not in kwds:
-            kwds = dict(kwds.iteritems())
             kwds['copy'] = False
         return numpy.array(data, **kwds).view(subtype)
 
-    def __init__(self, val, **kwds):
+    def __init__(self, val, propagation='auto', **kwds):
+        if propagation not in dense_propagation_strategies:
+            raise ValueError('Unknown propagation strategy ' + str(propagation))
+        self.propagation = propagation
         # precompute rows and cols for fast returns by get_rows etc.
         self.rows = [DenseConnectionVector(numpy.ndarray.__getitem__(self, i)) for i in xrange(val.shape[0])]
         self.cols = [DenseConnectionVector(numpy.ndarray.__getitem__(self, (slice(None), i))) for i in xrange(val.shape[1])]
 
+    def propagation_strategy(self, nspikes, useaccel=False):
+        '''
+        Returns the strategy used to propagate ``nspikes`` spikes, one of
+        ``'rows'``, ``'gather'`` or ``'indicator'``.
+
+        Unless a strategy was fixed with the ``propagation`` keyword, the
+        per-row loop is used for a few spikes (more of them if ``useaccel``
+        is ``True`` as the compiled loop has no Python overhead per row).
+        Above that, the spiking rows are gathered and summed with BLAS, and
+        when a large fraction of the rows spike, or when gathering would
+        copy too much memory, the indicator vector product over the whole
+        matrix is used instead.
+        '''
+        propagation = getattr(self, 'propagation', 'auto')
+        if propagation != 'auto':
+            return propagation
+        if useaccel:
+            min_spikes = DENSE_BLAS_MIN_SPIKES_ACCEL
+        else:
+            min_spikes = DENSE_BLAS_MIN_SPIKES
+        if nspikes < min_spikes:
+            return 'rows'
+        nrows, ncols = self.shape
+        if nspikes > DENSE_INDICATOR_FRACTION * nrows or \
+           nspikes * ncols > DENSE_GATHER_MAX_ELEMENTS:
+            return 'indicator'
+        return 'gather'
+
+    def propagate_blas(self, sv, spikes, strategy, sv_pre=None):
+        '''
+        Adds the rows ``spikes`` of the matrix to the array ``sv``, weighted
+        by ``sv_pre[spikes]`` if ``sv_pre`` is given, using the ``'gather'``
+        or ``'indicator'`` strategy (see :meth:`propagation_strategy`).
+        '''
+        W = numpy.asarray(self)
+        if strategy == 'gather':
+            rows = W.take(spikes, axis=0)
+            if sv_pre is None:
+                sv += dot(ones(len(spikes)), rows)
+            else:
+                sv += dot(sv_pre.take(spikes), rows)
+        else:
+            indicator = zeros(self.shape[0])
+            if sv_pre is None:
+                indicator[spikes] = 1.0
+            else:
+                indicator[spikes] = sv_pre.take(spikes)
+            sv += dot(indicator, W)
+
     def get_rows(self, rows):
         return [self.rows[i] for i in rows]
 
@@ -229,14 +312,18 @@ class SparseConnectionMatrix(ConnectionMatrix):
     elements of ``rowj`` are slices of this array so no extra memory is
     used).
     
-    If column access is being used, then in addition to the above there are
-    lists ``coli`` and ``coldataindices``. For column ``j``, the array
-    ``coli[j]`` gives the row indices for the data values in column ``j``,
-    while ``coldataindices[j]`` gives the indices in the array ``alldata``
-    for the values in column ``j``. Column access therefore involves a
-    copy operation rather than a slice operation. Column access increases
-    the memory requirements to 20 bytes per entry (4 extra bytes for the
-    row indices and 4 extra bytes for the data indices).
+    If column access is being used, then in addition to the above there is
+    a permutation index in CSC order: the array ``allcoldataindices`` gives
+    the indices in ``alldata`` of the elements sorted by column, and
+    ``colalli`` their row indices. The elements of column ``j`` are at the
+    positions ``colind[j]:colind[j+1]`` of these two arrays. Column access
+    therefore involves a gather (``get_col``) or scatter (``set_col``)
+    operation on ``alldata`` rather than a slice operation, and several
+    columns can be accessed at once with ``get_cols_dataindices``. Column
+    access increases the memory requirements to 20 bytes per entry (4 extra
+    bytes for the row indices and 4 extra bytes for the data indices). The
+    lists ``coli`` and ``coldataindices`` of the arrays for each column are
+    only built on demand.
     
     TODO: update size numbers when use_minimal_indices=True for different
     architectures.
@@ -266,9 +353,6 @@ class SparseConnectionMatrix(ConnectionMatrix):
                              dtype=self.synapse_index_dtype)
         rowdata = []
         rowj = []
-        if column_access:
-            coli = []
-            coldataindices = []
         i = 0 # i points to the current index in the alldata array as we go through row by row
         for c in xrange(val.shape[0]):
             # extra the row values and column indices of row c of the initialising matrix
@@ -331,12 +415,6 @@ class SparseConnectionMatrix(ConnectionMatrix):
                              compiler=self._cpp_compiler,
                              extra_compile_args=self._extra_compile_args,
                              )
-                # now store the blocks of allcoldataindices in coldataindices and update coli too
-                for i in xrange(len(colind) - 1):
-                    D = allcoldataindices[colind[i]:colind[i + 1]]
-                    I = colalli[colind[i]:colind[i + 1]]
-                    coldataindices.append(D)
-                    coli.append(I)
             else:
                 # now allj[a] will be the columns in order, so that
                 # the first counts[0] elements of allj[a] will be 0,
@@ -363,13 +441,6 @@ class SparseConnectionMatrix(ConnectionMatrix):
                 else:
                     colalli = numpy.zeros(nnz,
                                           dtype=self.neuron_index_dtype)
-                # in this loop, I are the data indices where j==i
-                # and alli[I} are the corresponding i coordinates
-                for i in xrange(len(colind) - 1):
-                    D = a[colind[i]:colind[i + 1]]
-                    I = colalli[colind[i]:colind[i + 1]]
-                    coldataindices.append(D)
-                    coli.append(I)
 
         self.alldata = alldata
         self.rowdata = rowdata
@@ -380,8 +451,6 @@ class SparseConnectionMatrix(ConnectionMatrix):
         self.column_access = column_access
         if column_access:
             self.colalli = colalli
-            self.coli = coli
-            self.coldataindices = coldataindices
             self.allcoldataindices = allcoldataindices
             self.colind = colind
         self.rows = [SparseConnectionVector(self.shape[1], self.rowj[i], self.rowdata[i]) for i in xrange(self.shape[0])]
@@ -407,18 +476,65 @@ class SparseConnectionMatrix(ConnectionMatrix):
     def get_rows(self, rows):
         return [self.rows[i] for i in rows]
 
+    def _get_coli(self):
+        return [self.colalli[self.colind[j]:self.colind[j + 1]] for j in xrange(self.shape[1])]
+
+    def _get_coldataindices(self):
+        return [self.allcoldataindices[self.colind[j]:self.colind[j + 1]] for j in xrange(self.shape[1])]
+
+    # These lists are built on demand, use get_col or the arrays directly
+    coli = property(fget=_get_coli)
+    coldataindices = property(fget=_get_coldataindices)
+
     def get_col(self, j):
         if self.column_access:
-            return SparseConnectionVector(self.shape[0], self.coli[j], self.alldata[self.coldataindices[j]])
+            s, e = self.colind[j], self.colind[j + 1]
+            return SparseConnectionVector(self.shape[0], self.colalli[s:e],
+                                          self.alldata.take(self.allcoldataindices[s:e]))
         else:
             raise TypeError('No column access.')
 
     def get_cols(self, cols):
         if self.column_access:
-            return [SparseConnectionVector(self.shape[0], self.coli[j], self.alldata[self.coldataindices[j]]) for j in cols]
+            colind, colalli, allcoldataindices = self.colind, self.colalli, self.allcoldataindices
+            alldata = self.alldata
+            return [SparseConnectionVector(self.shape[0], colalli[colind[j]:colind[j + 1]],
+                                           alldata.take(allcoldataindices[colind[j]:colind[j + 1]])) for j in cols]
         else:
             raise TypeError('No column access.')
 
+    def get_cols_dataindices(self, cols):
+        '''
+        Returns the indices in ``alldata`` of all the elements in the columns
+        ``cols`` (concatenated), with the corresponding row and column
+        indices, so that several columns can be read or modified with a
+        single gather/scatter operation on ``alldata``.
+        '''
+        if not self.column_access:
+            raise TypeError('No column access.')
+        cols = asarray(cols, dtype=int)
+        starts = asarray(self.colind[cols], dtype=int)
+        counts = asarray(self.colind[cols + 1], dtype=int) - starts
+        # positions in the column ordered arrays
+        pos = arange(counts.sum()) - repeat(cumsum(counts) - counts, counts) + repeat(starts, counts)
+        return self.allcoldataindices[pos], self.colalli[pos], repeat(cols, counts)
+
+    def copy_structure(self, alldata=None):
+        '''
+        Returns a :class:`SparseConnectionMatrix` with the same nonzero
+        elements, sharing the index arrays with this one (no extra memory is
+        used for them), and with values ``alldata`` (zero by default).
+        '''
+        if alldata is None:
+            alldata = numpy.zeros(self.nnz, dtype=self.alldata.dtype)
+        y = UnconstructedMatrix()
+        y.__class__ = SparseConnectionMatrix
+        y.__dict__.update(self.__dict__)
+        y.alldata = alldata
+        y.rowdata = [alldata[self.rowind[i]:self.rowind[i + 1]] for i in xrange(self.shape[0])]
+        y.rows = [SparseConnectionVector(y.shape[1], y.rowj[i], y.rowdata[i]) for i in xrange(y.shape[0])]
+        return y
+
     def set_row(self, i, val):
         if isinstance(val, SparseConnectionVector):
             if val.ind is not self.rowj[i]:
@@ -434,17 +550,18 @@ class SparseConnectionMatrix(ConnectionMatrix):
 
     def set_col(self, j, val):
         if self.column_access:
+            s, e = self.colind[j], self.colind[j + 1]
             if isinstance(val, SparseConnectionVector):
-                if val.ind is not self.coli[j]:
-                    if not (val.ind == self.coli[j]).all():
+                if val.ind is not self.colalli[s:e]:
+                    if not (val.ind == self.colalli[s:e]).all():
                         raise ValueError('Sparse col setting must use same indices.')
-                self.alldata[self.coldataindices[j]] = val
+                self.alldata.put(self.allcoldataindices[s:e], val)
             else:
                 if isinstance(val, numpy.ndarray):
                     val = asarray(val)
-                    self.alldata[self.coldataindices[j]] = val[self.coli[j]]
+                    self.alldata.put(self.allcoldataindices[s:e], val.take(self.colalli[s:e]))
                 else:
-                    self.alldata[self.coldataindices[j]] = val
+                    self.alldata[self.allcoldataindices[s:e]] = val
         else:
             raise TypeError('No column access.')
 
@@ -487,7 +604,24 @@ class DynamicConnectionMatrix(ConnectionMatrix):
     Rows and column point in to this data array, and the list ``rowj`` consists
     of an array of column indices for each row, with ``coli`` containing arrays
     of row indices for each column. Similarly, ``rowdataind`` and ``coldataind``
-    consist of arrays of pointers to the indices in the ``alldata`` array. 
+    consist of arrays of pointers to the indices in the ``alldata`` array.
+
+    The arrays ``rowj[i]`` and ``rowdataind[i]`` are views of per-row buffers
+    which can hold more elements than the row currently has (their capacity
+    grows by the factor ``dynamic_array_const`` like ``alldata``), so that
+    inserting elements in a row does not reallocate it each time. The
+    methods ``insert`` and ``remove`` shift the elements of the row in place,
+    and update the column structures if they are valid.
+
+    **Structural plasticity**
+
+    Many synapses can be created or removed at once with the methods
+    ``insert_many(i, j, x)`` and ``remove_many(i, j)``, where ``i`` and ``j``
+    are arrays of row and column indices. These methods only rebuild the
+    rows that are modified, and the column structures ``coli`` and
+    ``coldataind`` are only rebuilt (all at once) the next time they are
+    used. When many elements have been removed, the ``alldata`` array is
+    compacted automatically (see :meth:`compact`).
     '''
     def __init__(self, val, nnzmax=None, dynamic_array_const=2, **kwds):
         self.shape = val.shape
@@ -501,8 +635,8 @@ class DynamicConnectionMatrix(ConnectionMatrix):
         i = 0
         self.rowj = []
         self.rowdataind = []
-        alli = zeros(self.nnz, dtype=int)
-        allj = zeros(self.nnz, dtype=int)
+        self._rowjbuf = []
+        self._rowdataindbuf = []
         for c in xrange(val.shape[0]):
             # extra the row values and column indices of row c of the initialising matrix
             # this works for any of the scipy sparse matrix formats
@@ -515,31 +649,97 @@ class DynamicConnectionMatrix(ConnectionMatrix):
                 r = sr.rows[0]
                 d = sr.data[0]
             self.alldata[i:i + len(d)] = d
-            self.rowj.append(array(r, dtype=int))
-            self.rowdataind.append(arange(i, i + len(d)))
-            allj[i:i + len(d)] = r
-            alli[i:i + len(d)] = c
+            self._rowjbuf.append(array(r, dtype=int))
+            self._rowdataindbuf.append(arange(i, i + len(d)))
+            self.rowj.append(self._rowjbuf[c][:])
+            self.rowdataind.append(self._rowdataindbuf[c][:])
             i += len(d)
-        # now update the coli and coldataind variables
-        self.coli = []
-        self.coldataind = []
-        # counts the number of nonzero elements in each column
-        if numpy.__version__ >= '1.3.0':
-            counts = numpy.histogram(allj, numpy.arange(val.shape[1] + 1, dtype=int))[0]
+        # now build the coli and coldataind variables
+        self._rebuild_cols()
+
+    def _get_coli(self):
+        if not self._cols_valid:
+            self._rebuild_cols()
+        return self._coli
+
+    def _get_coldataind(self):
+        if not self._cols_valid:
+            self._rebuild_cols()
+        return self._coldataind
+
+    coli = property(fget=_get_coli)
+    coldataind = property(fget=_get_coldataind)
+
+    def _rebuild_cols(self):
+        '''
+        Rebuilds the column structures from the rows (vectorised).
+        '''
+        N, M = self.shape
+        rowlengths = array([len(r) for r in self.rowj], dtype=int)
+        if self.nnz:
+            allj = hstack(self.rowj)
+            alldataind = hstack(self.rowdataind)
         else:
-            counts = numpy.histogram(allj, numpy.arange(val.shape[1] + 1, dtype=int), new=True)[0]
-        # now we have to go through one by one unfortunately, and so we keep curcdi, the
-        # current column data index for each column
-        curcdi = numpy.zeros(val.shape[1], dtype=int)
-        # initialise the memory for the column data indices
-        for j in xrange(val.shape[1]):
-            self.coldataind.append(numpy.zeros(counts[j], dtype=int))
-        # one by one for every element, update the dataindices and curcdi data pointers
-        for i, j in enumerate(allj):
-            self.coldataind[j][curcdi[j]] = i
-            curcdi[j] += 1
-        for j in xrange(val.shape[1]):
-            self.coli.append(alli[self.coldataind[j]])
+            allj = zeros(0, dtype=int)
+            alldataind = zeros(0, dtype=int)
+        alli = repeat(arange(N), rowlengths)
+        # stable sort so that row indices are sorted within each column
+        order = argsort(allj, kind='mergesort')
+        alli = alli[order]
+        alldataind = alldataind[order]
+        counts = zeros(M, dtype=int)
+        if len(allj):
+            bincounts = numpy.bincount(allj)
+            counts[:len(bincounts)] = bincounts
+        colind = hstack(([0], cumsum(counts)))
+        self._coli = [alli[colind[j]:colind[j + 1]] for j in xrange(M)]
+        self._coldataind = [alldataind[colind[j]:colind[j + 1]] for j in xrange(M)]
+        self._cols_valid = True
+
+    def _set_row_structure(self, i, rowj, rowdataind):
+        '''
+        Copies the (sorted) column indices and data indices of row ``i`` into
+        the row buffers, growing them if necessary.
+        '''
+        n = len(rowj)
+        if len(self._rowjbuf[i]) < n:
+            newsize = max(n, int(len(self._rowjbuf[i]) * self.dynamic_array_const))
+            self._rowjbuf[i] = numpy.zeros(newsize, dtype=int)
+            self._rowdataindbuf[i] = numpy.zeros(newsize, dtype=int)
+        self._rowjbuf[i][:n] = rowj
+        self._rowdataindbuf[i][:n] = rowdataind
+        self.rowj[i] = self._rowjbuf[i][:n]
+        self.rowdataind[i] = self._rowdataindbuf[i][:n]
+
+    def _grow_row(self, i, n):
+        '''
+        Reallocates the buffers of row ``i`` so that they can hold ``n``
+        elements, keeping the current elements.
+        '''
+        k = len(self.rowj[i])
+        newsize = max(n, int(len(self._rowjbuf[i]) * self.dynamic_array_const))
+        rowjbuf = numpy.zeros(newsize, dtype=int)
+        rowdataindbuf = numpy.zeros(newsize, dtype=int)
+        rowjbuf[:k] = self.rowj[i]
+        rowdataindbuf[:k] = self.rowdataind[i]
+        self._rowjbuf[i] = rowjbuf
+        self._rowdataindbuf[i] = rowdataindbuf
+
+    def _reserve(self, nnz):
+        '''
+        Makes sure that ``alldata`` can hold ``nnz`` elements.
+        '''
+        if nnz <= self.nnzmax:
+            return
+        # reallocate memory using a dynamic array structure (amortized O(1) cost for append)
+        newnnzmax = max(nnz, int(self.nnzmax * self.dynamic_array_const))
+        if newnnzmax <= self.nnzmax:
+            newnnzmax += 1
+        if newnnzmax > self.shape[0] * self.shape[1]:
+            newnnzmax = self.shape[0] * self.shape[1]
+        self.alldata = hstack((self.alldata, numpy.zeros(newnnzmax - self.nnzmax, dtype=self.alldata.dtype)))
+        self.unusedinds.extend(range(self.nnzmax, newnnzmax))
+        self.nnzmax = newnnzmax
 
     def getnnz(self):
         return self.nnz
@@ -549,42 +749,35 @@ class DynamicConnectionMatrix(ConnectionMatrix):
         if n < len(self.rowj[i]) and self.rowj[i][n] == j:
             self.alldata[self.rowdataind[i][n]] = x
             return
-        m = searchsorted(self.coli[j], i)
-        if self.nnz == self.nnzmax:
-            # reallocate memory using a dynamic array structure (amortized O(1) cost for append)
-            newnnzmax = int(self.nnzmax * self.dynamic_array_const)
-            if newnnzmax <= self.nnzmax:
-                newnnzmax += 1
-            if newnnzmax > self.shape[0] * self.shape[1]:
-                newnnzmax = self.shape[0] * self.shape[1]
-            self.alldata = hstack((self.alldata, numpy.zeros(newnnzmax - self.nnzmax, dtype=self.alldata.dtype)))
-            self.unusedinds.extend(range(self.nnz, newnnzmax))
-            self.nnzmax = newnnzmax
+        self._reserve(self.nnz + 1)
         newind = self.unusedinds.pop(-1)
         self.alldata[newind] = x
         self.nnz += 1
-        # update row
-        newrowj = numpy.zeros(len(self.rowj[i]) + 1, dtype=int)
-        newrowj[:n] = self.rowj[i][:n]
-        newrowj[n] = j
-        newrowj[n + 1:] = self.rowj[i][n:]
-        self.rowj[i] = newrowj
-        newrowdataind = numpy.zeros(len(self.rowdataind[i]) + 1, dtype=int)
-        newrowdataind[:n] = self.rowdataind[i][:n]
-        newrowdataind[n] = newind
-        newrowdataind[n + 1:] = self.rowdataind[i][n:]
-        self.rowdataind[i] = newrowdataind
+        # update row (in place, the buffer only grows when it is full)
+        k = len(self.rowj[i])
+        if k == len(self._rowjbuf[i]):
+            self._grow_row(i, k + 1)
+        rowjbuf = self._rowjbuf[i]
+        rowdataindbuf = self._rowdataindbuf[i]
+        rowjbuf[n + 1:k + 1] = rowjbuf[n:k].copy()
+        rowdataindbuf[n + 1:k + 1] = rowdataindbuf[n:k].copy()
+        rowjbuf[n] = j
+        rowdataindbuf[n] = newind
+        self.rowj[i] = rowjbuf[:k + 1]
+        self.rowdataind[i] = rowdataindbuf[:k + 1]
         # update col
-        newcoli = numpy.zeros(len(self.coli[j]) + 1, dtype=int)
-        newcoli[:m] = self.coli[j][:m]
-        newcoli[m] = i
-        newcoli[m + 1:] = self.coli[j][m:]
-        self.coli[j] = newcoli
-        newcoldataind = numpy.zeros(len(self.coldataind[j]) + 1, dtype=int)
-        newcoldataind[:m] = self.coldataind[j][:m]
-        newcoldataind[m] = newind
-        newcoldataind[m + 1:] = self.coldataind[j][m:]
-        self.coldataind[j] = newcoldataind
+        if self._cols_valid:
+            m = searchsorted(self._coli[j], i)
+            newcoli = numpy.zeros(len(self._coli[j]) + 1, dtype=int)
+            newcoli[:m] = self._coli[j][:m]
+            newcoli[m] = i
+            newcoli[m + 1:] = self._coli[j][m:]
+            self._coli[j] = newcoli
+            newcoldataind = numpy.zeros(len(self._coldataind[j]) + 1, dtype=int)
+            newcoldataind[:m] = self._coldataind[j][:m]
+            newcoldataind[m] = newind
+            newcoldataind[m + 1:] = self._coldataind[j][m:]
+            self._coldataind[j] = newcoldataind
 
     def remove(self, i, j):
         n = searchsorted(self.rowj[i], j)
@@ -593,25 +786,163 @@ class DynamicConnectionMatrix(ConnectionMatrix):
         oldind = self.rowdataind[i][n]
         self.unusedinds.append(oldind)
         self.nnz -= 1
-        m = searchsorted(self.coli[j], i)
-        # update row
-        newrowj = numpy.zeros(len(self.rowj[i]) - 1, dtype=int)
-        newrowj[:n] = self.rowj[i][:n]
-        newrowj[n:] = self.rowj[i][n + 1:]
-        self.rowj[i] = newrowj
-        newrowdataind = numpy.zeros(len(self.rowdataind[i]) - 1, dtype=int)
-        newrowdataind[:n] = self.rowdataind[i][:n]
-        newrowdataind[n:] = self.rowdataind[i][n + 1:]
-        self.rowdataind[i] = newrowdataind
+        # update row (in place, the buffer keeps its capacity)
+        k = len(self.rowj[i])
+        self._rowjbuf[i][n:k - 1] = self._rowjbuf[i][n + 1:k].copy()
+        self._rowdataindbuf[i][n:k - 1] = self._rowdataindbuf[i][n + 1:k].copy()
+        self.rowj[i] = self._rowjbuf[i][:k - 1]
+        self.rowdataind[i] = self._rowdataindbuf[i][:k - 1]
         # update col
-        newcoli = numpy.zeros(len(self.coli[j]) - 1, dtype=int)
-        newcoli[:m] = self.coli[j][:m]
-        newcoli[m:] = self.coli[j][m + 1:]
-        self.coli[j] = newcoli
-        newcoldataind = numpy.zeros(len(self.coldataind[j]) - 1, dtype=int)
-        newcoldataind[:m] = self.coldataind[j][:m]
-        newcoldataind[m:] = self.coldataind[j][m + 1:]
-        self.coldataind[j] = newcoldataind
+        if self._cols_valid:
+            m = searchsorted(self._coli[j], i)
+            newcoli = numpy.zeros(len(self._coli[j]) - 1, dtype=int)
+            newcoli[:m] = self._coli[j][:m]
+            newcoli[m:] = self._coli[j][m + 1:]
+            self._coli[j] = newcoli
+            newcoldataind = numpy.zeros(len(self._coldataind[j]) - 1, dtype=int)
+            newcoldataind[:m] = self._coldataind[j][:m]
+            newcoldataind[m:] = self._coldataind[j][m + 1:]
+            self._coldataind[j] = newcoldataind
+
+    def _sorted_elements(self, i, j):
+        '''
+        Returns the arrays ``i``, ``j`` sorted by row then column, the
+        permutation used and the row boundaries ``(rows, starts, ends)``.
+        '''
+        i = numpy.array(i, dtype=int).flatten()
+        j = numpy.array(j, dtype=int).flatten()
+        if len(i) != len(j):
+            raise ValueError('Row and column indices should have the same length')
+        if len(i) == 0:
+            empty = zeros(0, dtype=int)
+            return i, j, empty, empty, empty, empty
+        if i.min() < 0 or i.max() >= self.shape[0] or \
+           j.min() < 0 or j.max() >= self.shape[1]:
+            raise IndexError('Indices out of range')
+        order = numpy.lexsort((j, i))
+        i = i[order]
+        j = j[order]
+        boundaries = hstack(([0], (i[1:] != i[:-1]).nonzero()[0] + 1, [len(i)]))
+        starts = boundaries[:-1]
+        ends = boundaries[1:]
+        return i, j, order, i[starts], starts, ends
+
+    def insert_many(self, i, j, x):
+        '''
+        Inserts the elements ``(i[k], j[k])`` with values ``x[k]`` (or ``x``
+        if it is a scalar). Existing elements are set to the new value, and
+        if an element is given several times the last value is used.
+
+        Each modified row is rebuilt only once, and the column structures are
+        rebuilt the next time they are used.
+        '''
+        x = numpy.asarray(x)
+        i, j, order, rows, starts, ends = self._sorted_elements(i, j)
+        if x.ndim:
+            x = x.flatten()[order]
+        else:
+            x = numpy.repeat(x, len(i))
+        # remove duplicates, keeping the last occurrence (lexsort is stable)
+        if len(i):
+            last = hstack(((i[1:] != i[:-1]) | (j[1:] != j[:-1]), [True]))
+            if not last.all():
+                self._insert_sorted(i[last], j[last], x[last])
+                return
+        self._insert_sorted(i, j, x, rows, starts, ends)
+
+    def _insert_sorted(self, i, j, x, rows=None, starts=None, ends=None):
+        if rows is None:
+            _, _, _, rows, starts, ends = self._sorted_elements(i, j)
+        # first pass: find which elements are new
+        isnew = numpy.ones(len(i), dtype=bool)
+        positions = numpy.zeros(len(i), dtype=int)
+        for r, s, e in izip(rows, starts, ends):
+            rowj = self.rowj[r]
+            n = searchsorted(rowj, j[s:e])
+            positions[s:e] = n
+            found = n < len(rowj)
+            found[found] = rowj[n[found]] == j[s:e][found]
+            if found.any():
+                self.alldata[self.rowdataind[r][n[found]]] = x[s:e][found]
+                isnew[s:e][found] = False
+        nnew = int(isnew.sum())
+        if nnew == 0:
+            return
+        # allocate data indices for the new elements
+        self._reserve(self.nnz + nnew)
+        newinds = numpy.zeros(len(i), dtype=int)
+        newinds[isnew] = self.unusedinds[-nnew:]
+        del self.unusedinds[-nnew:]
+        self.alldata[newinds[isnew]] = x[isnew]
+        self.nnz += nnew
+        # second pass: merge the new elements into the rows
+        for r, s, e in izip(rows, starts, ends):
+            new = isnew[s:e]
+            if not new.any():
+                continue
+            n = positions[s:e][new]
+            self._set_row_structure(r, numpy.insert(self.rowj[r], n, j[s:e][new]),
+                                       numpy.insert(self.rowdataind[r], n, newinds[s:e][new]))
+        self._cols_valid = False
+
+    def remove_many(self, i, j):
+        '''
+        Removes the elements ``(i[k], j[k])``, raising a ``ValueError``
+        (without modifying the matrix) if one of them does not exist.
+
+        Each modified row is rebuilt only once, and the column structures are
+        rebuilt the next time they are used. If the matrix becomes much
+        smaller than the allocated memory, it is compacted.
+        '''
+        i, j, order, rows, starts, ends = self._sorted_elements(i, j)
+        if len(i) > 1:
+            unique = hstack(([True], (i[1:] != i[:-1]) | (j[1:] != j[:-1])))
+            if not unique.all():
+                return self.remove_many(i[unique], j[unique])
+        keeps = []
+        for r, s, e in izip(rows, starts, ends):
+            rowj = self.rowj[r]
+            n = searchsorted(rowj, j[s:e])
+            found = n < len(rowj)
+            found[found] = rowj[n[found]] == j[s:e][found]
+            if not found.all():
+                k = (~found).nonzero()[0][0]
+                raise ValueError('No element to remove at position ' + str((r, j[s + k])))
+            keep = numpy.ones(len(rowj), dtype=bool)
+            keep[n] = False
+            keeps.append(keep)
+        for r, keep in izip(rows, keeps):
+            self.unusedinds.extend(self.rowdataind[r][~keep])
+            self._set_row_structure(r, self.rowj[r][keep], self.rowdataind[r][keep])
+        self.nnz -= len(i)
+        self._cols_valid = False
+        if self.nnzmax > 2 * self.dynamic_array_const * max(self.nnz, 1):
+            self.compact()
+
+    def compact(self):
+        '''
+        Compacts the ``alldata`` array: the values are stored contiguously in
+        row order in the first ``nnz`` elements, and the allocated memory is
+        reduced to ``dynamic_array_const*nnz``.
+        '''
+        if self.nnz:
+            oldinds = hstack(self.rowdataind)
+        else:
+            oldinds = zeros(0, dtype=int)
+        newinds = zeros(self.nnzmax, dtype=int)
+        newinds[oldinds] = arange(self.nnz)
+        newnnzmax = min(max(int(self.nnz * self.dynamic_array_const), 1),
+                        self.shape[0] * self.shape[1])
+        newnnzmax = max(newnnzmax, self.nnz)
+        alldata = numpy.zeros(newnnzmax, dtype=self.alldata.dtype)
+        alldata[:self.nnz] = self.alldata[oldinds]
+        self.alldata = alldata
+        for r in xrange(self.shape[0]):
+            self.rowdataind[r][:] = newinds[self.rowdataind[r]]
+        if self._cols_valid:
+            self._coldataind = [newinds[c] for c in self._coldataind]
+        self.nnzmax = newnnzmax
+        self.unusedinds = range(self.nnz, self.nnzmax)
 
     def get_element(self, i, j):
         n = searchsorted(self.rowj[i], j)
@@ -674,6 +1005,23 @@ def make_sparse_connection_matrix(x, column_access=True):
     x = x.tocsr()
     if not x.has_sorted_indices:
         x.sort_indices()
+    return make_sparse_connection_matrix_from_csr(x.shape, x.data, x.indptr,
+                                                  x.indices,
+                                                  column_access=column_access)
+
+def make_sparse_connection_matrix_from_csr(shape, alldata, rowind, allj,
+                                           column_access=True, colind=None,
+                                           colalli=None, allcoldataindices=None):
+    '''
+    Builds a :class:`SparseConnectionMatrix` directly from the arrays of a
+    CSR matrix with sorted indices (``alldata``, ``rowind`` and ``allj`` are
+    the ``data``, ``indptr`` and ``indices`` arrays), without copying them if
+    they have the right types (in particular they can be memory mapped).
+    
+    With ``column_access``, the arrays ``colind``, ``colalli`` and
+    ``allcoldataindices`` of a previously built matrix can be given, otherwise
+    they are computed.
+    '''
     y = UnconstructedMatrix()
     y.__class__ = SparseConnectionMatrix
     y._useaccel = get_global_preference('useweave')
@@ -681,25 +1029,22 @@ def make_sparse_connection_matrix(x, column_access=True):
     y._extra_compile_args = ['-O3']
     if y._cpp_compiler == 'gcc':
         y._extra_compile_args += get_global_preference('gcc_options') # ['-march=native', '-ffast-math']
-    y.nnz = nnz = int(x.getnnz())# nnz stands for number of nonzero entries
-    y.alldata = alldata = x.data
-    y.rowind = rowind = array(x.indptr, dtype=int, copy=False)
-    y.allj = allj = array(x.indices, dtype=int, copy=False)
-    if column_access:
-        colind = numpy.zeros(x.shape[1]+1, dtype=int)
-        coli = []
-        coldataindices = []
+    y.nnz = nnz = len(alldata)# nnz stands for number of nonzero entries
+    y.alldata = alldata
+    y.rowind = rowind = array(rowind, dtype=int, copy=False)
+    y.allj = allj = array(allj, dtype=int, copy=False)
     rowdata = []
     rowj = []
     i = 0 # i points to the current index in the alldata array as we go through row by row
-    for c in xrange(x.shape[0]):
+    for c in xrange(shape[0]):
         k = y.rowind[c+1]-y.rowind[c]
         rowdata.append(y.alldata[i:i+k])
         rowj.append(y.allj[i:i+k])
         i += k
-    if column_access:
+    if column_access and colind is None:
+        colind = numpy.zeros(shape[1]+1, dtype=int)
         # counts the number of nonzero elements in each column
-        counts = zeros(x.shape[1], dtype=int)
+        counts = zeros(shape[1], dtype=int)
         if len(allj):
             bincounts = numpy.bincount(allj)
         else:
@@ -713,11 +1058,11 @@ def make_sparse_connection_matrix(x, column_access=True):
             # in blocks alldi[s[i]:s[i+1]] of length counts[i], and
             # curcdi[i] is the current offset into each block. s is
             # therefore just the cumulative sum of counts.
-            curcdi = numpy.zeros(x.shape[1], dtype=int)
+            curcdi = numpy.zeros(shape[1], dtype=int)
             allcoldataindices = numpy.zeros(nnz, dtype=int)
             colind[:] = numpy.hstack(([0], cumsum(counts)))
             colalli = numpy.zeros(nnz, dtype=int)
-            numrows = x.shape[0]
+            numrows = shape[0]
             code = '''
             int i = 0;
             for(int k=0;k<nnz;k++)
@@ -735,12 +1080,6 @@ def make_sparse_connection_matrix(x, column_access=True):
                          compiler=y._cpp_compiler,
                          extra_compile_args=y._extra_compile_args,
                          )
-            # now store the blocks of allcoldataindices in coldataindices and update coli too
-            for i in xrange(len(colind) - 1):
-                D = allcoldataindices[colind[i]:colind[i + 1]]
-                I = colalli[colind[i]:colind[i + 1]]
-                coldataindices.append(D)
-                coli.append(I)
         else:
             # now allj[a] will be the columns in order, so that
             # the first counts[0] elements of allj[a] will be 0,
@@ -765,22 +1104,13 @@ def make_sparse_connection_matrix(x, column_access=True):
                 colalli = expanded_row_indices[a]
             else:
                 colalli = numpy.zeros(nnz, dtype=int)
-            # in this loop, I are the data indices where j==i
-            # and alli[I} are the corresponding i coordinates
-            for i in xrange(len(colind) - 1):
-                D = a[colind[i]:colind[i + 1]]
-                I = colalli[colind[i]:colind[i + 1]]
-                coldataindices.append(D)
-                coli.append(I)
 
     y.rowdata = rowdata
     y.rowj = rowj
-    y.shape = x.shape
+    y.shape = tuple(shape)
     y.column_access = column_access
     if column_access:
         y.colalli = colalli
-        y.coli = coli
-        y.coldataindices = coldataindices
         y.allcoldataindices = allcoldataindices
         y.colind = colind
     y.rows = [SparseConnectionVector(y.shape[1], y.rowj[i], y.rowdata[i]) for i in xrange(y.shape[0])]
@@ -1,5 +1,6 @@
 from base import *
 from sparsematrix import *
+from ..randomstreams import RandomStream, skip_ahead_indices
 
 __all__ = ['random_row_func', 'random_matrix',
            'random_matrix_fixed_column', 'eye_lil_matrix',
@@ -20,35 +21,39 @@ def random_row_func(N, p, weight=1., initseed=None):
     ``weight``
         The connection weight (must be a single value).
     ``initseed``
-        The initial seed value (for reproducible results).
+        The seed of the :class:`~brian.randomstreams.RandomStream` (for
+        reproducible results). Row ``i`` is drawn from its substream ``i``,
+        without changing the global state of ``numpy.random``.
     '''
-    if initseed is None:
-        initseed = pyrandom.randint(100000, 1000000) # replace this
+    rng = RandomStream(initseed)
     cur_row = numpy.zeros(N)
-    myrange = numpy.arange(N, dtype=int)
 
     def row_func(i):
-        pyrandom.seed(initseed + int(i))
-        scirandom.seed(initseed + int(i))
-        k = scirandom.binomial(N, p, 1)[0]
+        row_rng = rng.substream(int(i))
+        k = row_rng.binomial(N, p)
         cur_row[:] = 0.0
-        cur_row[pyrandom.sample(myrange, k)] = weight
+        cur_row[row_rng.sample(N, k)] = weight
         return cur_row
 
     return row_func
 
 
 # Generation of matrices
-def random_matrix(n, m, p, value=1.):
+def random_matrix(n, m, p, value=1., rng=None):
     '''
     Generates a sparse random matrix with size (n,m).
     Entries are 1 (or optionnally value) with probability p.
     If value is a function, then that function is called for each
     non zero element as value() or value(i,j).
+    The random numbers for row i are drawn from rng.substream(i), where rng is
+    a :class:`~brian.randomstreams.RandomStream` (a new one by default), so
+    that the rows do not depend on the order in which they are built.
     '''
     # TODO:
     # Simplify (by using valuef)
     W = sparse.lil_matrix((n, m))
+    if rng is None:
+        rng = RandomStream()
     if callable(value) and callable(p):
         if value.func_code.co_argcount == 0:
             valuef = lambda i, j:[value() for _ in j] # value function
@@ -74,25 +79,25 @@ def random_matrix(n, m, p, value=1.):
             if failed: # vector-based not possible
                 log_debug('connections', 'Cannot build the connection matrix by rows')
                 for i in xrange(n):
-                    W.rows[i] = [j for j in range(m) if rand() < p(i, j)]
+                    r = rng.substream(i).rand(m)
+                    W.rows[i] = [j for j in range(m) if r[j] < p(i, j)]
                     W.data[i] = list(valuef(i, array(W.rows[i])))
             else: # vector-based possible
                 for i in xrange(n):
-                    W.rows[i] = list((rand(m) < p(i, arange(m))).nonzero()[0])
+                    W.rows[i] = list((rng.substream(i).rand(m) < p(i, arange(m))).nonzero()[0])
                     W.data[i] = list(valuef(i, array(W.rows[i])))
         elif p.func_code.co_argcount == 0:
             for i in xrange(n):
-                W.rows[i] = [j for j in range(m) if rand() < p()]
+                r = rng.substream(i).rand(m)
+                W.rows[i] = [j for j in range(m) if r[j] < p()]
                 W.data[i] = list(valuef(i, array(W.rows[i])))
         else:
             raise AttributeError, "Bad number of arguments in p function (should be 2)"
     elif callable(value):
         if value.func_code.co_argcount == 0: # TODO: should work with partial objects
             for i in xrange(n):
-                k = random.binomial(m, p, 1)[0]
-                W.rows[i] = sample(xrange(m), k)
-                W.rows[i].sort()
-                W.data[i] = [value() for _ in xrange(k)]
+                W.rows[i] = list(skip_ahead_indices(m, p, rng.substream(i)))
+                W.data[i] = [value() for _ in xrange(len(W.rows[i]))]
         elif value.func_code.co_argcount == 2:
             try:
                 failed = (array(value(0, arange(m))).size != m)
@@ -101,15 +106,11 @@ def random_matrix(n, m, p, value=1.):
             if failed: # vector-based not possible
                 log_debug('connections', 'Cannot build the connection matrix by rows')
                 for i in xrange(n):
-                    k = random.binomial(m, p, 1)[0]
-                    W.rows[i] = sample(xrange(m), k)
-                    W.rows[i].sort()
+                    W.rows[i] = list(skip_ahead_indices(m, p, rng.substream(i)))
                     W.data[i] = [value(i, j) for j in W.rows[i]]
             else:
                 for i in xrange(n):
-                    k = random.binomial(m, p, 1)[0]
-                    W.rows[i] = sample(xrange(m), k)
-                    W.rows[i].sort()
+                    W.rows[i] = list(skip_ahead_indices(m, p, rng.substream(i)))
                     W.data[i] = list(value(i, array(W.rows[i])))
         else:
             raise AttributeError, "Bad number of arguments in value function (should be 0 or 2)"
@@ -123,42 +124,43 @@ def random_matrix(n, m, p, value=1.):
             if failed: # vector-based not possible
                 log_debug('connections', 'Cannot build the connection matrix by rows')
                 for i in xrange(n):
-                    W.rows[i] = [j for j in range(m) if rand() < p(i, j)]
+                    r = rng.substream(i).rand(m)
+                    W.rows[i] = [j for j in range(m) if r[j] < p(i, j)]
                     W.data[i] = [value] * len(W.rows[i])
             else: # vector-based possible
                 for i in xrange(n):
-                    W.rows[i] = list((rand(m) < p(i, arange(m))).nonzero()[0])
+                    W.rows[i] = list((rng.substream(i).rand(m) < p(i, arange(m))).nonzero()[0])
                     W.data[i] = [value] * len(W.rows[i])
         elif p.func_code.co_argcount == 0:
             for i in xrange(n):
-                W.rows[i] = [j for j in range(m) if rand() < p()]
+                r = rng.substream(i).rand(m)
+                W.rows[i] = [j for j in range(m) if r[j] < p()]
                 W.data[i] = [value] * len(W.rows[i])
         else:
             raise AttributeError, "Bad number of arguments in p function (should be 2)"
     else:
         for i in xrange(n):
-            k = random.binomial(m, p, 1)[0]
-            # Not significantly faster to generate all random numbers in one pass
-            # N.B.: the sample method is implemented in Python and it is not in Scipy
-            W.rows[i] = sample(xrange(m), k)
-            W.rows[i].sort()
-            W.data[i] = [value] * k
+            W.rows[i] = list(skip_ahead_indices(m, p, rng.substream(i)))
+            W.data[i] = [value] * len(W.rows[i])
 
     return W
 
-def random_matrix_fixed_column(n, m, p, value=1.):
+def random_matrix_fixed_column(n, m, p, value=1., rng=None):
     '''
     Generates a sparse random matrix with size (n,m).
     Entries are 1 (or optionnally value) with probability p.
     The number of non-zero entries by per column is fixed: (int)(p*n)
     If value is a function, then that function is called for each
     non zero element as value() or value(i,j).
+    The random numbers for column j are drawn from rng.substream(j) (see
+    :func:`random_matrix`).
     '''
     W = sparse.lil_matrix((n, m))
+    if rng is None:
+        rng = RandomStream()
     k = (int)(p * n)
     for j in xrange(m):
-        # N.B.: the sample method is implemented in Python and it is not in Scipy
-        for i in sample(xrange(n), k):
+        for i in rng.substream(j).sample(n, k):
             W.rows[i].append(j)
 
     if callable(value):
@@ -33,6 +33,12 @@ class DenseConstructionMatrix(ConstructionMatrix, numpy.ndarray):
     The ``__setitem__`` method is overloaded so that you can set values with
     a sparse matrix.
     '''
+    def __new__(subtype, shape, **kwds):
+        # the propagation keyword is for the DenseConnectionMatrix
+        kwds = dict(kwds.iteritems())
+        kwds.pop('propagation', None)
+        return numpy.ndarray.__new__(subtype, shape, **kwds)
+
     def __init__(self, val, **kwds):
         self[:] = 0
         self.init_kwds = kwds
@@ -227,9 +227,15 @@ class DelayConnection(Connection):
             using_lil_matrix = False
             if isinstance(delayvec, sparse.lil_matrix):
                 using_lil_matrix = True
-            self.delayvec = self.W.connection_matrix(copy=True)
+            W = self.W
+            Connection.compress(self)
+            if isinstance(self.W, SparseConnectionMatrix):
+                # the delay matrix shares the index arrays of the weight matrix
+                self.delayvec = self.W.copy_structure()
+            else:
+                self.delayvec = W.connection_matrix(copy=True)
             repeated_index_hack = False
-            for i in xrange(self.W.shape[0]):
+            for i in xrange(W.shape[0]):
                 if using_lil_matrix:
                     try:
                         row = SparseConnectionVector(self.W.shape[1],
@@ -251,8 +257,6 @@ class DelayConnection(Connection):
                         delayvec = delayvec.tocsr()
                 if not using_lil_matrix:
                     self.delayvec.set_row(i, array(todense(delayvec[i, :]), copy=False).flatten())
-                
-            Connection.compress(self)
 
     def set_delays(self, source=None, target=None, delay=None):
         '''
@@ -1,5 +1,6 @@
 from base import *
 from connection import *
+from connectionmatrix import *
 
 __all__ = [
          'IdentityConnection',
@@ -52,26 +53,107 @@ class IdentityConnection(Connection):
 class MultiConnection(Connection):
     '''
     A hub for multiple connections with a common source group.
+    
+    The spikes are fetched once for all connections. After compression, the
+    connections of class :class:`Connection` with a sparse matrix are
+    propagated together (fused): with weave, a single compiled loop goes
+    through the rows of all the matrices for each spike, otherwise each
+    matrix is propagated with one vectorised operation. The other
+    connections, and connections whose ``propagate`` method was replaced
+    (e.g. by per-synapse :class:`STP`), use their own ``propagate`` method.
     '''
     def __init__(self, source, connections=[]):
         self.source = source
         self.connections = connections
         self.iscompressed = False
         self.delay = connections[0].delay
+        self._fused = []
+        self._others = connections
+        self._useaccel = get_global_preference('useweave')
+        self._cpp_compiler = get_global_preference('weavecompiler')
+        self._extra_compile_args = ['-O3']
+        if self._cpp_compiler == 'gcc':
+            self._extra_compile_args += get_global_preference('gcc_options') # ['-march=native', '-ffast-math']
 
     def propagate(self, spikes):
         '''
         Propagates the spikes to the targets.
         '''
-        for C in self.connections:
+        if len(self._fused) and len(spikes):
+            self.propagate_fused(asarray(spikes, dtype=int))
+        for C in self._others:
             C.propagate(spikes)
 
+    def propagate_fused(self, spikes):
+        '''
+        Propagates the spikes through all fused connections at once.
+        '''
+        if self._useaccel:
+            namespace = {'spikes': spikes, 'nspikes': len(spikes)}
+            for k, C in enumerate(self._fused):
+                namespace['sv%d' % k] = C.target._S[C.nstate]
+                namespace['rowind%d' % k] = C.W.rowind
+                namespace['allj%d' % k] = C.W.allj
+                namespace['alldata%d' % k] = C.W.alldata
+                if C._nstate_mod is not None:
+                    namespace['sv_pre%d' % k] = C.source._S[C._nstate_mod]
+            weave.inline(self._fused_code, namespace.keys(),
+                         local_dict=namespace,
+                         compiler=self._cpp_compiler,
+                         extra_compile_args=self._extra_compile_args)
+        else:
+            for C in self._fused:
+                W = C.W
+                sv = C.target._S[C.nstate]
+                # indices in alldata of the elements in the spiking rows
+                starts = W.rowind[spikes]
+                counts = W.rowind[spikes + 1] - starts
+                if counts.sum() == 0:
+                    continue
+                ind = arange(counts.sum()) + repeat(starts - (cumsum(counts) - counts), counts)
+                weights = W.alldata[ind]
+                if C._nstate_mod is not None:
+                    weights = weights * repeat(C.source._S[C._nstate_mod][spikes], counts)
+                sv += bincount(W.allj[ind], weights=weights, minlength=len(sv))
+
     def compress(self):
         if not self.iscompressed:
             for C in self.connections:
                 C.compress()
+            self._fused = [C for C in self.connections if C.__class__ is Connection and
+                                                          'propagate' not in C.__dict__ and
+                                                          isinstance(C.W, SparseConnectionMatrix)]
+            if len(self._fused) < 2:
+                self._fused = []
+            self._others = [C for C in self.connections if C not in self._fused]
+            self._fused_code = self.fused_code()
             self.iscompressed = True
 
+    def fused_code(self):
+        '''
+        Returns the C code propagating the spikes through the fused
+        connections, looping over the spikes and, for each spike, over the
+        rows of all the matrices.
+        '''
+        code = '''
+        for(int _j=0; _j<nspikes; _j++)
+        {
+            const int _i = spikes[_j];
+        '''
+        for k, C in enumerate(self._fused):
+            if C._nstate_mod is None:
+                weight = 'alldata%d[_p]' % k
+            else:
+                weight = 'alldata%d[_p]*sv_pre%d[_i]' % (k, k)
+            code += '''
+            for(int _p=rowind{k}[_i]; _p<rowind{k}[_i+1]; _p++)
+                sv{k}[allj{k}[_p]] += {weight};
+            '''.replace('{k}', str(k)).replace('{weight}', weight)
+        code += '''
+        }
+        '''
+        return code
+
     def reinit(self):
         for C in self.connections:
             # this does nothing for normal connections but is important for
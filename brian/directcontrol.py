@@ -39,7 +39,8 @@ control over the behaviour of neurons.
 """
 
 __all__ = ['SpikeGeneratorGroup', 'PulsePacket',
-           'PoissonGroup', 'OfflinePoissonGroup', 'PoissonInput']
+           'PoissonGroup', 'OfflinePoissonGroup', 'PoissonInput',
+           'PoissonScheduleThreshold']
 
 from neurongroup import *
 from threshold import *
@@ -47,8 +48,12 @@ from stateupdater import *
 from units import *
 import random as pyrandom
 from numpy import where, array, zeros, ones, inf, nonzero, tile, sum, isscalar,\
-                  cumsum, hstack, bincount,  ceil, ndarray, ascontiguousarray
+                  cumsum, hstack, bincount,  ceil, ndarray, ascontiguousarray,\
+                  asarray, lexsort, diff, flatnonzero, repeat, searchsorted
 from copy import copy
+from randomstreams import RandomStream, skip_ahead_indices
+from noisebuffer import NoiseBuffer
+from timedarray import TimedArray
 from clock import guess_clock
 from utils.approximatecomparisons import *
 import warnings
@@ -57,7 +62,12 @@ from log import *
 import numpy
 from numpy.random import exponential, randint, binomial
 from connections import Connection
+from connections.connectionfile import write_array_file, read_array_file
 from itertools import izip
+
+
+SPIKES_FILE_MAGIC = 'BRIANSPK'
+SPIKES_FILE_VERSION = 1
 
 
 class SpikeGeneratorGroup(NeuronGroup):
@@ -88,6 +98,9 @@ class SpikeGeneratorGroup(NeuronGroup):
         Optionally makes the spikes recur periodically with the given
         period. Note that iterator objects cannot be used as the ``spikelist``
         with a period as they cannot be reinitialised.
+        ``spiketimes`` can also be the name of a file saved with
+        :meth:`SpikeGeneratorGroup.save`, which is memory mapped (the clock
+        must have the same ``dt`` as when the file was saved).
     ``gather=False``
         Set to True if you want to gather spike events that fall in the same
         timestep. (Deprecated since Brian 1.3.1)
@@ -127,6 +140,10 @@ class SpikeGeneratorGroup(NeuronGroup):
     is detected.
 
     Also, if you want to use a SpikeGeneratorGroup with many spikes and/or neurons, please use an initialization with arrays.
+    Only the timesteps with spikes are stored, so that long and sparse inputs
+    do not use memory for empty timesteps. For very large inputs, the spikes
+    can be saved to a binary file with :meth:`SpikeGeneratorGroup.save` and
+    memory mapped by passing the file name as ``spiketimes``.
     
     Also note that if you pass a generator, then reinitialising the group will not have the
     expected effect because a generator object cannot be reinitialised. Instead, you should
@@ -185,12 +202,18 @@ class SpikeGeneratorGroup(NeuronGroup):
             # spiketimes is a ndarray, with first col is index and second time
             idx = spiketimes[:,0]
             times = spiketimes[:,1]
+        elif isinstance(spiketimes, str):
+            # spiketimes is the name of a file saved with SpikeGeneratorGroup.save
+            idx = times = None
         else:
             log_warn('brian.SpikeGeneratorGroup', 'Using (slow) threshold because spiketimes is assumed to be a generator/iterator')
             # spiketimes is a callable object, so falling back on old SpikeGeneratorThreshold
             fallback = True
 
-        if not fallback:
+        if isinstance(spiketimes, str):
+            thresh = FastSpikeGeneratorThreshold.load(spiketimes, N, dt=clock.dt,
+                                                      period=period)
+        elif not fallback:
             thresh = FastSpikeGeneratorThreshold(N, idx, times, dt=clock.dt, period=period)
         else:
             thresh = SpikeGeneratorThreshold(N, spiketimes, period=period, sort=sort)
@@ -210,6 +233,17 @@ class SpikeGeneratorGroup(NeuronGroup):
     
     def set_spiketimes(self, values):
         self.__init__(self.N, values, period = self.period)
+
+    def save(self, filename):
+        '''
+        Saves the spikes to the binary file ``filename``, which can be
+        memory mapped by passing its name as ``spiketimes`` to
+        :class:`SpikeGeneratorGroup`. Only groups initialised with arrays,
+        lists or tuples (not generators) can be saved.
+        '''
+        if not isinstance(self._threshold, FastSpikeGeneratorThreshold):
+            raise TypeError('Only SpikeGeneratorGroups initialised with static spike containers can be saved')
+        self._threshold.save(filename, self.N)
     
     # changed due to the 2.5 issue
     spiketimes = property(get_spiketimes, set_spiketimes)
@@ -219,66 +253,131 @@ class SpikeGeneratorGroup(NeuronGroup):
 class FastSpikeGeneratorThreshold(Threshold):
     '''
     A faster version of the SpikeGeneratorThreshold where spikes are processed prior to the run (offline). It replaces the SpikeGeneratorThreshold as of 1.3.1.
+
+    Only the timesteps with spikes are stored: ``steps`` is the sorted array
+    of these timesteps, and the neurons spiking at timestep ``steps[k]`` are
+    ``I[offsets[k]:offsets[k+1]]``. A cursor points to the next timestep with
+    spikes, so that timesteps without spikes only cost a comparison.
     '''
     ## Notes:
     #  - N is ignored (should it not?)
     def __init__(self, N, addr, timestamps, dt = None, period=None):
-        self.set_offsets(addr, timestamps, dt = dt)
+        if addr is not None:
+            self.set_offsets(addr, timestamps, dt = dt)
         self.period = period
         self.dt = dt
         self.reinit()
         
     def set_offsets(self, I, T, dt = 1000):
         # Convert times into integers
-        T = array(ceil(T/dt), dtype=int)
-        # Put them into order
-        # We use a field array to sort first by time and then by neuron index
-        spikes = zeros(len(I), dtype=[('t', int), ('i', int)])
-        spikes['t'] = T
-        spikes['i'] = I
-        spikes.sort(order=('t', 'i'))
-        T = ascontiguousarray(spikes['t'])
-        self.I = ascontiguousarray(spikes['i'])
-        # Now for each timestep, we find the corresponding segment of I with
-        # the spike indices for that timestep.
-        # The idea of offsets is that the segment offsets[t]:offsets[t+1]
-        # should give the spikes with time t, i.e. T[offsets[t]:offsets[t+1]]
-        # should all be equal to t, and so then later we can return
-        # I[offsets[t]:offsets[t+1]] at time t. It might take a bit of thinking
-        # to see why this works. Since T is sorted, and bincount[i] returns the
-        # number of elements of T equal to i, then j=cumsum(bincount(T))[t]
-        # gives the first index in T where T[j]=t.
+        T = array(ceil(asarray(T)/float(dt)), dtype=int)
+        # Put them into order, first by time and then by neuron index
+        order = lexsort((I, T))
+        T = T[order]
+        I = array(asarray(I)[order], dtype=int)
+        # The timesteps with spikes and, for each of them, the start of the
+        # corresponding segment of I (T is sorted)
         if len(T):
-            self.offsets = hstack((0, cumsum(bincount(T))))
+            starts = hstack((0, flatnonzero(diff(T)) + 1))
+            steps = T[starts]
         else:
-            self.offsets = array([])
-    
+            starts = steps = zeros(0, dtype=int)
+        self.set_arrays(I, steps, hstack((starts, len(T))))
+
+    def set_arrays(self, I, steps, offsets):
+        '''
+        Sets the spikes from the arrays ``I`` (neuron indices), ``steps``
+        (sorted timesteps with spikes) and ``offsets`` (of length
+        ``len(steps)+1``), which can be memory mapped.
+        '''
+        self.I = I
+        self.steps = steps
+        self.offsets = offsets
+
     def __call__(self, P):
-        t = P.clock.t
+        t = P.clock._t
+        dt = P.clock._dt
         if self.period is not None:
-            cp = int(t / self.period)
-            if cp > self.curperiod:
+            period = float(self.period)
+            if t >= self._period_end or t < self._period_end - period:
+                # new period
+                cp = int(t / period)
                 self.reinit()
                 self.curperiod = cp
-            t = t - cp * self.period
-        dt = P.clock.dt
-        t = int(round(t/dt))
-        if t+1>=len(self.offsets):
+                self._period_end = (cp + 1) * period
+            t = t - self.curperiod * period
+        if t < self._last_t:
+            # the clock went back in time, look for the next timestep
+            self._cursor = searchsorted(self.steps, int(round(t / dt)))
+            self._next_t = -inf
+        self._last_t = t
+        if t < self._next_t:
             return array([], dtype=int)
-        return self.I[self.offsets[t]:self.offsets[t+1]]
+        # there might be spikes in this timestep
+        k = self._cursor
+        if k >= len(self.steps):
+            self._next_t = inf
+            return array([], dtype=int)
+        step = int(round(t / dt))
+        if self.steps[k] < step:
+            # some timesteps were skipped
+            k = self._cursor = searchsorted(self.steps, step)
+            if k >= len(self.steps):
+                self._next_t = inf
+                return array([], dtype=int)
+        if self.steps[k] == step:
+            spikes = self.I[self.offsets[k]:self.offsets[k + 1]]
+            k = self._cursor = k + 1
+        else:
+            spikes = array([], dtype=int)
+        if k < len(self.steps):
+            # spikes are emitted when round(t/dt)==steps[k]
+            self._next_t = (self.steps[k] - 0.5) * dt
+        else:
+            self._next_t = inf
+        return spikes
     
     def reinit(self):
         self.curperiod = -1
+        self._period_end = -inf
+        self._cursor = 0
+        self._next_t = -inf
+        self._last_t = -inf
         
     @property
     def spiketimes(self):
-        # this is a pain to do! retrieve spike times from offsets
-        res = []
-        for k in range(len(self.offsets)-1):
-            idx = self.I[self.offsets[k]:self.offsets[k+1]]
-            ts = [k*self.dt]*len(idx)
-            res += zip(idx, ts)
-        return res
+        # retrieve spike times from steps and offsets
+        steps = repeat(asarray(self.steps), diff(self.offsets))
+        return [(i, int(step) * self.dt) for i, step in zip(self.I, steps)]
+
+    def save(self, filename, N):
+        '''
+        Saves the spikes to the file ``filename``, see
+        :meth:`SpikeGeneratorGroup.save`.
+        '''
+        header = {'version': SPIKES_FILE_VERSION, 'N': int(N), 'dt': float(self.dt)}
+        write_array_file(filename, SPIKES_FILE_MAGIC, header,
+                         {'I': self.I, 'steps': self.steps, 'offsets': self.offsets})
+
+    @staticmethod
+    def load(filename, N, dt=None, period=None, mmap_mode='r'):
+        '''
+        Returns a :class:`FastSpikeGeneratorThreshold` with the spikes in the
+        file ``filename`` (saved with :meth:`SpikeGeneratorGroup.save`),
+        memory mapped with mode ``mmap_mode``.
+        '''
+        header, arrays = read_array_file(filename, SPIKES_FILE_MAGIC,
+                                         SPIKES_FILE_VERSION, mmap_mode=mmap_mode)
+        if header['N'] > N:
+            raise ValueError('The spikes in ' + filename + ' are for ' +
+                             str(header['N']) + ' neurons')
+        if dt is not None and abs(float(dt) - header['dt']) > 1e-9 * header['dt']:
+            raise ValueError('The spikes in ' + filename + ' were saved with dt=' +
+                             str(header['dt'] * second))
+        thresh = FastSpikeGeneratorThreshold(N, None, None, dt=header['dt'],
+                                             period=period)
+        thresh.set_arrays(arrays['I'], arrays['steps'], arrays['offsets'])
+        return thresh
 
     def __repr__(self):
         return '<FastSpikeGeneratorThreshold>'
@@ -403,7 +502,7 @@ class PoissonGroup(NeuronGroup):
     
     **Initialised as:** ::
     
-        PoissonGroup(N,rates[,clock])
+        PoissonGroup(N,rates[,clock[,max_rate[,block]]])
     
     with arguments:
     
@@ -417,17 +516,39 @@ class PoissonGroup(NeuronGroup):
     ``clock``
         The clock which the group will update with, do not
         specify to use the default clock.
+    ``max_rate``
+        An optional upper bound of the rates. If it is given, spikes are
+        generated with a cost proportional to the number of spikes rather
+        than to the number of neurons (see :class:`PoissonThreshold`), which
+        is much faster for large groups with low rates. Time-varying rates
+        are obtained by thinning. Rates above ``max_rate`` are truncated.
+    ``block``
+        If ``rates`` is a function (or a :class:`TimedArray`), it can be
+        evaluated for blocks of ``block`` timesteps at once, and the spikes
+        of each block are generated at once (see
+        :class:`PoissonScheduleThreshold`). The function is called with an
+        array of times of shape ``(block, 1)`` and should return an array of
+        rates of shape ``(block, N)`` or ``(block, 1)``; if it cannot be
+        vectorised in this way, it is called for each timestep of the block.
+        The function should only depend on ``t``, since it is evaluated in
+        advance.
     '''
-    def __init__(self, N, rates=0 * hertz, clock=None):
+    def __init__(self, N, rates=0 * hertz, clock=None, max_rate=None, block=None):
         '''
         Initializes the group.
         P.rates gives the rates.
         '''
-        NeuronGroup.__init__(self, N, model=LazyStateUpdater(), threshold=PoissonThreshold(),
-                             clock=clock)
+        if block is not None and callable(rates):
+            threshold = PoissonScheduleThreshold(rates, block, max_rate=max_rate)
+        else:
+            threshold = PoissonThreshold(max_rate=max_rate)
+        NeuronGroup.__init__(self, N, model=LazyStateUpdater(),
+                             threshold=threshold, clock=clock)
+        self._schedule = isinstance(threshold, PoissonScheduleThreshold)
         if callable(rates): # a function is passed
             self._variable_rate = True
-            self.rates = rates
+            # not self.rates = rates, which would link a TimedArray to a variable
+            self.__dict__['rates'] = rates
             self._S0[0] = self.rates(self.clock.t)
         else:
             self._variable_rate = False
@@ -436,10 +557,112 @@ class PoissonGroup(NeuronGroup):
         self.var_index = {'rate':0}
 
     def update(self):
-        if self._variable_rate:
+        if self._variable_rate and not self._schedule:
             self._S[0, :] = self.rates(self.clock.t)
         NeuronGroup.update(self)
 
+    def reinit(self):
+        super(PoissonGroup, self).reinit()
+        if self._schedule:
+            self._threshold.reinit()
+
+
+class PoissonScheduleThreshold(Threshold):
+    '''
+    Threshold of a :class:`PoissonGroup` with time-varying rates, which are
+    evaluated for blocks of ``block`` timesteps at once.
+    
+    The rates ``rates(t)`` of the whole block are computed with a single call
+    with an array of times (of shape ``(block, 1)``), or by indexing the
+    values of a :class:`TimedArray`, and the spikes of the block are then
+    generated at once (by thinning if ``max_rate`` is given, see
+    :class:`PoissonThreshold`). If the vectorised call fails or disagrees
+    with ``rates(t)`` for the first timestep, the rates are evaluated at each
+    timestep of the block. At each timestep, the current rates are copied to
+    the ``rate`` variable of the group.
+    '''
+    def __init__(self, rates, block, max_rate=None):
+        self.rates = rates
+        self.block = int(block)
+        self.max_rate = max_rate
+        self._random = RandomStream()
+        self._vectorised = None # unknown until the first block
+        self.reinit()
+
+    def reinit(self):
+        self._t0 = None
+
+    def evaluate_rates(self, times, N):
+        '''
+        Returns the rates at the given times, as an array of shape
+        ``(len(times), N)`` or ``(len(times), 1)``.
+        '''
+        rates = self.rates
+        if isinstance(rates, TimedArray) and rates.clock is not None:
+            ind = array(numpy.rint((times - rates._t_init) / rates._dt), dtype=int)
+            ind = ind.clip(0, len(rates.times) - 1)
+            R = asarray(rates)[ind]
+            return R.reshape((len(times), -1))
+        if self._vectorised is not False:
+            try:
+                R = numpy.asarray(rates(times.reshape((len(times), 1))), dtype=float)
+                R = numpy.broadcast_arrays(R, zeros((len(times), 1)))[0]
+                if R.shape[1] not in (1, N):
+                    raise ValueError('Bad shape')
+                if self._vectorised is None:
+                    R0 = numpy.asarray(rates(times[0] * second), dtype=float)
+                    if not numpy.allclose(R[0], R0):
+                        raise ValueError('Inconsistent rates')
+                    self._vectorised = True
+                return R
+            except Exception:
+                log_debug('brian.PoissonGroup', 'Cannot evaluate the rates for blocks of timesteps')
+                self._vectorised = False
+        R = zeros((len(times), N))
+        for k, t in enumerate(times):
+            R[k] = rates(t * second)
+        return R
+
+    def generate_block(self, P):
+        '''
+        Generates the spikes of the block starting at the current time.
+        '''
+        N = len(P)
+        dt = P.clock._dt
+        self._t0 = P.clock._t
+        times = self._t0 + numpy.arange(self.block) * dt
+        R = self.evaluate_rates(times, N)
+        if self.max_rate is None:
+            spikes = (self._random.rand(self.block, N) < R * dt).flatten().nonzero()[0]
+        else:
+            p = min(float(self.max_rate) * dt, 1.)
+            candidates = skip_ahead_indices(self.block * N, p, self._random)
+            if R.shape[1] == 1:
+                r = R[candidates // N, 0]
+            else:
+                r = R.flat[candidates]
+            spikes = candidates[self._random.rand(len(candidates)) * p < r * dt]
+        # spikes are sorted by timestep
+        steps = spikes // N
+        self._neurons = spikes - steps * N
+        self._offsets = searchsorted(steps, numpy.arange(self.block + 1))
+        self._rates = R
+
+    def __call__(self, P):
+        k = -1
+        if self._t0 is not None:
+            k = int(round((P.clock._t - self._t0) / P.clock._dt))
+        if k < 0 or k >= self.block:
+            self.generate_block(P)
+            k = 0
+        # current rates, for monitors
+        P._S[0, :] = self._rates[k]
+        return self._neurons[self._offsets[k]:self._offsets[k + 1]]
+
+    def __repr__(self):
+        return '%s(%s, block=%d)' % (self.__class__.__name__, repr(self.rates),
+                                     self.block)
+
 
 class OfflinePoissonGroup(object): # This is weird, there is only an init method
     def __init__(self, N, rates, T):
@@ -537,6 +760,8 @@ class PoissonInput(Connection):
         
         if jitter is not None:
             self.delays = zeros((copies, self.N))
+        self._random = RandomStream()
+        self._exponential = NoiseBuffer('exponential')
         
         self.reliability = reliability
         self.copies = copies
@@ -563,6 +788,34 @@ class PoissonInput(Connection):
     jitter = property(get_jitter, set_jitter)
     
 
+    def poisson_events(self):
+        '''
+        Returns the indices of the target neurons which receive Poisson
+        events in the current timestep, and the number of events they
+        receive.
+        
+        For low rates, the events of the ``N*len(target)`` input spike trains
+        are drawn by skipping ahead over the trains (see
+        :func:`~brian.threshold.skip_ahead_indices`), so that the cost is
+        proportional to the number of events.
+        
+        The random numbers are drawn from a :class:`RandomStream` owned by
+        the input.
+        '''
+        n = self.n
+        p = float(self.rate * self.clock.dt)
+        if p < 0.1:
+            # the trains of a target neuron are contiguous, so the targets
+            # are sorted
+            targets = skip_ahead_indices(self.N * n, p, self._random) // n
+            if len(targets) == 0:
+                return targets, targets
+            starts = hstack((0, flatnonzero(diff(targets)) + 1))
+            return targets[starts], diff(hstack((starts, len(targets))))
+        k = self._random.binomial(n, p, size=self.N)
+        ind = k.nonzero()[0]
+        return ind, k[ind]
+
     def propagate(self, spikes):
         i = 0
         
@@ -578,38 +831,40 @@ class PoissonInput(Connection):
         
         if (jitter==None) and (reliability==None):
             if frozen:
-                rnd = binomial(n=n, p=f * self.clock.dt)
+                rnd = self._random.binomial(n, float(f * self.clock.dt))
                 self.target._S[state, :] += w * rnd
                 if rnd > 0:
                     self.events.append(self.clock.t)
             else:
-                rnd = binomial(n=n, p=f * self.clock.dt, size=(self.N))
-                self.target._S[state, :] += w * rnd
-                ind = nonzero(rnd>0)[0]
+                ind, rnd = self.poisson_events()
+                self.target._S[state, ind] += w * rnd
                 if record and len(ind)>0:
                     self.recorded_events.append((ind[0], self.clock.t))
         elif (jitter is not None):
             p = self.copies
             taujitter = jitter
             if (p > 0) & (f > 0):
-                k = binomial(n=n, p=f * self.clock.dt, size=(self.N)) # number of synchronous events here, for every target neuron
+                k = self._random.binomial(n, float(f * self.clock.dt), size=self.N) # number of synchronous events here, for every target neuron
                 syncneurons = (k > 0) # neurons with a syncronous event here
                 self.lastevent[syncneurons] = self.clock.t
+                nsync = sum(syncneurons)
                 if taujitter == 0.0:
-                    self.delays[:, syncneurons] = zeros((p, sum(syncneurons)))
-                else:
-                    self.delays[:, syncneurons] = exponential(scale=taujitter, size=(p, sum(syncneurons)))
-                # Delayed spikes occur now
-                lastevent = tile(self.lastevent, (p, 1))
-                b = (abs(self.clock.t - (lastevent + self.delays)) <= (self.clock.dt / 2) * ones((p, self.N))) # delayed spikes occurring now
+                    self.delays[:, syncneurons] = 0.
+                elif nsync:
+                    delays = self._exponential.get(p * nsync).reshape((p, nsync))
+                    delays *= float(taujitter)
+                    self.delays[:, syncneurons] = delays
+                # Delayed spikes occur now (broadcast over the copies)
+                b = (abs(self.clock._t - (self.lastevent + self.delays)) <= (self.clock._dt / 2)) # delayed spikes occurring now
                 weff = sum(b, axis=0) * w
                 self.target._S[state, :] += weff
         elif (reliability is not None):
             p = self.copies
             alpha = reliability
             if (p > 0) & (alpha > 0):
-                weff = w * binomial(n=p, p=alpha)
-                self.target._S[state, :] += weff * binomial(n=n, p=f * self.clock.dt, size=(self.N))
+                weff = w * self._random.binomial(p, alpha)
+                ind, rnd = self.poisson_events()
+                self.target._S[state, ind] += weff * rnd
 
 def _test():
     import doctest
@@ -0,0 +1,118 @@
+'''
+Gap junctions (electrical coupling)
+
+The current through gap junctions depends continuously on the membrane
+potentials of the coupled neurons, so it cannot be handled by a
+:class:`Connection` (which propagates spikes). A :class:`GapJunction` object
+computes on every timestep the currents::
+
+  I[j] = sum_i W[i,j]*(v_source[i]-v_target[j])
+
+with a single pass over the entries of a :class:`SparseConnectionMatrix`
+(compiled with weave if possible), and writes them to a variable of the
+target group, which is then used in the differential equations, e.g.::
+
+  eqs = """
+  dv/dt = (-v+I_gap/gl)/tau : volt
+  I_gap : amp
+  """
+'''
+from network import NetworkOperation
+from connections import SparseConnectionMatrix
+from connections.connectionmatrix import make_sparse_connection_matrix
+from globalprefs import get_global_preference
+from scipy import sparse, weave
+from numpy import asarray, bincount, repeat, diff, arange
+
+__all__ = ['GapJunction']
+
+
+class GapJunction(NetworkOperation):
+    '''
+    Gap junctions between two groups of neurons
+
+    Initialised as::
+
+        GapJunction(source, target, W[, state='v'[, current='I_gap'[, when='before_groups']]])
+
+    with arguments:
+
+    ``source``, ``target``
+        The coupled groups (which can be the same group, or subgroups).
+    ``W``
+        The conductances, with ``W[i,j]`` the conductance of the junction
+        from neuron ``i`` of ``source`` to neuron ``j`` of ``target``. It can
+        be a :class:`SparseConnectionMatrix`, a scipy sparse matrix or a
+        dense array (which are converted to a :class:`SparseConnectionMatrix`
+        stored in the attribute ``W``). Only the current into the target
+        neurons is computed, so that the matrix should be symmetric for the
+        junctions within a group.
+    ``state``
+        The membrane potential variable, in both groups.
+    ``current``
+        The variable of the target group where the current is written. It is
+        overwritten on every timestep, so that each :class:`GapJunction`
+        object should have its own current variable.
+    ``when``
+        When the currents are computed (see :class:`NetworkOperation`), by
+        default before the state update.
+
+    The weights can be modified during the simulation (e.g. ``W.alldata``),
+    but not the structure of the matrix.
+    '''
+    def __init__(self, source, target, W, state='v', current='I_gap',
+                 when='before_groups'):
+        NetworkOperation.__init__(self, clock=target.clock, when=when)
+        if not isinstance(W, SparseConnectionMatrix):
+            if not sparse.issparse(W):
+                W = sparse.csr_matrix(asarray(W, dtype=float))
+            W = make_sparse_connection_matrix(W, column_access=False)
+        if W.shape != (len(source), len(target)):
+            raise ValueError('The matrix W should have shape ' + str((len(source), len(target))))
+        self.source = source
+        self.target = target
+        self.W = W
+        self.state = state
+        self.current = current
+        self._vs = source.state_(state)
+        self._vt = target.state_(state)
+        self._I = target.state_(current)
+        self._useaccel = get_global_preference('useweave')
+        self._cpp_compiler = get_global_preference('weavecompiler')
+        self._extra_compile_args = ['-O3']
+        if self._cpp_compiler == 'gcc':
+            self._extra_compile_args += get_global_preference('gcc_options')
+        if not self._useaccel:
+            # row index of each entry
+            self._rows = repeat(arange(len(source)), diff(W.rowind))
+
+    def __call__(self):
+        W = self.W
+        vs, vt, I = self._vs, self._vt, self._I
+        if self._useaccel:
+            rowind, allj, alldata = W.rowind, W.allj, W.alldata
+            N, M = len(vs), len(vt)
+            code = '''
+            for(int _j=0; _j<M; _j++)
+                I[_j] = 0.0;
+            for(int _i=0; _i<N; _i++)
+            {
+                const double _v = vs[_i];
+                for(int _p=rowind[_i]; _p<rowind[_i+1]; _p++)
+                {
+                    const int _j = allj[_p];
+                    I[_j] += alldata[_p]*(_v-vt[_j]);
+                }
+            }
+            '''
+            weave.inline(code, ['I', 'vs', 'vt', 'rowind', 'allj', 'alldata', 'N', 'M'],
+                         compiler=self._cpp_compiler,
+                         extra_compile_args=self._extra_compile_args)
+        else:
+            # sum_i W[i,j]*v_source[i] - (sum_i W[i,j])*v_target[j]
+            I[:] = bincount(W.allj, weights=W.alldata * vs[self._rows], minlength=len(vt))
+            I -= bincount(W.allj, weights=W.alldata, minlength=len(vt)) * vt
+
+    def __repr__(self):
+        return '<%s from %s to %s>' % (self.__class__.__name__, repr(self.source),
+                                       repr(self.target))
@@ -90,6 +90,13 @@ class LinkedVar(object):
         self.when = when
         self.clock = clock
 
+def _same_memory(a, b):
+    '''
+    Whether the arrays ``a`` and ``b`` are views of exactly the same memory.
+    '''
+    return (a.__array_interface__['data'][0] == b.__array_interface__['data'][0] and
+            a.shape == b.shape and a.strides == b.strides and a.dtype == b.dtype)
+
 def linked_var(source, var=0, func=None, when='start', clock=None):
     """
     Used for linking one :class:`NeuronGroup` variable to another.
@@ -120,6 +127,10 @@ def linked_var(source, var=0, func=None, when='start', clock=None):
     ``clock``
         The update clock for the copy operation, by default it will use the clock
         of the target group.
+    
+    All the linked variables of a group with the same ``when`` and ``clock``
+    are updated by a single operation. No copy is made if the two variables
+    are the same array.
     """
     return LinkedVar(source, var, func, when, clock)
 
@@ -422,6 +433,7 @@ class NeuronGroup(magic.InstanceTracker, ObjectContainer, Group):
             self._use_next_allowed_spiketime_refractoriness = True
 
         self._owner = self # owner (for subgroups)
+        self._linked_vars = {} # linked variables, by (when, clock)
         self._subgroup_set = magic.WeakSet()
         self._origin = 0 # start index from owner if subgroup
         self._next_subgroup = 0 # start index of next subgroup
@@ -657,36 +669,40 @@ class NeuronGroup(magic.InstanceTracker, ObjectContainer, Group):
                 import network
             selfarr = self.state_(name)
             s_name = val.name
+            N = len(selfarr)
 
-            #Faster version using weave
+            # The sum over synapses is done in a single pass over the
+            # postsynaptic indexes, directly into the state variable
             if self._useweave:
                 log_info('brian.neurongroup',
                          'Using weave for lumped variable.')
                 compiler = self._cpp_compiler
                 extra_args = self._extra_compile_args
+                code = '''
+                for (int j=0; j<N; j++)
+                    selfarr[j] = 0.0;
+                for (int i=0; i<nsynapses; i++)
+                    selfarr[postsynaptic[i]] += s_state[i];
+                '''
 
                 @network.network_operation(clock=S.clock)
                 def update_link_var():
-                    s_state = S.state_(s_name)
-                    code = '''
-                    for (int i=0; i<N; i++) {
-                        summed[postsynaptic[i]] += s_state[i];
-                    }
-                    '''
-                    summed = zeros_like(selfarr)
                     postsynaptic = S.postsynaptic.data
-                    N = len(postsynaptic)
-                    weave.inline(code, ['summed', 'N', 's_state',
+                    weave.inline(code, ['selfarr', 'N', 'nsynapses', 's_state',
                                         'postsynaptic'],
+                                 local_dict={'selfarr': selfarr,
+                                             'N': N,
+                                             'nsynapses': len(postsynaptic),
+                                             's_state': S.state_(s_name),
+                                             'postsynaptic': postsynaptic},
                                  compiler=compiler,
                                  extra_compile_args=extra_args)
-                    selfarr[:] = summed
             else:
                 @network.network_operation(clock=S.clock)
                 def update_link_var():
-                    s_state = S.state_(s_name)
-                    selfarr[:] = array([sum(s_state[post_syns.data]) for
-                                        post_syns in S.synapses_post])
+                    selfarr[:] = bincount(S.postsynaptic.data,
+                                          weights=S.state_(s_name),
+                                          minlength=N)
 
             self._owner.contained_objects.append(update_link_var)
         else:
@@ -705,21 +721,31 @@ class NeuronGroup(magic.InstanceTracker, ObjectContainer, Group):
             raise ValueError("Cannot set a static variable (equation) with a linked variable.")
         selfarr = self.state_(var)
         if hasattr(source, 'staticvars') and sourcevar in source.staticvars:
-            if func is None: func = lambda x: x
-            @network.network_operation(when=when, clock=clock)
-            def update_link_var():
-                selfarr[:] = func(getattr(source, sourcevar))
+            sourcearr = None # evaluated at each update
         else:
             sourcearr = source.state_(sourcevar)
-            if func is None:
-                @network.network_operation(when=when, clock=clock)
-                def update_link_var():
-                    selfarr[:] = sourcearr
-            else:
-                @network.network_operation(when=when, clock=clock)
-                def update_link_var():
-                    selfarr[:] = func(sourcearr)
-        self._owner.contained_objects.append(update_link_var)
+            if func is None and _same_memory(selfarr, sourcearr):
+                # the variables are already the same (e.g. in a common owner)
+                log_info('brian.neurongroup', 'Linked variable ' + str(var) +
+                         ' is the same array as its source, no copy needed.')
+                return
+        # All the linked variables of the group updated with the same clock
+        # and at the same time are copied by a single network operation
+        key = (when, clock)
+        if key not in self._owner._linked_vars:
+            links = self._owner._linked_vars[key] = []
+            @network.network_operation(when=when, clock=clock)
+            def update_link_var():
+                for selfarr, sourcearr, func, source, sourcevar in links:
+                    if sourcearr is None: # static variable of the source
+                        sourcearr = getattr(source, sourcevar)
+                    if func is None:
+                        selfarr[:] = sourcearr
+                    else:
+                        selfarr[:] = func(sourcearr)
+            self._owner.contained_objects.append(update_link_var)
+        self._owner._linked_vars[key].append((selfarr, sourcearr, func,
+                                              source, sourcevar))
 
     def set_var_by_array(self, var, arr, times=None, clock=None, start=None, dt=None):
         # ugly hack, have to import this here because otherwise the order of imports
@@ -0,0 +1,144 @@
+'''
+Pre-generated blocks of random numbers
+
+Drawing random numbers for every neuron on every timestep (e.g. for the
+noise term ``xi`` of stochastic equations) has a cost per call to the random
+number generator and allocates a new array each time. A :class:`NoiseBuffer`
+generates large blocks of random numbers at once and returns views on
+consecutive segments of the current block.
+'''
+import threading
+from Queue import Queue
+
+from numpy import hstack, zeros
+
+from globalprefs import define_global_preference, set_global_preferences, \
+                        get_global_preference
+from randomstreams import RandomStream
+
+__all__ = ['NoiseBuffer']
+
+set_global_preferences(noisebuffer_size=2 ** 20)
+define_global_preference('noisebuffer_size', '2**20',
+                         desc="""
+                              The number of random numbers generated at
+                              once by :class:`NoiseBuffer` objects (e.g. for
+                              the noise of stochastic equations).
+                              """)
+set_global_preferences(noisebuffer_thread=False)
+define_global_preference('noisebuffer_thread', 'False',
+                         desc="""
+                              Whether or not :class:`NoiseBuffer` objects
+                              generate the next block of random numbers in a
+                              background thread.
+                              """)
+
+# The methods of RandomStream generating each distribution
+_generators = {'normal': 'standard_normal',
+               'uniform': 'random_sample',
+               'exponential': 'standard_exponential'}
+
+
+def _generate_blocks(rng, method, size, queue, stop):
+    # Runs in the background thread
+    generate = getattr(rng, method)
+    while not stop.is_set():
+        queue.put(generate(size=size))
+
+
+class NoiseBuffer(object):
+    '''
+    A buffer of pre-generated random numbers
+
+    Initialised as::
+
+        NoiseBuffer([distribution='normal'[, blocksize[, seed[, background]]]])
+
+    with arguments:
+
+    ``distribution``
+        ``'normal'`` (standard normal), ``'uniform'`` (in [0,1)) or
+        ``'exponential'`` (with unit mean).
+    ``blocksize``
+        The number of random numbers generated at once, by default the global
+        preference ``noisebuffer_size``.
+    ``seed``
+        The seed of the :class:`RandomStream` of the buffer. By default
+        each buffer has an independent stream derived from the global seed
+        (see :func:`seed_random_streams`).
+    ``background``
+        Whether to generate the next block in a background thread, by
+        default the global preference ``noisebuffer_thread``.
+
+    The method ``get(n)`` returns the next ``n`` random numbers, as a view on
+    the current block, which can be modified in place. The numbers are
+    always generated by whole blocks, so that the sequence does not depend on
+    ``background``.
+    '''
+    _queue = None
+    _stop = None
+
+    def __init__(self, distribution='normal', blocksize=None, seed=None,
+                 background=None):
+        if distribution not in _generators:
+            raise ValueError('Unknown distribution ' + str(distribution))
+        if blocksize is None:
+            blocksize = get_global_preference('noisebuffer_size')
+        if background is None:
+            background = get_global_preference('noisebuffer_thread')
+        self.distribution = distribution
+        self.blocksize = int(blocksize)
+        self.seed = seed
+        self.background = background
+        self._rng = RandomStream(seed)
+        self._block = zeros(0)
+        self._pos = 0
+
+    def _next_block(self, n):
+        # enough whole blocks for n numbers
+        nblocks = max((n + self.blocksize - 1) // self.blocksize, 1)
+        if not self.background:
+            generate = getattr(self._rng, _generators[self.distribution])
+            blocks = [generate(size=self.blocksize) for _ in range(nblocks)]
+        else:
+            blocks = self._next_blocks_background(nblocks)
+        if len(blocks) > 1:
+            return hstack(blocks)
+        return blocks[0]
+
+    def _next_blocks_background(self, nblocks):
+        if self._queue is None:
+            self._queue = Queue(maxsize=1)
+            self._stop = threading.Event()
+            thread = threading.Thread(target=_generate_blocks,
+                                      args=(self._rng, _generators[self.distribution],
+                                            self.blocksize, self._queue, self._stop))
+            thread.daemon = True
+            thread.start()
+        return [self._queue.get() for _ in range(nblocks)]
+
+    def get(self, n):
+        '''
+        Returns the next ``n`` random numbers.
+        '''
+        if self._pos + n > len(self._block):
+            # the rest of the current block is discarded
+            self._block = self._next_block(n)
+            self._pos = 0
+        x = self._block[self._pos:self._pos + n]
+        self._pos += n
+        return x
+
+    def stop(self):
+        '''
+        Stops the background thread, if any.
+        '''
+        if self._stop is not None:
+            self._stop.set()
+            # unblock the thread if it is waiting to put a block
+            while not self._queue.empty():
+                self._queue.get()
+            self._queue = self._stop = None
+
+    def __del__(self):
+        self.stop()
@@ -0,0 +1,295 @@
+'''
+Counter-based random number streams
+
+Each object drawing random numbers (Poisson groups and inputs, noise,
+random connectivity, ``rand()`` in string resets and thresholds...) owns a
+:class:`RandomStream` rather than using the global state of
+``numpy.random``. The ``k``-th number of a stream only depends on the key
+of the stream and on ``k`` (it is a hash of the counter ``k``, with the
+SplitMix64 generator), so that the streams are independent of the order in
+which objects draw their numbers, and of the number of threads or processes
+used to run a network.
+
+The key of a stream is derived from the global seed set with
+:func:`seed_random_streams` and from the identity of the stream (by default
+the number of streams created before it since the global seed was set). If
+no global seed was set, the key is drawn from ``numpy.random``, so that
+simulations are still reproducible with ``numpy.random.seed``.
+'''
+import hashlib
+
+import numpy
+from numpy import uint64, arange, sqrt, log, cos, sin, pi, ceil, floor, maximum, \
+                  cumsum, hstack, zeros, where, sign, broadcast_arrays
+from scipy.special import gammaln
+
+__all__ = ['RandomStream', 'seed_random_streams', 'skip_ahead_indices']
+
+_MASK = (1 << 64) - 1
+_GAMMA = 0x9E3779B97F4A7C15
+_streams = {'seed': None, 'count': 0}
+
+
+def _mix(z):
+    # SplitMix64 finaliser on a Python integer
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK
+    return z ^ (z >> 31)
+
+
+def _identity_number(identity):
+    if isinstance(identity, str):
+        return int(hashlib.md5(identity).hexdigest()[:16], 16)
+    return int(identity) & _MASK
+
+
+def seed_random_streams(seed):
+    '''
+    Sets the global seed of the random streams and restarts the numbering of
+    the streams, so that the objects created afterwards in the same order
+    draw the same random numbers.
+    '''
+    _streams['seed'] = seed
+    _streams['count'] = 0
+
+
+class RandomStream(object):
+    '''
+    A counter-based random number stream
+
+    Initialised as::
+
+        RandomStream([seed[, identity]])
+
+    ``seed``
+        The seed of the stream. By default, the global seed set with
+        :func:`seed_random_streams`, or a seed drawn from ``numpy.random``
+        if it was not set.
+    ``identity``
+        An integer or string identifying the stream. By default, the
+        number of streams created since the global seed was set (or ``0`` if
+        ``seed`` is given or if there is no global seed).
+
+    The methods ``rand``, ``randn``, ``random_sample``, ``standard_normal``,
+    ``standard_exponential``, ``geometric`` and ``binomial`` work as those
+    of ``numpy.random``, and ``sample(n, k)`` returns ``k`` distinct integers
+    in ``range(n)``. The attribute ``counter`` is the index of the next
+    number of the stream, and ``substream(i)`` returns an independent stream
+    for the ``i``-th part of a computation (e.g. the ``i``-th row of a
+    connection matrix), so that it can be computed in any order.
+    '''
+    def __init__(self, seed=None, identity=None):
+        if seed is None and _streams['seed'] is not None:
+            seed = _streams['seed']
+            if identity is None:
+                identity = _streams['count']
+                _streams['count'] += 1
+        elif seed is None:
+            # each stream has its own seed
+            seed = numpy.random.randint(2 ** 31 - 1)
+        if identity is None:
+            identity = 0
+        self.key = _mix((_mix(_identity_number(seed)) + _GAMMA * (_identity_number(identity) + 1)) & _MASK)
+        self.counter = 0
+
+    def substream(self, index):
+        '''
+        Returns the independent stream number ``index`` derived from this
+        stream (which does not depend on the counter).
+        '''
+        stream = RandomStream.__new__(RandomStream)
+        stream.key = _mix((self.key + _GAMMA * (_identity_number(index) + 1)) & _MASK)
+        stream.counter = 0
+        return stream
+
+    def _uint64(self, n):
+        z = uint64(self.key) + arange(self.counter + 1, self.counter + n + 1,
+                                      dtype=uint64) * uint64(_GAMMA)
+        self.counter += n
+        z ^= z >> uint64(30)
+        z *= uint64(0xBF58476D1CE4E5B9)
+        z ^= z >> uint64(27)
+        z *= uint64(0x94D049BB133111EB)
+        z ^= z >> uint64(31)
+        return z
+
+    def _uniform(self, n, positive=False):
+        # 53 random bits, in [0,1) or in (0,1] if positive is True
+        x = (self._uint64(n) >> uint64(11)).astype(float)
+        if positive:
+            x += 1
+        x *= 2. ** -53
+        return x
+
+    def random_sample(self, size=None):
+        if size is None:
+            return self._uniform(1)[0]
+        return self._uniform(int(numpy.prod(size))).reshape(size)
+
+    def rand(self, *shape):
+        if not shape:
+            return self.random_sample()
+        return self.random_sample(shape)
+
+    def standard_normal(self, size=None):
+        n = 1 if size is None else int(numpy.prod(size))
+        # Box-Muller transform
+        m = (n + 1) // 2
+        u = self._uniform(2 * m, positive=True)
+        r = sqrt(-2 * log(u[:m]))
+        theta = 2 * pi * u[m:]
+        z = hstack((r * cos(theta), r * sin(theta)))[:n]
+        if size is None:
+            return z[0]
+        return z.reshape(size)
+
+    def randn(self, *shape):
+        if not shape:
+            return self.standard_normal()
+        return self.standard_normal(shape)
+
+    def standard_exponential(self, size=None):
+        n = 1 if size is None else int(numpy.prod(size))
+        z = -log(self._uniform(n, positive=True))
+        if size is None:
+            return z[0]
+        return z.reshape(size)
+
+    def geometric(self, p, size=None):
+        n = 1 if size is None else int(numpy.prod(size))
+        # inversion, the numbers of trials are at least 1
+        k = maximum(ceil(log(self._uniform(n, positive=True)) / numpy.log1p(-p)), 1)
+        k = k.astype(int)
+        if size is None:
+            return k[0]
+        return k.reshape(size)
+
+    def sample(self, n, k):
+        '''
+        Returns ``k`` distinct integers of ``range(n)``, in random order.
+        '''
+        if 2 * k > n:
+            return self.rand(n).argsort()[:k]
+        while True:
+            # keep the numbers in the order of their first occurrence
+            x = (self.rand(2 * k + 10) * n).astype(int)
+            _, first = numpy.unique(x, return_index=True)
+            if len(first) >= k:
+                return x[numpy.sort(first)][:k]
+
+    def binomial(self, n, p, size=None):
+        n, p = broadcast_arrays(numpy.asarray(n, dtype=int), numpy.asarray(p, dtype=float))
+        if size is not None:
+            n = n * numpy.ones(size, dtype=int)
+            p = p * numpy.ones(size)
+        shape = n.shape
+        n, p = n.ravel(), p.ravel()
+        # symmetry: the number of failures is drawn for p>0.5
+        flip = p > 0.5
+        p = where(flip, 1 - p, p)
+        k = zeros(len(n), dtype=int)
+        small = n * p < 10
+        ind = small.nonzero()[0]
+        if len(ind):
+            k[ind] = self._binomial_inversion(n[ind], p[ind])
+        ind = (~small).nonzero()[0]
+        if len(ind):
+            k[ind] = self._binomial_btrd(n[ind], p[ind])
+        k[flip] = n[flip] - k[flip]
+        if size is None and shape == ():
+            return k[0]
+        return k.reshape(shape)
+
+    def _binomial_inversion(self, n, p):
+        # sequential search from 0 (for n*p<10 and p<=0.5), with one uniform
+        # number per draw
+        r = p / (1 - p)
+        pmf = (1 - p) ** n
+        u = self._uniform(len(n))
+        k = zeros(len(n), dtype=int)
+        active = (u > pmf).nonzero()[0]
+        u -= pmf
+        while len(active):
+            pmf[active] *= (n[active] - k[active]) / (k[active] + 1.) * r[active]
+            k[active] += 1
+            searching = (u[active] > pmf[active]) & (k[active] < n[active])
+            u[active] -= pmf[active]
+            active = active[searching]
+        return k
+
+    def _binomial_btrd(self, n, p):
+        # Transformed rejection with decomposition (Hormann, 1993), for
+        # n*p>=10 and p<=0.5, with an exact acceptance test (log-gamma)
+        nf = n.astype(float)
+        spq = sqrt(nf * p * (1 - p))
+        b = 1.15 + 2.53 * spq
+        a = -0.0873 + 0.0248 * b + 0.01 * p
+        c = nf * p + 0.5
+        alpha = (2.83 + 5.1 / b) * spq
+        vr = 0.92 - 4.2 / b
+        urvr = 0.86 * vr
+        m = floor((nf + 1) * p)
+        logfm = gammaln(m + 1) + gammaln(nf - m + 1)
+        logr = log(p / (1 - p))
+        k = zeros(len(n), dtype=int)
+        pending = arange(len(n))
+        while len(pending):
+            i = pending
+            v = self._uniform(len(i))
+            w = self._uniform(len(i), positive=True)
+            # quick acceptance in the centre of the hat
+            quick = v <= urvr[i]
+            u = where(quick, v / vr[i] - 0.43, w - 0.5)
+            tail = ~quick & (v < vr[i])
+            ut = v[tail] / vr[i][tail] - 0.93
+            u[tail] = sign(ut) * 0.5 - ut
+            v[tail] = w[tail] * vr[i][tail]
+            us = 0.5 - abs(u)
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                kk = floor((2 * a[i] / us + b[i]) * u + c[i])
+                candidates = (~quick & (kk >= 0) & (kk <= nf[i])).nonzero()[0]
+            accept = quick
+            if len(candidates):
+                j = i[candidates]
+                kc = kk[candidates]
+                vc = v[candidates] * alpha[j] / (a[j] / us[candidates] ** 2 + b[j])
+                # log(f(k)/f(m))
+                logratio = logfm[j] - gammaln(kc + 1) - gammaln(nf[j] - kc + 1) + (kc - m[j]) * logr[j]
+                with numpy.errstate(divide='ignore'):
+                    accept[candidates] = log(vc) <= logratio
+            k[i[accept]] = kk[accept]
+            pending = i[~accept]
+        return k
+
+
+def skip_ahead_indices(n, p, rng=None):
+    '''
+    Returns the sorted indices of the elements of ``range(n)`` that are
+    selected, each with independent probability ``p``, using the random
+    number generator ``rng`` (``numpy.random`` by default, or a
+    :class:`RandomStream`).
+
+    The gaps between selected indices are drawn from a geometric
+    distribution, so that the cost is proportional to the number of selected
+    indices rather than to ``n``.
+    '''
+    if rng is None:
+        rng = numpy.random
+    if p <= 0 or n == 0:
+        return zeros(0, dtype=int)
+    if p >= 0.25:
+        # skipping ahead is not worth it
+        return (rng.rand(n) < p).nonzero()[0]
+    chunks = []
+    last = -1
+    while last < n - 1:
+        # enough gaps to reach n most of the time
+        m = (n - 1 - last) * p
+        gaps = rng.geometric(p, size=int(m + 4 * sqrt(m) + 10))
+        indices = last + cumsum(gaps)
+        if indices[-1] >= n:
+            chunks.append(indices[indices < n])
+            break
+        chunks.append(indices)
+        last = indices[-1]
+    return hstack(chunks)
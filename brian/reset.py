@@ -50,6 +50,7 @@ from inspection import *
 from utils.documentation import flattened_docstring
 from globalprefs import *
 from log import *
+from randomstreams import RandomStream
 CReset = PythonReset = None
 
 def select_reset(expr, eqs, level=0):
@@ -185,6 +186,7 @@ class StringReset(Reset):
         self._namespace, unknowns = namespace(expr, level=level + 1, return_unknowns=True)
         self._prepared = False
         self._expr = expr
+        self._random = RandomStream()
         class Replacer(object):
             def __init__(self, func, n):
                 self.n = n
@@ -205,8 +207,8 @@ class StringReset(Reset):
             self._prepared = True
         spikes = P.LS.lastspikes()
         self._namespace['_spikes_'] = spikes
-        self._namespace['rand'] = self._Replacer(numpy.random.rand, len(spikes))
-        self._namespace['randn'] = self._Replacer(numpy.random.randn, len(spikes))
+        self._namespace['rand'] = self._Replacer(self._random.rand, len(spikes))
+        self._namespace['randn'] = self._Replacer(self._random.randn, len(spikes))
         self._namespace['t'] = P.clock._t
         for var in self._vars:
             self._namespace[var] = P.state(var)
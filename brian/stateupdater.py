@@ -58,6 +58,7 @@ from units import Quantity
 import warnings
 from log import *
 from globalprefs import *
+from noisebuffer import NoiseBuffer
 from experimental.codegen import *
 CStateUpdater = PythonStateUpdater = None
 
@@ -630,13 +631,16 @@ class ExponentialEulerStateUpdater(NonlinearStateUpdater):
 class SynapticNoise(StateUpdater):
     '''
     Synaptic noise mechanism, plugged into another StateUpdater.
+    
+    The Gaussian numbers are taken from a :class:`NoiseBuffer`.
     '''
-    def __init__(self, baseupdater, nstate, mu, sigma, clock=None):
+    def __init__(self, baseupdater, nstate, mu, sigma, clock=None, seed=None):
         '''
         baseupdater = source neuron StateUpdater
         nstate = index of synaptic state variable
         mu = mean synaptic input rate (per ms)
         sigma = s.d. of synaptic input per ms^{1/2}
+        seed = seed of the random number generator (optional)
         '''
         self.baseupdater = baseupdater
         self.nstate = nstate
@@ -648,6 +652,7 @@ class SynapticNoise(StateUpdater):
             self.sigma = sigma * clock.dt ** .5
         else:
             raise TypeError, "A time reference must be passed."
+        self.noise = NoiseBuffer('normal', seed=seed)
 
     def rest(self, P):
         self.baseupdater.rest(P)
@@ -659,7 +664,12 @@ class SynapticNoise(StateUpdater):
         P is the neuron group.
         '''
         self.baseupdater(P) # update the underlying model
-        P._S[self.nstate, :] += self.mu + random.randn(P._S.shape[1]) * self.sigma
+        # the buffer can be modified in place, which avoids allocations
+        z = self.noise.get(P._S.shape[1])
+        z *= float(self.sigma)
+        if self.mu:
+            z += float(self.mu)
+        P._S[self.nstate, :] += z
 
     def __repr__(self):
         return self.baseupdater.__repr__() + ' with synaptic noise on variable ' + str(self.nstate)
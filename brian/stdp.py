@@ -9,15 +9,18 @@ from network import NetworkOperation
 from neurongroup import NeuronGroup
 from stateupdater import get_linear_equations, LinearStateUpdater
 from scipy.linalg import expm
-from scipy import dot, eye, zeros, array, clip, exp, Inf
+from scipy import dot, eye, zeros, array, clip, exp, Inf, weave
 from stdunits import ms
-from connections import DelayConnection, DenseConstructionMatrix, SparseConnectionVector
+from connections import (DelayConnection, DenseConstructionMatrix, SparseConnectionVector,
+                         DenseConnectionMatrix, SparseConnectionMatrix)
+from synapses.synapticcode import weave_pathway_support_code, weave_assignment, \
+                                  translate_weave_expression
 import re
 from utils.documentation import flattened_docstring
 from copy import copy
 import warnings
 from itertools import izip
-from numpy import arange, floor
+from numpy import arange, floor, asarray, isfinite, diag, unique, hstack, linalg
 from clock import Clock
 from units import second
 from utils.separate_equations import separate_equations
@@ -32,7 +35,8 @@ class STDPUpdater(SpikeMonitor):
     '''
     Updates STDP variables at spike times
     '''
-    def __init__(self, source, C, vars, code, namespace, delay=0 * ms):
+    def __init__(self, source, C, vars, code, namespace, delay=0 * ms, weave_code=None,
+                 groups=None, reverse=False):
         '''
         source = source group
         C = connection
@@ -41,18 +45,255 @@ class STDPUpdater(SpikeMonitor):
         code = code to execute for every spike
         namespace = namespace for the code
         delay = transmission delay 
+        weave_code = compiled version of the code (WeaveSTDPCode), or None
+        groups = (group, other group) of event-driven variables, or None
+        reverse = True for postsynaptic spikes (columns of C)
         '''
         super(STDPUpdater, self).__init__(source, record=False, delay=delay)
         self._code = code # update code
         self._namespace = namespace # code namespace
         self.C = C
+        self._groups = groups
+        self._reverse = reverse
+        self._weave_code = weave_code
+        if weave_code is not None:
+            self._cpp_compiler = get_global_preference('weavecompiler')
+            self._extra_compile_args = ['-O3']
+            if self._cpp_compiler == 'gcc':
+                self._extra_compile_args += get_global_preference('gcc_options')
 
     def propagate(self, spikes):
         if len(spikes):
+            if self._weave_code is not None and self.weave_propagate(spikes):
+                return
+            if self._groups is not None:
+                self.update_variables(spikes)
             self._namespace['spikes'] = spikes
             self._namespace['w'] = self.C.W
             exec self._code in self._namespace
 
+    def update_variables(self, spikes):
+        '''
+        Brings the event-driven variables of the spiking neurons and of
+        their synaptic partners up to date.
+        '''
+        group, other_group = self._groups
+        # during the time step t, the variables of NeuronGroup objects have
+        # already been integrated to t+dt
+        t = group.clock._t + group.clock._dt
+        group.update_variables(spikes, t)
+        W = self.C.W
+        if isinstance(W, DenseConnectionMatrix):
+            other_group.update_variables(None, t)
+        elif self._reverse and isinstance(W, SparseConnectionMatrix):
+            other_group.update_variables(unique(W.get_cols_dataindices(spikes)[1]), t)
+        else:
+            vectors = W.get_cols(spikes) if self._reverse else W.get_rows(spikes)
+            other_group.update_variables(unique(hstack([v.ind for v in vectors])), t)
+
+    def weave_propagate(self, spikes):
+        '''
+        Runs the compiled code on all the spikes, returns ``False`` if the
+        connection matrix is not supported (the Python code is then used).
+        '''
+        W = self.C.W
+        local_dict = self._weave_code.matrix_arrays(W)
+        if local_dict is None:
+            log_debug('brian.stdp', 'Compiled STDP code not supported for ' +
+                      W.__class__.__name__ + ', using Python code.')
+            self._weave_code = None
+            return False
+        spikes = asarray(spikes, dtype=int)
+        local_dict['_spikes'] = spikes
+        local_dict['_nspikes'] = len(spikes)
+        for var in self._weave_code.vars:
+            local_dict['_v_' + var] = self._namespace[var]
+        if self._weave_code.event_driven:
+            group, other_group = self._groups
+            local_dict['_t'] = group.clock._t + group.clock._dt
+            local_dict['_lastt'] = group.lastt
+            local_dict['_lastt_other'] = other_group.lastt
+        weave.inline(self._weave_code.code(W), local_dict.keys(),
+                     local_dict=local_dict,
+                     support_code=weave_pathway_support_code,
+                     compiler=self._cpp_compiler,
+                     extra_compile_args=self._extra_compile_args)
+        return True
+
+
+class WeaveSTDPCode(object):
+    '''
+    C++ version of the code of an :class:`STDPUpdater`.
+
+    For each spike, the statements on the variables of the spiking neuron
+    are executed once and the statements on ``w`` in a loop over the
+    synapses of the corresponding row (presynaptic spikes) or column
+    (``reverse=True``, postsynaptic spikes) of the connection matrix,
+    followed by the clipping of ``w``. With a sparse matrix, this is a
+    single pass over the CSR data (or the column access arrays) for all the
+    spikes of the time step.
+
+    ``blocks`` is a list of pairs ``(synaptic, statements)``, where
+    ``synaptic`` is ``True`` for statements on ``w``. ``vars`` is the list of
+    STDP variables used by the code, which are passed with the prefix
+    ``_v_``.
+
+    With event-driven variables, ``decays`` is a pair of lists of
+    ``(var, m, b)`` for the equations ``dvar/dt=m*(var-b)`` of the variables
+    of the spiking neurons and of the other neurons. These variables are
+    brought up to date (to time ``_t``, with the last update times
+    ``_lastt`` and ``_lastt_other``) in the same pass, before they are used.
+    '''
+    def __init__(self, blocks, vars, reverse, wmin, wmax, decays=None):
+        clipcode = []
+        if isfinite(wmin):
+            clipcode.append('if(w<%r) w = %r;' % (float(wmin), float(wmin)))
+        if isfinite(wmax):
+            clipcode.append('if(w>%r) w = %r;' % (float(wmax), float(wmax)))
+        # the weights are clipped in the last loop over the synapses (the
+        # statements after it do not depend on w)
+        for k in range(len(blocks) - 1, -1, -1):
+            if blocks[k][0]:
+                blocks[k] = (True, blocks[k][1] + clipcode)
+                break
+        else:
+            if clipcode:
+                blocks.append((True, clipcode))
+        if decays is not None:
+            def decay_code(decays, i, lastt):
+                code = ['if(%s[%s]!=_t)' % (lastt, i), '{',
+                        '    const double _interval = _t-%s[%s];' % (lastt, i)]
+                for var, m, b in decays:
+                    x = '_v_%s[%s]' % (var, i)
+                    code.append('    %s = (%r)+(%s-(%r))*exp((%r)*_interval);' % (x, b, x, b, m))
+                return code + ['    %s[%s] = _t;' % (lastt, i), '}']
+            blocks.insert(0, (False, decay_code(decays[0], '_i', '_lastt')))
+            for k, (synaptic, statements) in enumerate(blocks):
+                if synaptic and decays[1]:
+                    blocks[k] = (True, decay_code(decays[1], '_j', '_lastt_other') + statements)
+            vars = sorted(set(vars).union(var for var, _, _ in decays[0] + decays[1]))
+        self.blocks = blocks
+        self.vars = vars
+        self.event_driven = decays is not None
+        self.reverse = reverse
+        self._codes = {}
+
+    def matrix_arrays(self, W):
+        '''
+        Returns the arrays of the connection matrix ``W`` used by the code,
+        or ``None`` if ``W`` is not supported.
+        '''
+        if isinstance(W, SparseConnectionMatrix) and W.alldata.dtype == float:
+            if not self.reverse:
+                return {'_rowind': W.rowind, '_allj': W.allj, '_alldata': W.alldata}
+            elif W.column_access:
+                return {'_colind': W.colind, '_colalli': W.colalli,
+                        '_allcoldataindices': W.allcoldataindices,
+                        '_alldata': W.alldata}
+        elif isinstance(W, DenseConnectionMatrix) and W.dtype == float and \
+                W.flags.c_contiguous:
+            return {'_W': asarray(W), '_nrows': W.shape[0], '_ncols': W.shape[1]}
+        return None
+
+    def code(self, W):
+        '''
+        Returns the C++ code for the connection matrix ``W``.
+        '''
+        structure = 'sparse' if isinstance(W, SparseConnectionMatrix) else 'dense'
+        if structure not in self._codes:
+            if structure == 'sparse' and not self.reverse:
+                loop = '''for(int _m=_rowind[_i]; _m<_rowind[_i+1]; _m++)
+        {
+            const int _j = _allj[_m];
+            double &w = _alldata[_m];'''
+            elif structure == 'sparse':
+                loop = '''for(int _m=_colind[_i]; _m<_colind[_i+1]; _m++)
+        {
+            const int _j = _colalli[_m];
+            double &w = _alldata[_allcoldataindices[_m]];'''
+            elif not self.reverse:
+                loop = '''for(int _j=0; _j<_ncols; _j++)
+        {
+            double &w = _W[_i*_ncols+_j];'''
+            else:
+                loop = '''for(int _j=0; _j<_nrows; _j++)
+        {
+            double &w = _W[_j*_ncols+_i];'''
+            body = []
+            for synaptic, statements in self.blocks:
+                if synaptic:
+                    body.append(loop + '\n            ' +
+                                '\n            '.join(statements) + '\n        }')
+                else:
+                    body.extend(statements)
+            self._codes[structure] = '''
+    for(int _k=0; _k<_nspikes; _k++)
+    {
+        const int _i = _spikes[_k];
+        %s
+    }
+    ''' % '\n        '.join(body)
+        return self._codes[structure]
+
+
+def _translate_stdp_expression(expr, names, used):
+    '''
+    Translates the Python expression ``expr`` to C, where ``names`` maps the
+    allowed identifiers to their C version, or returns ``None``. The STDP
+    variables used are added to the set ``used``.
+    '''
+    def translate_name(tok):
+        if tok not in names:
+            return None
+        if tok != 'w':
+            used.add(tok)
+        return names[tok]
+    return translate_weave_expression(expr, translate_name)
+
+
+def generate_weave_stdp_code(code, vars, other_vars, reverse, wmin, wmax, decays=None):
+    '''
+    Returns a :class:`WeaveSTDPCode` object for the (frozen) pre or post
+    STDP code ``code``, or ``None`` if it cannot be compiled.
+
+    ``vars`` are the variables of the spiking neurons, ``other_vars`` those
+    of the neurons on the other side of the synapses, which can only be used
+    in statements on ``w``. Only assignments (``=``, ``+=``, ``-=``, ``*=``,
+    ``/=``) of ``vars`` or ``w``, with arithmetic expressions and a few
+    mathematical functions (``exp``, ``clip``...), are supported. ``decays``
+    describes event-driven variables (see :class:`WeaveSTDPCode`).
+    '''
+    neuron_names = dict((var, '_v_' + var + '[_i]') for var in vars)
+    synapse_names = dict(neuron_names)
+    synapse_names.update((var, '_v_' + var + '[_j]') for var in other_vars)
+    synapse_names['w'] = 'w'
+    used = set()
+    blocks = []
+    for line in code.split('\n'):
+        line = line.split('#')[0].strip()
+        if not line:
+            continue
+        m = weave_assignment.match(line)
+        if m is None:
+            return None
+        var, op, expr = m.groups()
+        if var == 'w':
+            synaptic, lhs, names = True, 'w', synapse_names
+        elif var in vars:
+            synaptic, lhs, names = False, neuron_names[var], neuron_names
+            used.add(var)
+        else:
+            return None
+        rhs = _translate_stdp_expression(expr, names, used)
+        if rhs is None:
+            return None
+        statement = lhs + ' ' + op + ' ' + rhs + ';'
+        if blocks and blocks[-1][0] == synaptic:
+            blocks[-1][1].append(statement)
+        else:
+            blocks.append((synaptic, [statement]))
+    return WeaveSTDPCode(blocks, sorted(used), reverse, wmin, wmax, decays=decays)
+
 
 class DelayedSTDPUpdater(SpikeMonitor):
     def __init__(self, C, reverse, delay_expr, max_delay,
@@ -89,6 +330,56 @@ class DelayedSTDPUpdater(SpikeMonitor):
             exec self._code in self._namespace
 
 
+class EventDrivenSTDPGroup(NeuronGroup):
+    '''
+    Group of pre- or postsynaptic STDP variables, updated only when they are
+    used (at spike times).
+
+    The last update time of each neuron is stored (``lastt``) and the
+    variables are brought up to date with the analytical solution of their
+    equations, which must be linear and uncoupled (each variable only
+    depends on itself, e.g. ``dA/dt=-A/tau``), as :class:`STPUpdater` does
+    for STP. ``decays`` is the list of ``(var, m, b)`` for the equations
+    ``dvar/dt=m*(var-b)``.
+    '''
+    def __init__(self, N, model, clock=None):
+        NeuronGroup.__init__(self, N, model=model, clock=clock)
+        self.lastt = zeros(N) # last update
+        vars = model._diffeq_names
+        if not model.is_linear():
+            raise ValueError('Event-driven STDP variables need linear equations.')
+        try:
+            M, B = get_linear_equations(model)
+        except linalg.LinAlgError:
+            raise ValueError('Event-driven STDP variables need equations with a fixed point.')
+        if (M != diag(diag(M))).any():
+            raise ValueError('Event-driven STDP variables need uncoupled equations.')
+        # dX/dt = M(X-B) with M diagonal
+        self.decays = [(var, float(M[i, i]), float(B[i, 0])) for i, var in enumerate(vars)]
+
+    def update(self):
+        pass
+
+    def reinit(self, states=True):
+        NeuronGroup.reinit(self, states=states)
+        self.lastt[:] = 0
+
+    def update_variables(self, neurons=None, t=None):
+        '''
+        Brings the variables of the neurons ``neurons`` (all by default) up to
+        date, at time ``t`` (current time by default).
+        '''
+        if neurons is None:
+            neurons = slice(None)
+        if t is None:
+            t = self.clock._t
+        interval = t - self.lastt[neurons]
+        for var, m, b in self.decays:
+            x = self.state_(var)
+            x[neurons] = b + (x[neurons] - b) * exp(m * interval)
+        self.lastt[neurons] = t
+
+
 class STDP(NetworkOperation):
     '''
     Spike-timing-dependent plasticity    
@@ -115,6 +406,12 @@ class STDP(NetworkOperation):
         Presynaptic delay
     ``delay_post``
         Postsynaptic delay (backward propagating spike)
+    ``event_driven``
+        If ``True``, the pre- and postsynaptic variables are not integrated
+        at every time step but only updated when they are used, i.e., at
+        spike times (default ``False``). This requires linear equations where
+        each variable only depends on itself (e.g. exponential traces), and a
+        :class:`Connection` without heterogeneous delays.
     
     The STDP object works by specifying a set of differential equations
     associated to each synapse (``eqs``) and two rules to specify what should
@@ -170,6 +467,10 @@ class STDP(NetworkOperation):
         stdp.G_pre_monitors['A_pre']
         stdp.G_post_monitors['A_post']
     
+    With ``event_driven=True``, the variables accessed as ``stdp.A_pre`` are
+    brought up to date first, but those of ``pre_group`` and ``post_group``
+    are the values at the last spike of each neuron.
+    
     **Technical details**
     
     The equations are split into two groups, pre and post. Two groups are created
@@ -178,7 +479,8 @@ class STDP(NetworkOperation):
     and target of ``C`` via ``C``, spikes are also propagated to the respective
     groups created. At spike propagation time the weight values are updated.
     '''
-    def __init__(self, C, eqs, pre, post, wmin=0, wmax=Inf, level=0, clock=None, delay_pre=None, delay_post=None):
+    def __init__(self, C, eqs, pre, post, wmin=0, wmax=Inf, level=0, clock=None, delay_pre=None, delay_post=None,
+                 event_driven=False):
         '''
         C: connection object
         eqs: differential equations (with units)
@@ -187,10 +489,13 @@ class STDP(NetworkOperation):
         wmax: maximum weight (default unlimited)
         delay_pre: presynaptic delay
         delay_post: postsynaptic delay (backward propagating spike)
+        event_driven: update the variables at spike times only
         '''
         if get_global_preference('usecstdp') and get_global_preference('useweave'):
             from experimental.c_stdp import CSTDP
             log_warn('brian.stdp', 'Using experimental C STDP class.')
+            if event_driven:
+                log_warn('brian.stdp', 'Event-driven STDP variables are not supported by the C STDP class.')
             self.__class__ = CSTDP
             CSTDP.__init__(self, C, eqs, pre, post, wmin=wmin, wmax=wmax,
                            level=level + 1, clock=clock, delay_pre=delay_pre,
@@ -279,8 +584,16 @@ class STDP(NetworkOperation):
         post = '\n'.join(freeze(line.strip(), all_vars, post_namespace) for line in post.split('\n'))
 
         # Neuron groups
-        G_pre = NeuronGroup(len(C.source), model=sep_pre, clock=self.clock)
-        G_post = NeuronGroup(len(C.target), model=sep_post, clock=self.clock)
+        if event_driven:
+            if isinstance(C, DelayConnection):
+                raise ValueError('Event-driven STDP is not supported for DelayConnection.')
+            G_pre = EventDrivenSTDPGroup(len(C.source), model=sep_pre, clock=self.clock)
+            G_post = EventDrivenSTDPGroup(len(C.target), model=sep_post, clock=self.clock)
+            pre_groups, post_groups = (G_pre, G_post), (G_post, G_pre)
+        else:
+            G_pre = NeuronGroup(len(C.source), model=sep_pre, clock=self.clock)
+            G_post = NeuronGroup(len(C.target), model=sep_post, clock=self.clock)
+            pre_groups = post_groups = None
         G_pre._S[:] = 0
         G_post._S[:] = 0
         self.pre_group = G_pre
@@ -368,6 +681,19 @@ class STDP(NetworkOperation):
             self.contained_objects += self.G_post_monitors.values()
 
         else:
+            # Compiled code (the Python code is used if it cannot be compiled)
+            pre_weave_code = post_weave_code = None
+            if get_global_preference('useweave'):
+                pre_decays = post_decays = None
+                if event_driven:
+                    pre_decays, post_decays = (G_pre.decays, G_post.decays), (G_post.decays, G_pre.decays)
+                pre_weave_code = generate_weave_stdp_code(pre, vars_pre, vars_post, False, wmin, wmax,
+                                                          decays=pre_decays)
+                post_weave_code = generate_weave_stdp_code(post, vars_post, vars_pre, True, wmin, wmax,
+                                                           decays=post_decays)
+                if pre_weave_code is None or post_weave_code is None:
+                    log_warn('brian.stdp', 'STDP code cannot be compiled, using Python code.')
+
             # Indent and loop
             pre = re.compile('^', re.M).sub('    ', pre)
             post = re.compile('^', re.M).sub('    ', post)
@@ -408,8 +734,11 @@ class STDP(NetworkOperation):
                 delay_post = connection_delay - delay_pre
                 if delay_post < 0 * ms: raise AttributeError, "Postsynaptic delay is too large"
             # create forward and backward Connection objects or SpikeMonitor objects
-            pre_updater = STDPUpdater(C.source, C, vars=vars_pre, code=pre_code, namespace=pre_namespace, delay=delay_pre)
-            post_updater = STDPUpdater(C.target, C, vars=vars_post, code=post_code, namespace=post_namespace, delay=delay_post)
+            pre_updater = STDPUpdater(C.source, C, vars=vars_pre, code=pre_code, namespace=pre_namespace,
+                                      delay=delay_pre, weave_code=pre_weave_code, groups=pre_groups)
+            post_updater = STDPUpdater(C.target, C, vars=vars_post, code=post_code, namespace=post_namespace,
+                                       delay=delay_post, weave_code=post_weave_code, groups=post_groups,
+                                       reverse=True)
             updaters = [pre_updater, post_updater]
             self.contained_objects += [pre_updater, post_updater]
 
@@ -439,6 +768,8 @@ class STDP(NetworkOperation):
             # if the var_index attribute exists
             raise AttributeError
         G = self.var_group[name]
+        if isinstance(G, EventDrivenSTDPGroup):
+            G.update_variables()
         return G.state_(name)
 
     def __setattr__(self, name, val):
@@ -446,6 +777,8 @@ class STDP(NetworkOperation):
             object.__setattr__(self, name, val)
         else:
             G = self.var_group[name]
+            if isinstance(G, EventDrivenSTDPGroup):
+                G.update_variables()
             G.state_(name)[:] = val
 
 
@@ -480,10 +813,14 @@ class ExponentialSTDP(STDP):
         (or "soft bounds")
       * 'mixed': depression is multiplicative, potentiation is additive
     
+    ``event_driven``
+        If ``True``, the traces are only updated at spike times.
+    
     See documentation for :class:`STDP` for more details.
     '''
     def __init__(self, C, taup, taum, Ap, Am, interactions='all', wmin=0, wmax=None,
-                 update='additive', delay_pre=None, delay_post=None, clock=None):
+                 update='additive', delay_pre=None, delay_post=None, clock=None,
+                 event_driven=False):
         if wmax is None:
             raise AttributeError, "You must specify the maximum synaptic weight"
         wmax = float(wmax) # removes units
@@ -536,7 +873,8 @@ class ExponentialSTDP(STDP):
                     raise AttributeError, "There is no potentiation in STDP rule"
         else:
             raise AttributeError, "Unknown update type " + update
-        STDP.__init__(self, C, eqs=eqs, pre=pre, post=post, wmin=wmin, wmax=wmax, delay_pre=delay_pre, delay_post=delay_post, clock=clock)
+        STDP.__init__(self, C, eqs=eqs, pre=pre, post=post, wmin=wmin, wmax=wmax, delay_pre=delay_pre, delay_post=delay_post, clock=clock,
+                      event_driven=event_driven)
 
 if __name__ == '__main__':
     pass
@@ -22,11 +22,19 @@ Synaptic weights are modulated by the product u*x (in 0..1) (before update).
 from network import NetworkOperation
 from neurongroup import NeuronGroup
 from monitor import SpikeMonitor
-from scipy import zeros, exp, isscalar
-from connections import DelayConnection
+from scipy import zeros, ones, exp, isscalar, weave
+from numpy import asarray, arange, repeat, cumsum, bincount
+from connections import DelayConnection, SparseConnectionMatrix, DenseConnectionMatrix, \
+                        SparseConstructionMatrix, DenseConstructionMatrix
+from globalprefs import get_global_preference
 
 __all__ = ['STP']
 
+
+def _no_propagation(spikes):
+    # replaces the propagate method of connections propagated by STP objects
+    pass
+
 
 class STPGroup(NeuronGroup):
     '''
@@ -53,8 +61,8 @@ class STPUpdater(SpikeMonitor):
         # P is the group with the STP variables
         N = len(P)
         self.P = P
-        self.minvtaud = -1. / taud
-        self.minvtauf = -1. / tauf
+        self.minvtaud = -1. / asarray(taud, dtype=float)
+        self.minvtauf = -1. / asarray(tauf, dtype=float)
         self.U = U
         self.ux = P.ux
         self.x = P.x
@@ -62,34 +70,159 @@ class STPUpdater(SpikeMonitor):
         self.lastt = zeros(N) # last update
         self.clock = P.clock
 
+    def parameters(self, spikes):
+        '''
+        Returns U, -1/taud and -1/tauf for the neurons ``spikes``.
+        '''
+        return self.U, self.minvtaud, self.minvtauf
+
     def propagate(self, spikes):
-        interval = self.clock.t - self.lastt[spikes]
-        self.u[spikes] = self.U + (self.u[spikes] - self.U) * exp(interval * self.minvtauf)
-        tmp = 1 - self.u[spikes]
-        self.x[spikes] = 1 + (self.x[spikes] - 1) * exp(interval * self.minvtaud)
-        self.ux[spikes] = self.u[spikes] * self.x[spikes]
-        self.x[spikes] *= tmp
-        self.u[spikes] += self.U * tmp
-        self.lastt[spikes] = self.clock.t
+        # each variable is read and written once
+        U, minvtaud, minvtauf = self.parameters(spikes)
+        interval = self.clock._t - self.lastt[spikes]
+        u = U + (self.u[spikes] - U) * exp(interval * minvtauf)
+        x = 1 + (self.x[spikes] - 1) * exp(interval * minvtaud)
+        self.ux[spikes] = u * x
+        self.x[spikes] = x * (1 - u)
+        self.u[spikes] = u + U * (1 - u)
+        self.lastt[spikes] = self.clock._t
         self.P.LS.push(spikes)
 
-
+
 class STPUpdater2(STPUpdater):
     '''
     STP Updater where U, taud and tauf are vectors
     '''
+    def parameters(self, spikes):
+        return self.U[spikes], self.minvtaud[spikes], self.minvtauf[spikes]
+
+
+class SynapticSTPUpdater(SpikeMonitor):
+    '''
+    Event-driven updates of per-synapse STP variables, fused with the
+    propagation of spikes through the connection ``C``.
+
+    For each presynaptic spike, the variables u and x of the synapses of the
+    corresponding row of the connection matrix are brought up to date, the
+    target variable is increased by the weights times u*x, and u and x are
+    updated, in a single pass over the row (in C++ with weave). The
+    variables and parameters are arrays with one value per synapse, in the
+    order of the data of the connection matrix (``C.W.alldata`` for a sparse
+    matrix, row-major order for a dense matrix).
+    '''
+    def __init__(self, source, C, taud, tauf, U, delay=0):
+        SpikeMonitor.__init__(self, source, record=False, delay=delay)
+        W = C.W
+        if isinstance(W, SparseConnectionMatrix):
+            n = W.nnz
+        elif isinstance(W, DenseConnectionMatrix):
+            n = W.shape[0] * W.shape[1]
+        else:
+            raise TypeError('Per-synapse STP requires a sparse or dense connection matrix.')
+        self.C = C
+
+        def synaptic_parameter(value):
+            value = asarray(value, dtype=float)
+            if value.size != 1 and value.shape != (n,):
+                raise ValueError('STP parameters should be scalars or arrays with one value per synapse.')
+            return value * ones(n)
+        self.U = synaptic_parameter(U)
+        self.minvtaud = -1. / synaptic_parameter(taud)
+        self.minvtauf = -1. / synaptic_parameter(tauf)
+        self.u = self.U.copy()
+        self.x = ones(n)
+        # all the synapses of a presynaptic neuron are updated together
+        self.lastt = zeros(len(source)) # last update
+        self.clock = source.clock
+        self._useweave = get_global_preference('useweave')
+        self._cpp_compiler = get_global_preference('weavecompiler')
+        self._extra_compile_args = ['-O3']
+        if self._cpp_compiler == 'gcc':
+            self._extra_compile_args += get_global_preference('gcc_options')
+
     def propagate(self, spikes):
-        interval = self.clock.t - self.lastt[spikes]
-        self.u[spikes] = self.U[spikes] + (self.u[spikes] - self.U[spikes]) * exp(interval * self.minvtauf[spikes])
-        tmp = 1 - self.u[spikes]
-        self.x[spikes] = 1 + (self.x[spikes] - 1) * exp(interval * self.minvtaud[spikes])
-        self.ux[spikes] = self.u[spikes] * self.x[spikes]
-        self.x[spikes] *= tmp
-        self.u[spikes] += self.U[spikes] * tmp
-        self.lastt[spikes] = self.clock.t
-        self.P.LS.push(spikes)
+        if not len(spikes):
+            return
+        spikes = asarray(spikes, dtype=int)
+        W = self.C.W
+        target = self.C.target._S[self.C.nstate]
+        t = self.clock._t
+        if self._useweave:
+            local_dict = {'_spikes': spikes, '_nspikes': len(spikes), '_t': t,
+                          '_lastt': self.lastt, '_target': target,
+                          '_U': self.U, '_minvtaud': self.minvtaud,
+                          '_minvtauf': self.minvtauf, '_stp_u': self.u,
+                          '_stp_x': self.x}
+            if isinstance(W, SparseConnectionMatrix):
+                code = synaptic_stp_code_sparse
+                local_dict.update(_w=W.alldata, _rowind=W.rowind, _allj=W.allj)
+            else:
+                code = synaptic_stp_code_dense
+                local_dict.update(_w=asarray(W).reshape(-1), _ncols=W.shape[1])
+            weave.inline(code, local_dict.keys(), local_dict=local_dict,
+                         compiler=self._cpp_compiler,
+                         extra_compile_args=self._extra_compile_args)
+            return
+        if isinstance(W, SparseConnectionMatrix):
+            w = W.alldata
+            starts = asarray(W.rowind[spikes], dtype=int)
+            counts = asarray(W.rowind[spikes + 1], dtype=int) - starts
+        else:
+            w = asarray(W).reshape(-1)
+            starts = spikes * W.shape[1]
+            counts = W.shape[1] * ones(len(spikes), dtype=int)
+        # synapses of the spiking neurons
+        s = arange(counts.sum()) - repeat(cumsum(counts) - counts, counts) + repeat(starts, counts)
+        interval = repeat(t - self.lastt[spikes], counts)
+        U = self.U[s]
+        u = U + (self.u[s] - U) * exp(interval * self.minvtauf[s])
+        x = 1 + (self.x[s] - 1) * exp(interval * self.minvtaud[s])
+        if isinstance(W, SparseConnectionMatrix):
+            j = W.allj[s]
+        else:
+            j = s % W.shape[1]
+        target += bincount(j, weights=w[s] * u * x, minlength=len(target))
+        self.x[s] = x * (1 - u)
+        self.u[s] = u + U * (1 - u)
+        self.lastt[spikes] = t
+
+
+synaptic_stp_code_sparse = '''
+for(int _k=0; _k<_nspikes; _k++)
+{
+    const int _i = _spikes[_k];
+    const double _interval = _t-_lastt[_i];
+    _lastt[_i] = _t;
+    for(int _s=_rowind[_i]; _s<_rowind[_i+1]; _s++)
+    {
+        const double _u = _U[_s]+(_stp_u[_s]-_U[_s])*exp(_interval*_minvtauf[_s]);
+        const double _x = 1+(_stp_x[_s]-1)*exp(_interval*_minvtaud[_s]);
+        _target[_allj[_s]] += _w[_s]*_u*_x;
+        _stp_x[_s] = _x*(1-_u);
+        _stp_u[_s] = _u+_U[_s]*(1-_u);
+    }
+}
+'''
+
+synaptic_stp_code_dense = '''
+for(int _k=0; _k<_nspikes; _k++)
+{
+    const int _i = _spikes[_k];
+    const double _interval = _t-_lastt[_i];
+    _lastt[_i] = _t;
+    for(int _j=0; _j<_ncols; _j++)
+    {
+        const int _s = _i*_ncols+_j;
+        const double _u = _U[_s]+(_stp_u[_s]-_U[_s])*exp(_interval*_minvtauf[_s]);
+        const double _x = 1+(_stp_x[_s]-1)*exp(_interval*_minvtaud[_s]);
+        _target[_j] += _w[_s]*_u*_x;
+        _stp_x[_s] = _x*(1-_u);
+        _stp_u[_s] = _u+_U[_s]*(1-_u);
+    }
+}
+'''
+
 
-
 class SynapticDepressionUpdater(SpikeMonitor):
     '''
     Event-driven updates of STP variables.
@@ -142,15 +275,38 @@ class STP(NetworkOperation):
     
     Synaptic weights are modulated by the product ``u*x`` (in 0..1) (before update).
     
+    The parameters ``taud``, ``tauf`` and ``U`` can be scalars or arrays with
+    one value per presynaptic neuron, and the variables are stored per
+    presynaptic neuron (in the group ``stp.vars``). With ``per_synapse=True``,
+    the variables are stored per synapse and the parameters can be scalars or
+    arrays with one value per synapse (in the order of ``C.W.alldata`` for a
+    sparse matrix, row-major order for a dense matrix); the variables are then
+    the arrays ``stp.vars.u`` and ``stp.vars.x``. In this case, the spikes are
+    propagated through ``C`` by the STP object, in the same pass as the STP
+    updates, and ``C`` must have a sparse or dense matrix. The ``propagate``
+    method of ``C`` is then disabled (its source and delay are not changed),
+    so that ``C`` should not be used by another STP object.
+    
     Reference:
     
     * Markram et al (1998). "Differential signaling via the same axon of
       neocortical pyramidal neurons", PNAS.
     '''
-    def __init__(self, C, taud, tauf, U):
+    def __init__(self, C, taud, tauf, U, per_synapse=False):
         if isinstance(C, DelayConnection):
             raise AttributeError, "STP does not handle heterogeneous connections yet."
+        if per_synapse and not isinstance(C.W, (SparseConnectionMatrix, DenseConnectionMatrix,
+                                                SparseConstructionMatrix, DenseConstructionMatrix)):
+            raise TypeError('Per-synapse STP requires a sparse or dense connection matrix.')
         NetworkOperation.__init__(self, lambda:None, clock=C.source.clock)
+        if per_synapse:
+            C.compress()
+            updater = SynapticSTPUpdater(C.source, C, taud, tauf, U, delay=C.delay * C.source.clock.dt)
+            self.contained_objects = [updater]
+            # the updater propagates the spikes
+            C.propagate = _no_propagation
+            self.vars = updater
+            return
         N = len(C.source)
         P = STPGroup(N, clock=C.source.clock)
         P.x = 1
@@ -1,2 +1,3 @@
 from synapses import *
 from synaptic_equations import *
+from synapsesfile import *
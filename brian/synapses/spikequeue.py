@@ -5,30 +5,32 @@ The spike queue class stores future synaptic events
 produced by a given presynaptic neuron group (or postsynaptic for backward
 propagation in STDP).
 
-The structure X is a 2D array, where row is the time bin and column
-is the position in that bin (each row is a stack) .
-The array is circular in the time dimension. There is a 1D array (n) giving the
-position of the last added event in each time bin.
-The 2D array is dynamic in the column direction.
-The row corresponding to current time is stored in currenttime.
-X_flat is a flattened view of X.
+The structure is a circular array of time bins, each bin being a stack of
+target synapse indexes. The bins are stored in a single 1D array (the pool):
+bin d occupies pool[start[d]:start[d]+capacity[d]], and there is a 1D array
+(n) giving the number of events in each time bin. Each bin grows
+independently when it is full (it is moved to the end of the pool with twice
+the capacity), and shrinks back when it is much larger than its mean
+occupancy. When the free space between bins becomes too large, the pool is
+compacted.
+The bin corresponding to current time is stored in currenttime.
 
 Main methods:
 * peek()
-    Outputs the current events: we simply get the row corresponding to
+    Outputs the current events: we simply get the bin corresponding to
     currenttime, so this is fast. We then shift the cursor of the circular
-    array by one row: next().
+    array by one bin: next().
 * insert(delay, target, offset=None)
     Insert events in the queue. Each presynaptic neuron has a corresponding
     array of target synapses and corresponding delays. We must push each target
-    synapse (index) on top of the stack (row) corresponding to the delay. If all synapses
+    synapse (index) on top of the stack (bin) corresponding to the delay. If all synapses
     have different delays, this is relatively easy to vectorise. It is a bit
     more difficult if there are synapses with the same delays.
     For a given presynaptic neuron, each synaptic delay corresponds to coordinates
     (i,j) in the circular array of stacks, where i is the delay (stack index and
     j is index relative to the top of the stack (0=top, 1=1 above top).
-    The absolute location in the structure is then calculated as n[i]+j, where
-    n[i] is the location of the top of stack i. The only difficulty is to calculate
+    The absolute location in the structure is then calculated as start[i]+n[i]+j,
+    where n[i] is the location of the top of stack i. The only difficulty is to calculate
     j, and in Python this requires sorting (see development mailing list).
     It can be preprocessed if event feeding involves a loop over presynaptic spikes
     (if it's vectorised then it's not possible anymore). In this case it takes K*4
@@ -43,6 +45,15 @@ Main methods:
     The function executes different codes (different strategies) depending on whether
     offsets are precomputed or not, and on whether delays are heterogeneous or
     homogeneous.
+* propagate_C()
+    With weave, all the events produced by the spikes are inserted in a single
+    C loop over spikes and synapses, using the synapses in CSR format (see
+    synapses_csr()).
+* statistics()
+    Peak and mean occupancy of each bin.
+
+If the C++ extension module in brian.experimental.cspikequeue is compiled,
+the CSpikeQueue class (same interface) is used by Synapses instead.
 """
 import numpy as np
 try:
@@ -54,11 +65,24 @@ from scipy import weave
 from brian.globalprefs import get_global_preference, exists_global_preference, define_global_preference
 from brian.monitor import SpikeMonitor
 from brian.stdunits import ms
+from brian.log import log_info
 import warnings
 
-__all__=['SpikeQueue']
+__all__=['SpikeQueue', 'synapses_csr', 'synaptic_events', 'ranks', 'has_cspikequeue']
 
 INITIAL_MAXSPIKESPER_DT = 1
+# A bin shrinks when its capacity is SHRINK_FACTOR times larger than needed
+# for twice its mean occupancy
+SHRINK_FACTOR = 4
+# The pool is compacted when more than this fraction of it is free space
+# between bins
+MAX_FRAGMENTATION = 0.5
+
+def _capacity(nevents):
+    '''
+    Capacity of a bin for nevents (the smallest power of 2 above).
+    '''
+    return int(2**np.ceil(np.log2(max(nevents, 1))))
 
 class SpikeQueue(SpikeMonitor):
     '''Spike queue
@@ -78,8 +102,8 @@ class SpikeQueue(SpikeMonitor):
         during the simulation (in which case offsets should not be
         precomputed).
     ``maxevents = INITIAL_MAXSPIKESPER_DT``
-        The initial size of the queue for each timestep. Note that the data
-        structure automatically grows to the required size, and therefore this
+        The initial size of each time bin. Note that the bins
+        automatically grow to the required size, and therefore this
         option is generally not useful.
     ``precompute_offsets = True``
         A flag to precompute offsets. By default, offsets (an internal array
@@ -91,10 +115,19 @@ class SpikeQueue(SpikeMonitor):
 
     **Data structure** 
     
-    A spike queue is implemented as a 2D array ``X`` that is circular in the time
-    direction (rows) and dynamic in the events direction (columns). The
-    row index corresponding to the current timestep is ``currentime``.
-    Each element contains the target synapse index.
+    A spike queue is implemented as a circular array of time bins, each
+    bin being a stack of target synapse indexes. The bins are stored in a
+    single array ``pool``: bin ``d`` is ``pool[start[d]:start[d]+capacity[d]]``
+    and contains ``n[d]`` events. The bin corresponding to the current
+    timestep is ``currenttime``.
+    
+    Each bin grows independently when it overflows (its capacity is
+    doubled and it is moved to the end of the pool), so that a burst of
+    events in one bin does not resize the others. After the burst, when a
+    bin is emptied and its capacity is more than ``SHRINK_FACTOR`` times
+    what is needed for twice its mean occupancy, it shrinks back. The pool is
+    compacted when the free space between bins is larger than
+    ``MAX_FRAGMENTATION`` times its size.
 
     The class is implemented as a :class:`SpikeMonitor`, so that the propagate()
     method is called at each timestep (of the monitored group).
@@ -115,6 +148,8 @@ class SpikeQueue(SpikeMonitor):
         Precompute all offsets corresponding to delays. This assumes that
         delays will not change during the simulation. If they do (between two
         runs for example), then this method can be called.
+        
+    .. automethod:: statistics
     
     **Offsets**
     
@@ -139,14 +174,16 @@ class SpikeQueue(SpikeMonitor):
         if max_delay>0: # do not precompute offsets if delays can change
             self._precompute_offsets=False
         
-        # number of time steps, maximum number of spikes per time step
+        # number of time steps
         nsteps = int(np.floor((max_delay)/(self.source.clock.dt)))+1
-        self.X = np.zeros((nsteps, maxevents), dtype = self.synapses[0].dtype) # target synapses
-        self.X_flat = self.X.reshape(nsteps*maxevents,)
+        self._mincapacity = _capacity(maxevents)
+        self._allocate(nsteps)
         self.currenttime = 0
-        self.n = np.zeros(nsteps, dtype = int) # number of events in each time step
         
-        self._offsets = None # precalculated offsets
+        self._offsets = None # precalculated offsets (in the CSR order)
+        self._delays_flat = None # delays in the CSR order
+        self._synapses_ind = None # synapses in CSR format
+        self._synapses_flat = None
         
         # Compiled version
         self._useweave = get_global_preference('useweave')
@@ -163,39 +200,49 @@ class SpikeQueue(SpikeMonitor):
         #useweave=get_global_preference('useweave')
         #compiler=get_global_preference('weavecompiler')
 
+    def _allocate(self, nsteps):
+        '''
+        Creates an empty structure with nsteps bins.
+        '''
+        self.n = np.zeros(nsteps, dtype = int) # number of events in each time step
+        self.capacity = self._mincapacity*np.ones(nsteps, dtype = int)
+        self.start = np.arange(nsteps)*self._mincapacity
+        self.pool = np.zeros(nsteps*self._mincapacity, dtype = self.synapses[0].dtype) # target synapses
+        self._pool_end = nsteps*self._mincapacity # end of the allocated bins in the pool
+        self._free = 0 # free space between bins
+        # Statistics
+        self._peak = np.zeros(nsteps, dtype = int)
+        self._total = np.zeros(nsteps)
+        self._count = np.zeros(nsteps, dtype = int)
+
     def compress(self):
         '''
-        This is called the first time the network is run. The size of the
-        of the data structure (number of rows) is adjusted to fit the maximum
+        This is called the first time the network is run. The number of
+        time bins is adjusted to fit the maximum
         delay in ``delays'', if necessary. Offsets are calculated, unless
         the option ``precompute_offsets'' is set to False. A flag is set if
         delays are homogeneous, in which case insertion will use a faster method.
         '''
         nsteps=max(self.delays)+1
         # Check whether some delays are too long
-        if (self._max_delay>0) and (nsteps>self.X.shape[0]):
+        if (self._max_delay>0) and (nsteps>len(self.n)):
             raise ValueError,"Synaptic delays exceed maximum delay"
         
         if hasattr(self, '_iscompressed') and self._iscompressed:
             return
         self._iscompressed = True
-        # Adjust the maximum delay and number of events per timestep if necessary
-        maxevents=self.X.shape[1]
-        if maxevents==INITIAL_MAXSPIKESPER_DT: # automatic resize
-            maxevents=max(INITIAL_MAXSPIKESPER_DT,max([len(targets) for targets in self.synapses]))
         # Check if homogeneous delays
         if self._max_delay>0:
             self._homogeneous=False
         else:
             self._homogeneous=(nsteps==min(self.delays)+1)
         # Resize
-        if (nsteps>self.X.shape[0]) or (maxevents>self.X.shape[1]): # Resize
-            nsteps=max(nsteps,self.X.shape[0]) # Choose max_delay if is is larger than the maximum delay
-            maxevents=max(maxevents,self.X.shape[1])
-            self.X = np.zeros((nsteps, maxevents), dtype = self.synapses[0].dtype) # target synapses
-            self.X_flat = self.X.reshape(nsteps*maxevents,)
-            self.n = np.zeros(nsteps, dtype = int) # number of events in each time step
+        if nsteps>len(self.n):
+            self._allocate(nsteps)
 
+        # Synapses in CSR format, so that the events of all spikes are
+        # gathered in a single operation
+        self._synapses_ind, self._synapses_flat = synapses_csr(self.synapses)
         # Precompute offsets
         if (self._offsets is None) and self._precompute_offsets:
             self.precompute_offsets()
@@ -205,16 +252,49 @@ class SpikeQueue(SpikeMonitor):
         '''
         Advances by one timestep
         '''
-        self.n[self.currenttime]=0 # erase
-        self.currenttime=(self.currenttime+1) % len(self.n)
+        d=self.currenttime
+        nevents=self.n[d]
+        # Statistics
+        if nevents>self._peak[d]:
+            self._peak[d]=nevents
+        self._total[d]+=nevents
+        self._count[d]+=1
+        self.n[d]=0 # erase
+        # Shrink the bin after a burst
+        if self.capacity[d]>SHRINK_FACTOR*self._mincapacity:
+            capacity=max(self._mincapacity,_capacity(2*self._total[d]/self._count[d]))
+            if self.capacity[d]>=SHRINK_FACTOR*capacity:
+                self._shrink_bin(d,capacity)
+        self.currenttime=(d+1) % len(self.n)
         
     def peek(self):
         '''
         Returns the all the synaptic events corresponding to the current time,
         as an array of synapse indexes.
-        '''      
-        return self.X[self.currenttime,:self.n[self.currenttime]]
+        '''
+        start=self.start[self.currenttime]
+        return self.pool[start:start+self.n[self.currenttime]]
+    
+    def statistics(self):
+        '''
+        Returns the peak and mean number of events in each time bin, as two
+        arrays (indexed by bin, not by delay since the structure is circular),
+        calculated over the emptied bins. Useful to monitor the memory used
+        by the structure, which is ``len(self.pool)``.
+        '''
+        mean=self._total/np.maximum(self._count,1)
+        return self._peak.copy(), mean
     
+    def _pending_events(self):
+        '''
+        Returns the list of arrays of future events, for each delay
+        (starting with the current time). The content of the queue is
+        unchanged.
+        '''
+        nsteps=len(self.n)
+        bins=(self.currenttime+np.arange(nsteps)) % nsteps
+        return [self.pool[self.start[d]:self.start[d]+self.n[d]].copy() for d in bins]
+
     def _update_delays(self, delays):
         '''
         Internal method to update the delays, used by the Synapses class when the delays are dynamically varied.
@@ -223,16 +303,37 @@ class SpikeQueue(SpikeMonitor):
         #log_debug('brian.synapses.spikequeue', 'Updating delays...')
         self.delays = np.array(np.floor(delays/self.source.clock.dt), dtype = int)+1
     
+    def update_synapses(self):
+        '''
+        Updates the structures derived from the synapses (offsets and CSR
+        arrays), when synapse indexes have changed before the run.
+        '''
+        if self._synapses_ind is not None:
+            self._synapses_ind, self._synapses_flat = synapses_csr(self.synapses)
+        if self._offsets is not None:
+            self.precompute_offsets()
+
     def precompute_offsets(self):
         '''
         Precompute all offsets corresponding to delays. This assumes that
         delays will not change during the simulation. If they do (between two
         runs for example), then this method can be called.
+        
+        Offsets and delays are stored in the CSR order of the synapses (see
+        :func:`synapses_csr`), i.e., the offsets of the synapses of neuron
+        ``i`` are ``_offsets[_synapses_ind[i]:_synapses_ind[i+1]]``.
         '''
-        self._offsets=[]
-        for i in range(len(self.synapses)):
-            delays=self.delays[self.synapses[i].data]
-            self._offsets.append(self.offsets(delays))
+        if self._synapses_ind is None:
+            self._synapses_ind, self._synapses_flat = synapses_csr(self.synapses)
+        ind, flat = self._synapses_ind, self._synapses_flat
+        self._delays_flat = np.array(self.delays[flat], dtype=int)
+        # offsets are ranks among synapses with the same presynaptic neuron
+        # and delay, which are calculated for all neurons at once
+        if len(flat):
+            neurons = np.repeat(np.arange(len(ind)-1), np.diff(ind))
+            self._offsets = ranks(neurons*(self._delays_flat.max()+1)+self._delays_flat)
+        else:
+            self._offsets = np.zeros(0, dtype=int)
     
     def offsets(self, delay):
         '''
@@ -243,24 +344,11 @@ class SpikeQueue(SpikeMonitor):
         
             [7,5,7,3,7,5] -> [0,0,1,0,2,1]
             
-        The code is complex because tricks are needed for vectorisation.
+        See :func:`ranks`.
         '''
         if self._useweave:
             return self.offsets_C(delay)
-        # We use merge sort because it preserves the input order of equal
-        # elements in the sorted output
-        I = np.argsort(delay,kind='mergesort')
-        xs = delay[I]
-        J = xs[1:]!=xs[:-1]
-        #K = xs[1:]==xs[:-1]
-        A = np.hstack((0, np.cumsum(J)))
-        #B = np.hstack((0, np.cumsum(K)))
-        B = np.hstack((0, np.cumsum(-J)))
-        BJ = np.hstack((0, B[J]))
-        ei = B-BJ[A]
-        ofs = np.zeros_like(delay)
-        ofs[I] = np.array(ei,dtype=ofs.dtype) # maybe types should be signed?
-        return ofs
+        return ranks(delay)
            
     def insert(self, delay, target, offset=None):
         '''
@@ -283,16 +371,16 @@ class SpikeQueue(SpikeMonitor):
         if offset is None:
             offset=self.offsets(delay)
         
-        # Calculate row indexes in the data structure
+        # Calculate bin indexes in the data structure
         timesteps = (self.currenttime + delay) % len(self.n)
-        # (Over)estimate the number of events to be stored, to resize the array
-        # It's an overestimation for the current time, but I believe a good one
-        # for future events
-        m=max(self.n)+len(target)
-        if (m >= self.X.shape[1]): # overflow
-            self.resize(m+1)
+        # Grow the bins that overflow
+        top = self.n[timesteps]+offset+1
+        overflow = top>self.capacity[timesteps]
+        if overflow.any():
+            for d in np.unique(timesteps[overflow]):
+                self._grow_bin(d, top[timesteps==d].max())
         
-        self.X_flat[timesteps*self.X.shape[1]+offset+self.n[timesteps]]=target
+        self.pool[self.start[timesteps]+offset+self.n[timesteps]]=target
         self.n[timesteps] += offset+1 # that's a trick (to update stack size)
         # Note: the trick can only work if offsets are ordered in the right way
         
@@ -308,29 +396,84 @@ class SpikeQueue(SpikeMonitor):
         '''
         timestep = (self.currenttime + delay) % len(self.n)
         nevents=len(target)
-        m = self.n[timestep]+nevents+1 # If overflow, then at least one self.n is bigger than the size
-        if (m >= self.X.shape[1]):
-            self.resize(m+1) # was m previously (not enough)
-        k=timestep*self.X.shape[1]+self.n[timestep]
-        self.X_flat[k:k+nevents]=target
+        m = self.n[timestep]+nevents
+        if m>self.capacity[timestep]:
+            self._grow_bin(timestep, m)
+        k=self.start[timestep]+self.n[timestep]
+        self.pool[k:k+nevents]=target
         self.n[timestep]+=nevents
         
     def resize(self, maxevents):
         '''
-        Resizes the underlying data structure (number of columns = spikes per dt).
-        
-        ``maxevents``
-            The new number of columns.It will be rounded to the closest power of 2.
-        '''
-        # old and new sizes
-        old_maxevents = self.X.shape[1]
-        new_maxevents = int(2**np.ceil(np.log2(maxevents))) # maybe 2 is too large
-        # new array
-        newX = np.zeros((self.X.shape[0], new_maxevents), dtype = self.X.dtype)
-        newX[:, :old_maxevents] = self.X[:, :old_maxevents] # copy old data
-        
-        self.X = newX
-        self.X_flat = self.X.reshape(self.X.shape[0]*new_maxevents,)
+        Resizes all time bins so that they can contain at least ``maxevents``
+        events (rounded to the closest power of 2 above).
+        '''
+        capacity=_capacity(maxevents)
+        if (self.capacity<capacity).any():
+            self._compact(np.maximum(self.capacity,capacity))
+
+    def _grow_bin(self, d, nevents):
+        '''
+        Grows bin ``d`` so that it can contain ``nevents``: its capacity is
+        the power of 2 above and it is moved to the end of the pool (or
+        extended in place if it is already at the end).
+        '''
+        capacity=_capacity(nevents)
+        start=self.start[d]
+        if start+self.capacity[d]==self._pool_end: # last bin: extend in place
+            self._reserve(start+capacity)
+            self._pool_end=start+capacity
+        elif self._free+self.capacity[d]>MAX_FRAGMENTATION*(self._pool_end+capacity):
+            new_capacity=self.capacity.copy()
+            new_capacity[d]=capacity
+            self._compact(new_capacity)
+            return
+        else:
+            self._reserve(self._pool_end+capacity)
+            n=self.n[d]
+            self.pool[self._pool_end:self._pool_end+n]=self.pool[start:start+n]
+            self._free+=self.capacity[d]
+            self.start[d]=self._pool_end
+            self._pool_end+=capacity
+        self.capacity[d]=capacity
+
+    def _shrink_bin(self, d, capacity):
+        '''
+        Shrinks the (empty) bin ``d`` to the given capacity, and compacts the
+        pool if there is too much free space.
+        '''
+        if self.start[d]+self.capacity[d]==self._pool_end:
+            self._pool_end=self.start[d]+capacity
+        else:
+            self._free+=self.capacity[d]-capacity
+        self.capacity[d]=capacity
+        if self._free>MAX_FRAGMENTATION*self._pool_end or len(self.pool)>2*self._pool_end:
+            self._compact(self.capacity)
+
+    def _reserve(self, size):
+        '''
+        Makes sure that the pool has at least the given size (doubling it if
+        necessary).
+        '''
+        if size>len(self.pool):
+            pool=np.zeros(max(size,2*len(self.pool)),dtype=self.pool.dtype)
+            pool[:self._pool_end]=self.pool[:self._pool_end]
+            self.pool=pool
+
+    def _compact(self, capacity):
+        '''
+        Rebuilds the pool with contiguous bins of the given capacities.
+        '''
+        start=np.zeros(len(self.n),dtype=int)
+        np.cumsum(capacity[:-1],out=start[1:])
+        pool=np.zeros(start[-1]+capacity[-1],dtype=self.pool.dtype)
+        for d in self.n.nonzero()[0]:
+            pool[start[d]:start[d]+self.n[d]]=self.pool[self.start[d]:self.start[d]+self.n[d]]
+        self.pool=pool
+        self.start=start
+        self.capacity=np.array(capacity,dtype=int)
+        self._pool_end=len(pool)
+        self._free=0
         
     def propagate(self, spikes):
         '''
@@ -339,24 +482,79 @@ class SpikeQueue(SpikeMonitor):
         '''
         if len(spikes):
 #            print '(Python) In propagate: spikes = ', spikes
-            if self._homogeneous: # homogeneous delays
-                synaptic_events=np.hstack([self.synapses[i].data for i in spikes]) # could be not efficient
-                self.insert_homogeneous(self.delays[0],synaptic_events)
+            if self._useweave:
+                self.propagate_C(spikes)
+            elif self._homogeneous: # homogeneous delays
+                events=synaptic_events(self._synapses_ind, self._synapses_flat, spikes)
+                if len(events):
+                    self.insert_homogeneous(self.delays[0],events)
             elif self._offsets is None: # vectorise over synaptic events
                 # there are no precomputed offsets, this is the case (in particular) when there are dynamic delays
-                synaptic_events=np.hstack([self.synapses[i].data for i in spikes])
-                if len(synaptic_events):
-                    delay = self.delays[synaptic_events]
-                    self.insert(delay, synaptic_events)
+                events=synaptic_events(self._synapses_ind, self._synapses_flat, spikes)
+                if len(events):
+                    delay = self.delays[events]
+                    self.insert(delay, events)
             else: # offsets are precomputed
+                # events of different neurons may have the same offsets,
+                # so they are inserted neuron by neuron
+                ind, flat = self._synapses_ind, self._synapses_flat
                 for i in spikes:
-                    synaptic_events=self.synapses[i].data # assuming a dynamic array: could change at run time?    
-                    if len(synaptic_events):
-                        delay = self.delays[synaptic_events]
-                        offsets = self._offsets[i]
-                        self.insert(delay, synaptic_events, offsets)
+                    start, end = ind[i], ind[i+1]
+                    if end>start:
+                        self.insert(self._delays_flat[start:end], flat[start:end],
+                                    self._offsets[start:end])
 
     ######################################## C optimised versions
+    # Insertion loop, used by insert_C and propagate_C (with the loop over
+    # events defined by the macros). When a bin is full, the insertion
+    # stops, the bin index, the required size and the position are stored
+    # in state, and the insertion is resumed from this position after the
+    # bin has grown.
+    _insert_code='''
+    int overflow = 0;
+    for(int s=state[0]; (s<nspikes) && (overflow==0); s++) {
+        EVENT_RANGE
+        for(; k<end; k++) {
+            const int syn = EVENT(k);
+            const int d = (currentt+DELAY) % ndelays;
+            if(n[d]>=capacity[d]) {
+                state[0] = s;
+                state[1] = k;
+                state[2] = d;
+                state[3] = n[d]+1;
+                overflow = 1;
+                break;
+            }
+            pool[start[d]+n[d]] = syn;
+            n[d]++;
+        }
+        if(overflow==0) state[1] = -1;
+    }
+    return_val = overflow;
+    '''
+
+    def _insert_loop(self, code, names, local_dict):
+        '''
+        Runs the insertion code, growing bins and resuming the insertion if
+        a bin overflows.
+        '''
+        state = np.array([0, -1, 0, 0]) # position, bin and size if overflow
+        local_dict['state'] = state
+        local_dict['n'] = self.n
+        local_dict['currentt'] = self.currenttime
+        local_dict['ndelays'] = len(self.n)
+        names = names+['state', 'n', 'currentt', 'ndelays', 'pool', 'start', 'capacity']
+        while True:
+            local_dict['pool'] = self.pool
+            local_dict['start'] = self.start
+            local_dict['capacity'] = self.capacity
+            overflow = weave.inline(code, names, local_dict=local_dict,
+                                    compiler=self._cpp_compiler,
+                                    extra_compile_args=self._extra_compile_args)
+            if not overflow:
+                break
+            self._grow_bin(state[2], state[3])
+
     def insert_C(self,delay,target):
         '''
         Insertion of events using weave.
@@ -367,26 +565,36 @@ class SpikeQueue(SpikeMonitor):
         ``target``
             Target synaptic indexes (array).
         '''
-        # Check if we can fit the events (crude check)
-        nevents=len(target)
-        m=max(self.n)+nevents
-        if m>self.X.shape[1]:
-            self.resize(m)
-        Xflat=self.X_flat
-        n=self.n
-        ncols=self.X.shape[1]
-        currentt=self.currenttime
-        ndelays=len(self.n)
-        code='''
-        for(int k=0;k<nevents;k++) {
-            const int d = (currentt+delay[k]) % ndelays;
-            Xflat[d*ncols+n[d]] = target[k];
-            n[d]++;
-        }
+        # events are processed as a single "spike"
+        code=self._insert_code.replace('EVENT_RANGE', '''
+        const int end = nevents;
+        int k = (state[1]>=0) ? state[1] : 0;''').replace('EVENT(k)', 'target[k]')
+        code=code.replace('DELAY', 'delay[k]')
+        self._insert_loop(code, ['nspikes', 'nevents', 'delay', 'target'],
+                          {'nspikes':1, 'nevents':len(target), 'delay':delay,
+                           'target':np.asarray(target)})
+
+    def propagate_C(self, spikes):
         '''
-        weave.inline(code, ['nevents','n','delay','Xflat','target','ncols','currentt','ndelays'], \
-             compiler=self._cpp_compiler,
-             extra_compile_args=self._extra_compile_args)
+        Inserts the synaptic events produced by ``spikes`` using weave, in a
+        single loop over spikes and their synapses. This works for homogeneous,
+        heterogeneous and dynamic delays. When a time bin is full, the loop
+        stops, the bin grows and the insertion resumes where it stopped.
+        '''
+        delays = self.delays
+        if not isinstance(delays, np.ndarray):
+            delays = delays.data # DynamicArray1D
+        code=self._insert_code.replace('EVENT_RANGE', '''
+        const int i = spikes[s];
+        const int end = rowind[i+1];
+        int k = (state[1]>=0) ? state[1] : rowind[i];''').replace('EVENT(k)', 'allsyn[k]')
+        code=code.replace('DELAY', 'delays[syn]')
+        self._insert_loop(code, ['nspikes', 'spikes', 'rowind', 'allsyn', 'delays'],
+                          {'nspikes':len(spikes),
+                           'spikes':np.asarray(spikes, dtype=int),
+                           'rowind':self._synapses_ind,
+                           'allsyn':self._synapses_flat,
+                           'delays':delays})
 
     def offsets_C(self, delay):
         '''
@@ -394,7 +602,7 @@ class SpikeQueue(SpikeMonitor):
         This function is normally not used (since insert_C does not need it).
         '''
         nevents=len(delay)
-        x=np.zeros(self.X.shape[0],dtype=int) # a counter for each delay
+        x=np.zeros(len(self.n),dtype=int) # a counter for each delay
         ofs=np.zeros(nevents,dtype=int)
         code='''
         int d;
@@ -410,7 +618,7 @@ class SpikeQueue(SpikeMonitor):
         return ofs
 
     def __repr__(self):
-        res = 'SpikeQueue(shape = (%d, %d), ' % (self.X.shape)
+        res = 'SpikeQueue(nsteps = %d, pool size = %d, ' % (len(self.n), len(self.pool))
         res += 'max_delay = %.1f ms)' % (self._max_delay/ms)
         return res
         
@@ -421,72 +629,218 @@ class SpikeQueue(SpikeMonitor):
         '''
         Plots the events stored in the spike queue.
         '''
-        for i in range(self.X.shape[0]):
-            idx = (i + self.currenttime ) % self.X.shape[0]
-            data = self.X[idx, :self.n[idx]]
+        for i in range(len(self.n)):
+            idx = (i + self.currenttime ) % len(self.n)
+            data = self.pool[self.start[idx]:self.start[idx]+self.n[idx]]
             pylab.plot(idx * np.ones(len(data)), data, '.')
         if display:
             pylab.show()
 
-try:
-    ## CSpikeQueue support!
-    # replaces the SpikeQueue object by a wrapper for the C++ version
-    # this is only if the import statement below doesn't fail (i.e. the c version is compiled)
+def synapses_csr(synapses):
+    '''
+    Returns the synapse indexes in ``synapses`` (a list of arrays of synapse
+    indexes, one for each neuron) in CSR format, as a tuple ``(ind, flat)``:
+    the synapses of neuron ``i`` are ``flat[ind[i]:ind[i+1]]``.
+    '''
+    lengths = np.array([len(targets) for targets in synapses], dtype=int)
+    ind = np.zeros(len(synapses)+1, dtype=int)
+    np.cumsum(lengths, out=ind[1:])
+    if ind[-1]:
+        flat = np.hstack([targets.data for targets in synapses if len(targets)])
+    else:
+        flat = np.zeros(0, dtype=int)
+    return ind, flat
+
+def ranks(x):
+    '''
+    Returns the rank of each element of the integer array ``x`` among the
+    elements with the same value, in the order of the array. Example:
+    
+        [7,5,7,3,7,5] -> [0,0,1,0,2,1]
+    '''
+    x = np.asarray(x)
+    result = np.zeros(len(x), dtype=int)
+    if len(x)==0:
+        return result
+    # We use merge sort because it preserves the input order of equal
+    # elements in the sorted output
+    I = np.argsort(x, kind='mergesort')
+    xs = x[I]
+    first = np.hstack((True, xs[1:]!=xs[:-1])) # first element of each value
+    group_start = np.flatnonzero(first)[np.cumsum(first)-1]
+    result[I] = np.arange(len(x))-group_start
+    return result
+
+def synaptic_events(ind, flat, spikes):
+    '''
+    Returns the concatenated synapse indexes of the neurons in ``spikes``,
+    where the synapses are given in CSR format (see :func:`synapses_csr`).
+    This is vectorised (no loop over spikes).
+    '''
+    spikes = np.asarray(spikes, dtype=int)
+    starts = ind[spikes]
+    lengths = ind[spikes+1]-starts
+    # position of each event in flat: start of its neuron + rank in the neuron
+    positions = np.repeat(starts-(np.cumsum(lengths)-lengths), lengths)
+    positions += np.arange(len(positions))
+    return flat[positions]
 
-    ## try to import the CSpikeQueue
+try:
     import brian.experimental.cspikequeue.cspikequeue as _cspikequeue
     has_cspikequeue = True
+except ImportError:
+    has_cspikequeue = False
+
+if has_cspikequeue:
+    __all__.append('CSpikeQueue')
 
-    ## OK, now replace SpikeQueue by a wrapper to the C version
-    # this adds compatibility easily to all usual the arguments of SpikeQueue
-    # hence the arguments should match those of the class above
-    class SpikeQueue(_cspikequeue.SpikeQueue, SpikeMonitor):
+    class CSpikeQueue(SpikeMonitor):
+        '''
+        Spike queue using the compiled C++ data structure of
+        ``brian.experimental.cspikequeue``, with the same interface as
+        :class:`SpikeQueue`. It is used by :class:`Synapses` when the extension
+        module is compiled, unless the global preference ``usecspikequeue``
+        is False.
+        
+        The C++ structure is created when the network is first run
+        (:meth:`compress`), with enough time bins for the maximum delay, and it
+        grows automatically when a time bin is full. At every timestep, the
+        synaptic events of all spiking neurons are gathered without a loop over
+        spikes and inserted in a single call, whether delays are homogeneous,
+        heterogeneous or dynamic. Offsets are not used.
+        '''
         def __init__(self, source, synapses, delays,
-                     max_delay = 60*ms, maxevents = INITIAL_MAXSPIKESPER_DT,
+                     max_delay = 0*ms, maxevents = INITIAL_MAXSPIKESPER_DT,
                      precompute_offsets = True):
-            self._precompute_offsets = precompute_offsets
-            SpikeMonitor.__init__(self, source, record = False)
-
-            nsteps = int(np.floor(max_delay/self.source.clock.dt))+1
-
-            self._max_delay = max_delay
-
+            self.source = source
             self.synapses = synapses
-            self.delays = delays # Delay handling should also be in C
-
-            _cspikequeue.SpikeQueue.__init__(self, nsteps, int(maxevents))
-
-#            self._spikequeue = _cspikequeue.SpikeQueue(nsteps, int(maxevents))
+            self.delays = delays
+            self._max_delay = max_delay
+            self._maxevents = maxevents
+            self._queue = None # created by compress()
+            self._synapses_ind = None
+            self._synapses_flat = None
+            super(CSpikeQueue, self).__init__(source, record = False)
 
         def compress(self):
-            nsteps=max(self.delays)+1
-
-            # Check whether some delays are too long
-            if (nsteps>self.n_delays):
-                desired_max_delay = nsteps * self.source.clock.dt
-                raise ValueError,"Synaptic delays exceed maximum delay, set max_delay to %.1f ms" % (desired_max_delay/ms)
-
-            if hasattr(self, '_iscompressed') and self._iscompressed:
+            '''
+            Creates the C++ structure the first time the network is run, with
+            a number of time bins adjusted to the maximum delay.
+            '''
+            nsteps = max(self.delays)+1
+            max_nsteps = int(np.floor(self._max_delay/self.source.clock.dt))+1
+            if (self._max_delay>0) and (nsteps>max_nsteps):
+                raise ValueError,"Synaptic delays exceed maximum delay"
+            if self._queue is not None:
                 return
+            self._synapses_ind, self._synapses_flat = synapses_csr(self.synapses)
+            maxevents = self._maxevents
+            if maxevents == INITIAL_MAXSPIKESPER_DT: # automatic resize
+                maxevents = max(INITIAL_MAXSPIKESPER_DT,
+                                max(self._synapses_ind[1:]-self._synapses_ind[:-1]))
+            self._queue = _cspikequeue.SpikeQueue(max(nsteps, max_nsteps), int(maxevents))
+
+        @property
+        def currenttime(self):
+            return self._queue.currenttime
+
+        def next(self):
+            '''
+            Advances by one timestep
+            '''
+            self._queue.next()
 
-            self._iscompressed = True
-
-            # Adjust the maximum delay and number of events per timestep if necessary
-            maxevents=self.n_maxevents
-            if maxevents==INITIAL_MAXSPIKESPER_DT: # automatic resize
-                maxevents=max(INITIAL_MAXSPIKESPER_DT, max([len(targets) for targets in self.synapses]))
+        def peek(self):
+            '''
+            Returns the all the synaptic events corresponding to the current time,
+            as an array of synapse indexes.
+            '''
+            return self._queue.peek()
 
-            # Resize
+        def insert(self, delay, target, offset=None):
+            '''
+            Inserts events. ``delay`` and ``target`` are arrays of delays (in
+            timesteps) and target synapse indexes, ``offset`` is ignored.
+            '''
+            self._queue.insert(np.ascontiguousarray(target, dtype=int),
+                               np.ascontiguousarray(delay, dtype=int))
 
-            self.expand(int(maxevents))
         def propagate(self, spikes):
             '''
             Called by the network object at every timestep.
             Spikes produce synaptic events that are inserted in the queue. 
             '''
             if len(spikes):
-                synaptic_events=np.hstack([self.synapses[i].data for i in spikes]) # could be not efficient
-                self.insert(synaptic_events, self.delays[synaptic_events])   
-        warnings.warn('Using C++ SpikeQueue')
-except ImportError:
-    has_cspikequeue = False
+                events = synaptic_events(self._synapses_ind, self._synapses_flat, spikes)
+                if len(events):
+                    self.insert(self.delays[events], events)
+
+        def update_synapses(self):
+            '''
+            Updates the CSR arrays, when synapse indexes have changed before
+            the run.
+            '''
+            if self._synapses_ind is not None:
+                self._synapses_ind, self._synapses_flat = synapses_csr(self.synapses)
+
+        def _update_delays(self, delays):
+            '''
+            Internal method to update the delays (in second), used by the
+            Synapses class when the delays are dynamically varied.
+            '''
+            self.delays = np.array(np.floor(delays/self.source.clock.dt), dtype = int)+1
+
+        def _pending_events(self):
+            '''
+            Returns the list of arrays of future events, for each delay
+            (starting with the current time). The content of the queue is
+            unchanged.
+            '''
+            if self._queue is None: # not compressed yet
+                return []
+            events = []
+            for _ in range(self._queue.n_delays):
+                events.append(np.array(self._queue.peek()))
+                self._queue.next() # this erases the current events
+            for delay, targets in enumerate(events):
+                if len(targets):
+                    self.insert(delay*np.ones(len(targets), dtype=int), targets)
+            return events
+
+        # The C++ structure cannot be pickled, so the future events are
+        # stored instead
+        def __getstate__(self):
+            state = self.__dict__.copy()
+            if self._queue is not None:
+                state['_queue'] = (self._queue.n_delays, self._queue.n_maxevents,
+                                   self._pending_events())
+            return state
+
+        def __setstate__(self, state):
+            self.__dict__ = state
+            if self._queue is not None:
+                n_delays, n_maxevents, events = self._queue
+                self._queue = _cspikequeue.SpikeQueue(n_delays, n_maxevents)
+                for delay, targets in enumerate(events):
+                    if len(targets):
+                        self.insert(delay*np.ones(len(targets), dtype=int), targets)
+
+        def __repr__(self):
+            if self._queue is None:
+                return 'CSpikeQueue(max_delay = %.1f ms)' % (self._max_delay/ms)
+            res = 'CSpikeQueue(shape = (%d, %d), ' % (self._queue.n_delays,
+                                                     self._queue.n_maxevents)
+            res += 'max_delay = %.1f ms)' % (self._max_delay/ms)
+            return res
+
+        def plot(self, display = True):
+            '''
+            Plots the events stored in the spike queue.
+            '''
+            for delay, targets in enumerate(self._pending_events()):
+                idx = (delay + self.currenttime) % self._queue.n_delays
+                pylab.plot(idx * np.ones(len(targets)), targets, '.')
+            if display:
+                pylab.show()
+
+    log_info('brian.synapses.spikequeue', 'Using C++ SpikeQueue')
@@ -5,19 +5,32 @@ import re
 import warnings
 from operator import isSequenceType
 import copy
+import multiprocessing
+
+from distutils.errors import CCompilerError, DistutilsError
 
 import numpy as np
-from numpy.random import binomial
-from random import sample
-from scipy import rand, randn
+try:
+    from scipy import weave
+except ImportError:
+    try:
+        import weave
+    except ImportError:
+        weave = None
 
+from brian.globalprefs import get_global_preference
 from brian.inspection import get_identifiers, namespace
 from brian.log import log_debug, log_warn
 from brian.neurongroup import NeuronGroup
 from brian.optimiser import AffineFunction, symbolic_eval
+from brian.randomstreams import RandomStream, skip_ahead_indices
 from brian.stdunits import ms
-from brian.synapses.spikequeue import SpikeQueue
+from brian.synapses.spikequeue import SpikeQueue, has_cspikequeue
+if has_cspikequeue:
+    from brian.synapses.spikequeue import CSpikeQueue
 from brian.synapses.synaptic_equations import SynapticEquations
+from brian.synapses.synapticcode import (generate_weave_pathway_code,
+                                        weave_pathway_support_code)
 from brian.synapses.synapticvariable import (SynapticDelayVariable, 
                                              SynapticVariable, slice_to_array)
 from brian.utils.documentation import flattened_docstring
@@ -32,12 +45,11 @@ except:
 
 __all__ = ['Synapses','invert_array']
 
-
-def _binomial_wrapper(n, p):
-    '''
-    A simple wrapper around numpy's binomial function for use in synaptic code.
-    '''
-    return np.random.binomial(np.array(n, dtype=int), p)
+# Errors raised by weave when the compiled code cannot be built or loaded, in
+# which case the Python code is used
+weave_errors = (CCompilerError, DistutilsError, ImportError)
+if weave is not None:
+    weave_errors += (weave.build_tools.CompileError,)
 
 
 class Synapses(NeuronGroup): # This way we inherit a lot of useful stuff
@@ -86,6 +98,38 @@ class Synapses(NeuronGroup): # This way we inherit a lot of useful stuff
         equations. TODO: more details.
     ``code_namespace=None``
         Namespace for the pre and post codes.
+    ``reorder=False``
+        If True, synapses are reordered by presynaptic neuron, presynaptic
+        delay and postsynaptic neuron when the network is first run (see
+        :meth:`compress`), so that synaptic events access memory
+        contiguously. Note that synapse indexes are changed, so arrays of
+        synapse indexes obtained before the run (e.g. for a
+        :class:`StateMonitor`) are no longer valid.
+    ``event_driven=False``
+        If True, the linear differential equations of the model that only
+        depend on the variable itself, on synaptic parameters and on
+        constants (e.g. ``dx/dt=-x/tau``, ``dx/dt=(1-x)/taud``) are
+        turned into event-driven code, as if they were marked with
+        ``(event-driven)``: they are updated analytically only when a pre or
+        postsynaptic event reaches the synapse, instead of being integrated
+        at every timestep. Variables used by other equations (e.g. in a
+        static equation) are still integrated. Note that the values of
+        event-driven variables are those at the time of the last event
+        (see ``lastupdate``), which matters if they are monitored. Synaptic
+        parameters used in these equations should only be changed by the
+        pre and post codes.
+    ``partitions=None``
+        Number of partitions for the parallel execution of the compiled pre
+        and post codes with OpenMP. Synapses are partitioned by ranges of
+        postsynaptic neurons (see :meth:`partition`) and each thread
+        processes the synaptic events of one partition, so that threads never
+        write to the same variables. By default, this is the number of
+        processors if the global preference ``openmp`` is True, and 1 (no
+        partition) otherwise. This is only used for codes that can be
+        compiled (global preference ``useweave``). The code is only compiled
+        with OpenMP if the global preference ``openmp`` is True and the
+        compiler is gcc, otherwise the partitions are processed one after
+        the other.
         
     **Methods**
     
@@ -101,6 +145,10 @@ class Synapses(NeuronGroup): # This way we inherit a lot of useful stuff
         If i is a tuple (m,n), m and n can be an integer, an array, a slice or a subgroup.
 
     .. automethod:: save_connectivity
+    .. automethod:: save
+    .. automethod:: load
+    .. automethod:: reorder
+    .. automethod:: partition
         
     *The following usages are also possible for a Synapses object ``S``*:
     
@@ -145,11 +193,20 @@ class Synapses(NeuronGroup): # This way we inherit a lot of useful stuff
         The compiled codes to be executed on pre and postsynaptic spikes.
     ``namespaces``
         The namespaces for the pre and postsynaptic codes.
+    ``_random``
+        The :class:`~brian.randomstreams.RandomStream` of the object, used
+        for ``rand()``, ``randn()`` and ``binomial()`` in the pre and post
+        codes and in string assignments of synaptic variables. Each call
+        creating random synapses uses a substream, in which the candidate
+        synapses of presynaptic neuron ``i`` are drawn from substream ``i``,
+        so that the synapses do not depend on how the candidates are split
+        in blocks.
     '''
     def __init__(self, source, target = None, model = None, pre = None, post = None,
              max_delay = 0*ms,
              level = 0,
-             clock = None, code_namespace=None,
+             clock = None, code_namespace=None, reorder = False, event_driven = False,
+             partitions = None,
              unit_checking = True, method = None, freeze = False, implicit = False, order = 1): # model (state updater) related
         
         target=target or source # default is target=source
@@ -176,6 +233,13 @@ class Synapses(NeuronGroup): # This way we inherit a lot of useful stuff
 
         if not isinstance(model,SynapticEquations):
             model=SynapticEquations(model,level=level+1)
+        if event_driven:
+            if use_sympy:
+                for name in model.linear_diffeq_names():
+                    model.set_event_driven(name)
+                log_debug('brian.synapses','Event-driven variables: '+', '.join(model._eventdriven.keys()))
+            else:
+                log_warn('brian.synapses','The Sympy package must be installed to produce event-driven code')
         # Insert the lastupdate variable if necessary (if it is mentioned in pre/post, or if there is event-driven code)
         expr=re.compile(r'\blastupdate\b')
         if (len(model._eventdriven)>0) or \
@@ -224,6 +288,21 @@ class Synapses(NeuronGroup): # This way we inherit a lot of useful stuff
                              unit_checking=unit_checking, method=method,
                              freeze=freeze, implicit=implicit, order=order)
         
+        self._reorder = reorder
+        if partitions is None:
+            if get_global_preference('openmp'):
+                partitions = multiprocessing.cpu_count()
+            else:
+                partitions = 1
+        self._npartitions = partitions
+        self._partition = None # partition of each synapse
+        self._partition_sorted = np.zeros(0, dtype=int) # buffers for the compiled code
+        self._partition_bounds = np.zeros(partitions+1, dtype=int)
+        if get_global_preference('openmp') and get_global_preference('weavecompiler')=='gcc':
+            self._openmp_args = ['-fopenmp']
+        else:
+            self._openmp_args = [] # the partitions are processed serially
+
         # Dynamical delays
         if "delay" in self.var_index: # if there is a "delay" variable specified in the model eqns
             self.has_variable_delays = True # remember it 
@@ -262,6 +341,7 @@ class Synapses(NeuronGroup): # This way we inherit a lot of useful stuff
             #vars=eqs._diffeq_names_nonzero # Dynamic variables
             vars=eqs._eventdriven.keys()
             var_set=set(vars)
+            eventdriven_namespace={'exp':np.exp}
             for var,RHS in eqs._eventdriven.iteritems():
                 ids=get_identifiers(RHS)
                 if len(set(list(ids)+[var]).intersection(var_set))==1:
@@ -285,6 +365,9 @@ class Synapses(NeuronGroup): # This way we inherit a lot of useful stuff
                     else:
                         expr=-b/a+sympy.exp(a*symbol_t)*(symbol_var+b/a)
                     expr=var+'='+str(expr)
+                    for name in get_identifiers(expr):
+                        if name in eqs._namespace[var] and name not in eventdriven_namespace:
+                            eventdriven_namespace[name]=eqs._namespace[var][name]
                     # Replace pre and post code
                     # N.B.: the differential equations are kept, we will probably want to remove them!
                     pre_list=[expr+'\n'+pre for pre in pre_list]
@@ -292,6 +375,10 @@ class Synapses(NeuronGroup): # This way we inherit a lot of useful stuff
                         post=expr+'\n'+post
                 else:
                     raise TypeError,"Cannot turn equation for "+var+" into event-driven code"
+            # the constants of the equations are needed by the pre and post codes
+            if len(vars)>0:
+                eventdriven_namespace.update(code_namespace or {})
+                code_namespace=eventdriven_namespace
         elif len(self._eqs._eventdriven)>0:
             raise TypeError,"The Sympy package must be installed to produce event-driven code"
 
@@ -318,30 +405,40 @@ class Synapses(NeuronGroup): # This way we inherit a lot of useful stuff
         self.synapses_pre=[DynamicArray1D(0,dtype=smallest_inttype(max_synapses)) for _ in range(len(self.source))]
         self.synapses_post=[DynamicArray1D(0,dtype=smallest_inttype(max_synapses)) for _ in range(len(self.target))]
 
-        # Code generation
-        self._binomial = _binomial_wrapper
+        # Random numbers
+        self._random = RandomStream()
+        self._ncreations = 0 # number of calls creating random synapses
+
+        # Spike queues: C++ version if it is compiled
+        if has_cspikequeue and get_global_preference('usecspikequeue'):
+            queue_class = CSpikeQueue
+        else:
+            queue_class = SpikeQueue
 
         self.contained_objects = []
         self.codes=[]
         self.namespaces=[]
         self.queues=[]
+        self._weave_codes=[]
         for i,pre in enumerate(pre_list):
             code,_namespace=self.generate_code(pre,level+1,code_namespace=code_namespace)
             self.codes.append(code)
             self.namespaces.append(_namespace)
+            self._weave_codes.append(self.generate_weave_code(pre,_namespace))
             
             if self.has_variable_delays:
                 _precompute_offsets = False
             else:
                 _precompute_offsets = True
-            self.queues.append(SpikeQueue(self.source, self.synapses_pre, self._delay_pre[i], max_delay = max_delay, precompute_offsets = _precompute_offsets))
+            self.queues.append(queue_class(self.source, self.synapses_pre, self._delay_pre[i], max_delay = max_delay, precompute_offsets = _precompute_offsets))
             
         
         if post is not None:
             code,_namespace=self.generate_code(post,level+1,direct=True,code_namespace=code_namespace)
             self.codes.append(code)
             self.namespaces.append(_namespace)
-            self.queues.append(SpikeQueue(self.target, self.synapses_post, self._delay_post, max_delay = max_delay))
+            self._weave_codes.append(self.generate_weave_code(post,_namespace))
+            self.queues.append(queue_class(self.target, self.synapses_post, self._delay_post, max_delay = max_delay))
 
         self.contained_objects+=self.queues
       
@@ -530,16 +627,79 @@ class Synapses(NeuronGroup): # This way we inherit a lot of useful stuff
         
         return compiled_code,_namespace
 
+    def generate_weave_code(self,code,_namespace):
+        '''
+        Generates C++ code for a pre or post code, if weave is used (global
+        preference ``useweave``). Returns ``None`` if weave is not used or if
+        the code cannot be compiled, in which case the Python code is used.
+        
+        The compiled code processes the synaptic events one by one, so that
+        there is no need to deal with multiple synapses onto the same
+        postsynaptic neuron.
+        '''
+        if not self._useweave or weave is None:
+            return None
+        synaptic_vars=[var for var in self.var_index if isinstance(var, str)]
+        pre_vars=[var for var in self.source.var_index if isinstance(var, str)]
+        post_vars=[var for var in self.target.var_index if isinstance(var, str)]
+        weave_code=generate_weave_pathway_code(code,synaptic_vars,pre_vars,post_vars,_namespace)
+        if weave_code is None:
+            log_debug('brian.synapses', 'Code cannot be compiled, using Python:\n'+code)
+        else:
+            log_debug('brian.synapses', '\nC++ CODE:\n'+weave_code.code)
+        return weave_code
+
+    def weave_update(self,weave_code,_namespace,synaptic_events):
+        '''
+        Executes the compiled code ``weave_code`` for the given synaptic events.
+        '''
+        local_dict={'_synapses':synaptic_events,
+                    '_nsynapses':len(synaptic_events),
+                    '_pre':self.presynaptic.data,
+                    '_post':self.postsynaptic.data,
+                    't':float(self.clock._t)}
+        for var in weave_code.synaptic_vars:
+            local_dict[var]=_namespace[var]
+        for var in weave_code.pre_vars:
+            local_dict['_source_'+var]=self.source.state_(var)
+        for var in weave_code.post_vars:
+            local_dict['_target_'+var]=self.target.state_(var)
+        for name in weave_code.constants:
+            local_dict['_c_'+name]=float(_namespace[name])
+        if self._npartitions>1 and self._partition is not None:
+            # parallel version, with OpenMP if available
+            if len(self._partition_sorted)<len(synaptic_events) or \
+               self._partition_sorted.dtype!=synaptic_events.dtype:
+                self._partition_sorted=np.zeros(2*len(synaptic_events),dtype=synaptic_events.dtype)
+            local_dict.update({'_partition':self._partition,
+                               '_npartitions':self._npartitions,
+                               '_sorted':self._partition_sorted,
+                               '_bounds':self._partition_bounds})
+            weave.inline(weave_code.partitioned_code,weave_code.partitioned_arg_names,
+                         local_dict=local_dict,
+                         support_code=weave_pathway_support_code,
+                         compiler=self._cpp_compiler,
+                         extra_compile_args=self._extra_compile_args+self._openmp_args,
+                         extra_link_args=self._openmp_args)
+        else:
+            weave.inline(weave_code.code,weave_code.arg_names,
+                         local_dict=local_dict,
+                         support_code=weave_pathway_support_code,
+                         compiler=self._cpp_compiler,
+                         extra_compile_args=self._extra_compile_args)
+
     # Pickling support
     def __getstate__(self):
         # code objects cannot be pickled, we therefore delete them and later
         # reconstruct them from the code strings (stored in the namespace)
         state = copy.copy(self.__dict__)
         state['codes'] = [None] * len(self.codes)
-        # We cannot pickle module objects and numpy is included as 'np'
+        # We cannot pickle module objects and numpy is included as 'np', nor
+        # the bound methods of the random stream (both are added back by
+        # compress)
         for ns in state['namespaces']:
             for k, v in ns.iteritems():
-                if v is np:
+                if v is np or getattr(v, 'im_self', None) is self._random:
                     ns[k] = None
         return state
 
@@ -558,9 +718,6 @@ class Synapses(NeuronGroup): # This way we inherit a lot of useful stuff
                     namespace['_source_' + presyn_var] = self.source.state_(presyn_var)
             namespace['target'] = self.target
 
-            # numpy array views don't survive pickling
-            queue.X_flat = queue.X.reshape(queue.X.size, )
-
         # Re-compress the Synapses object (this also adds "np" to the namespaces)
         self._iscompressed = False
         self.compress()
@@ -650,56 +807,15 @@ class Synapses(NeuronGroup): # This way we inherit a lot of useful stuff
             code = re.sub(r'\b' + 'rand\(\)', 'rand(n)', value) # replacing rand()
             code = re.sub(r'\b' + 'randn\(\)', 'randn(n)', code) # replacing randn()
             _namespace = namespace(value, level=1)
-            _namespace.update({'j' : post_slice-post_shift,
-                               'n' : len(post_slice),
-                               'rand': np.random.rand,
-                               'randn': np.random.randn})
-#            try: # Vectorise over all indexes: not faster! 
-#                post,pre=np.meshgrid(post_slice-post_shift,pre_slice-pre_shift)
-#                pre=pre.flatten()
-#                post=post.flatten()
-#                _namespace['i']=array(pre,dtype=self.presynaptic.dtype)
-#                _namespace['j']=array(post,dtype=self.postsynaptic.dtype)
-#                _namespace['n']=len(post)
-#                result = eval(code, _namespace) # mask on synapses
-#                if result.dtype==float: # random number generation
-#                    result=rand(len(post))<result
-#                indexes=result.nonzero()[0]
-#                presynaptic=pre[indexes]
-#                postsynaptic=post[indexes]
-#                dtype=self.synapses_pre[0].dtype
-#                synapses_pre={}
-#                nsynapses=0
-#                for i in pre_slice:
-#                    n=sum(result[i*len(post_slice):(i+1)*len(post_slice)])
-#                    synapses_pre[i]=array(nsynapses+np.arange(n),dtype=dtype)
-#                    nsynapses+=n
-#            except MemoryError: # If not possible, vectorise over postsynaptic indexes
-#                log_info("synapses","Construction of synapses cannot be fully vectorised (too big)")
-            #del pre
-            #del post
-            #_namespace['i']=None
-            #_namespace['j']=post_slice-post_shift
-            #_namespace['n']=len(post_slice)
-            synapses_pre={}
-            nsynapses=0
-            presynaptic,postsynaptic=[],[]
-            for i in pre_slice:
-                _namespace['i']=i-pre_shift # maybe an array rather than a scalar?
-                result = eval(code, _namespace) # mask on synapses
-                if result.dtype==float: # random number generation
-                    result=rand(len(post_slice))<result
-                indexes=result.nonzero()[0]
-                n=len(indexes)
-                synapses_pre[i]=np.array(nsynapses+np.arange(n),dtype=self.synapses_pre[0].dtype)
-                presynaptic.append(i*np.ones(n,dtype=int))
-                postsynaptic.append(post_slice[indexes])
-                nsynapses+=n
-                
-            # Make sure the type is correct
-            presynaptic=np.array(np.hstack(presynaptic),dtype=self.presynaptic.dtype)
-            postsynaptic=np.array(np.hstack(postsynaptic),dtype=self.postsynaptic.dtype)
-            synapses_post=None
+            random=self._creation_stream()
+            # The condition is evaluated by blocks of presynaptic neurons, and
+            # the synapses of each block are created directly
+            blocks=((pre_block,self._evaluate_condition(code,_namespace,pre_block-pre_shift,
+                                                        post_slice-post_shift,
+                                                        [random.substream(k) for k in pre_block]))
+                    for pre_block in synapse_blocks(pre_slice,len(post_slice)))
+            self._create_block_synapses(post_slice,blocks)
+            return
         elif isinstance(value, np.ndarray):
             raise NotImplementedError
             nsynapses = np.array(value, dtype = int) 
@@ -707,6 +823,82 @@ class Synapses(NeuronGroup): # This way we inherit a lot of useful stuff
         # Now create the synapses
         self.create_synapses(presynaptic,postsynaptic,synapses_pre,synapses_post)
     
+    def _evaluate_condition(self,code,_namespace,i,j,streams):
+        '''
+        Evaluates the condition ``code`` for all pairs of presynaptic indexes
+        ``i`` and postsynaptic indexes ``j`` (arrays), and returns the indexes
+        of the pairs that are selected, in the flattened ``(len(i),len(j))``
+        array (a float value is a probability).
+        
+        The condition is vectorised over all pairs. If this fails (for example
+        if the code uses ``i`` as a scalar), it is evaluated for each
+        presynaptic neuron (vectorised over postsynaptic neurons).
+        
+        The random numbers for presynaptic neuron ``i[k]`` (``rand()`` and
+        ``randn()`` in the code, and probabilities) are drawn from the random
+        stream ``streams[k]``.
+        '''
+        m=len(j)
+        def rows_random(method):
+            return lambda n:np.hstack([getattr(stream,method)(m) for stream in streams])
+        counters=[stream.counter for stream in streams]
+        try:
+            _namespace.update({'i':np.repeat(i,m),
+                               'j':np.tile(j,len(i)),
+                               'n':len(i)*m,
+                               'rand':rows_random('rand'),
+                               'randn':rows_random('randn')})
+            result=np.asarray(eval(code,_namespace))
+            if result.shape!=(len(i)*m,):
+                result=result*np.ones(len(i)*m,dtype=result.dtype) # scalar or wrong shape
+        except Exception:
+            # start the streams again
+            for stream,counter in zip(streams,counters):
+                stream.counter=counter
+            _namespace.update({'j':j,'n':m})
+            result=np.empty(len(i)*m,dtype=float)
+            for k,i_k in enumerate(i):
+                _namespace.update({'i':i_k,
+                                   'rand':streams[k].rand,
+                                   'randn':streams[k].randn})
+                result[k*m:(k+1)*m]=eval(code,_namespace)
+            if (result==result.astype(bool)).all():
+                result=result.astype(bool)
+        if result.dtype==float: # random number generation
+            result=rows_random('rand')(len(result))<result
+        return result.nonzero()[0]
+
+    def _create_block_synapses(self,post_slice,blocks):
+        '''
+        Creates synapses with postsynaptic neurons ``post_slice``, given by
+        the pairs ``(pre_block,indexes)`` of ``blocks``: the synapses between
+        presynaptic neurons ``pre_block`` and ``post_slice`` are given by
+        ``indexes`` in the flattened ``(len(pre_block),len(post_slice))``
+        array (sorted), so that synapses with the same presynaptic neuron have
+        contiguous indexes.
+        
+        The synapses of each block are added directly, but ``synapses_post``
+        is only updated at the end, once for each postsynaptic neuron.
+        '''
+        m=len(post_slice)
+        nsynapses_all=self._S.shape[1]
+        dtype=self.synapses_pre[0].dtype
+        for pre_block,indexes in blocks:
+            rows=indexes//m
+            presynaptic=np.array(pre_block[rows],dtype=self.presynaptic.dtype)
+            postsynaptic=np.array(post_slice[indexes-rows*m],dtype=self.postsynaptic.dtype)
+            counts=np.bincount(rows,minlength=len(pre_block))
+            starts=np.cumsum(counts)-counts
+            synapses_pre=dict((i,np.arange(start,start+count,dtype=dtype))
+                              for i,start,count in zip(pre_block,starts,counts) if count)
+            self.create_synapses(presynaptic,postsynaptic,synapses_pre,{})
+        synapses_post=invert_array(self.postsynaptic[nsynapses_all:],
+                                   dtype=self.synapses_post[0].dtype)
+        for j,synapses in synapses_post.iteritems():
+            nsynapses=len(self.synapses_post[j])
+            self.synapses_post[j].resize(nsynapses+len(synapses))
+            self.synapses_post[j][nsynapses:]=synapses+nsynapses_all
+
     def create_synapses(self, presynaptic, postsynaptic,
                         synapses_pre = None, synapses_post = None):
         '''
@@ -800,13 +992,22 @@ class Synapses(NeuronGroup): # This way we inherit a lot of useful stuff
         if self._state_updater is not None:
             self._state_updater(self)
 
-        for queue, _namespace, code in zip(self.queues, self.namespaces, self.codes):
+        for k, (queue, _namespace, code) in enumerate(zip(self.queues, self.namespaces, self.codes)):
             synaptic_events = queue.peek()
             if len(synaptic_events):
-                # Build the namespace - Here we don't consider static equations
-                _namespace['_synapses'] = synaptic_events
-                _namespace['t'] = self.clock._t
-                exec code in _namespace
+                weave_code = self._weave_codes[k]
+                if weave_code is not None:
+                    try:
+                        self.weave_update(weave_code, _namespace, synaptic_events)
+                    except weave_errors, e:
+                        log_warn('brian.synapses', 'Compiled code failed (%s: %s), using Python'
+                                 % (e.__class__.__name__, e))
+                        self._weave_codes[k] = weave_code = None
+                if weave_code is None:
+                    # Build the namespace - Here we don't consider static equations
+                    _namespace['_synapses'] = synaptic_events
+                    _namespace['t'] = self.clock._t
+                    exec code in _namespace
             queue.next()
             if self.has_variable_delays:
                 queue._update_delays(_namespace['delay'])#self._S[self.var_index['delay'],:])
@@ -848,26 +1049,26 @@ class Synapses(NeuronGroup): # This way we inherit a lot of useful stuff
             pre=self.source
         if post is None:
             post=self.target
+        if not 0<=sparseness<=1:
+            raise ValueError('sparseness should be between 0 and 1')
         pre,post=self.presynaptic_indexes(pre),self.postsynaptic_indexes(post)
         m=len(post)
-        synapses_pre={}
-        nsynapses=0
-        presynaptic,postsynaptic=[],[]
-        for i in pre: # vectorised over post neurons
-            k = binomial(m, sparseness, 1)[0] # number of postsynaptic neurons
-            synapses_pre[i]=nsynapses+np.arange(k)
-            presynaptic.append(i*np.ones(k,dtype=int))
-            # Not significantly faster to generate all random numbers in one pass
-            # N.B.: the sample method is implemented in Python and it is not in Scipy
-            postneurons = sample(xrange(m), k)
-            #postneurons.sort() # sorting is unnecessary
-            postsynaptic.append(post[postneurons])
-            nsynapses+=k
-        presynaptic=np.hstack(presynaptic)
-        postsynaptic=np.hstack(postsynaptic)
-        synapses_post=None # we ask for automatic calculation of (post->synapse)
-        # this is more or less given by unique
-        self.create_synapses(presynaptic,postsynaptic,synapses_pre,synapses_post)
+        random=self._creation_stream()
+        # Synapses are created by blocks of presynaptic neurons, the synapses
+        # of neuron i are drawn from substream i
+        blocks=((pre_block,np.hstack([skip_ahead_indices(m,sparseness,random.substream(i))+k*m
+                                      for k,i in enumerate(pre_block)]))
+                for pre_block in synapse_blocks(pre,m))
+        self._create_block_synapses(post,blocks)
+
+    def _creation_stream(self):
+        '''
+        Returns a new random stream for a call creating random synapses, with
+        one substream per presynaptic neuron (see ``_random``).
+        '''
+        stream=self._random.substream(self._ncreations)
+        self._ncreations+=1
+        return stream
         
     def presynaptic_indexes(self,x):
         '''
@@ -895,6 +1096,7 @@ class Synapses(NeuronGroup): # This way we inherit a lot of useful stuff
         '''
         * Checks that the object is not empty.
         * Make the state array non-dynamical (important for the state updater).
+        * Reorders synapses if ``reorder`` is True (see :meth:`reorder`).
         * Updates namespaces of pre and post code.
         '''
         if hasattr(self, '_iscompressed') and self._iscompressed:
@@ -904,6 +1106,10 @@ class Synapses(NeuronGroup): # This way we inherit a lot of useful stuff
         if len(self)==0:
             warnings.warn("Empty Synapses object")
         self._S=self._S[:,:]
+        if self._reorder:
+            self.reorder()
+        if self._npartitions>1:
+            self.partition(self._npartitions)
         
         # Update namespaces of pre/post code        
         for _namespace in self.namespaces:
@@ -920,14 +1126,62 @@ class Synapses(NeuronGroup): # This way we inherit a lot of useful stuff
             _namespace['_pre']=self.presynaptic
             _namespace['_post']=self.postsynaptic
             _namespace['np']=np
-            _namespace['binomial']=self._binomial
-            _namespace['rand']=rand
-            _namespace['randn']=randn
+            _namespace['binomial']=self._random.binomial
+            _namespace['rand']=self._random.rand
+            _namespace['randn']=self._random.randn
             _namespace['zeros']=np.zeros
             _namespace['sum']=sum
             
         self._iscompressed=True
 
+    def reorder(self):
+        '''
+        Reorders synapses by presynaptic neuron, presynaptic delay (of the
+        first pre code) and postsynaptic neuron. All synaptic variables and
+        the mappings between neurons and synapses are permuted, so that the
+        events of a presynaptic spike correspond to contiguous synapses,
+        ordered by target neuron. This is called by :meth:`compress` if the
+        ``reorder`` keyword is True.
+        '''
+        nsynapses=len(self)
+        presynaptic=self.presynaptic.data
+        postsynaptic=self.postsynaptic.data
+        if self.has_variable_delays or not len(self._delay_pre):
+            perm=np.lexsort((postsynaptic,presynaptic))
+        else:
+            perm=np.lexsort((postsynaptic,self._delay_pre[0].data,presynaptic))
+        if (perm==np.arange(nsynapses)).all():
+            return
+        # synapse k is moved to inverse[k]
+        inverse=np.empty(nsynapses,dtype=int)
+        inverse[perm]=np.arange(nsynapses)
+        self._S[:]=self._S[:,perm]
+        for x in [self.presynaptic,self.postsynaptic,self._delay_post]+self._delay_pre:
+            x.data[:]=x.data[perm]
+        for synapses in self.synapses_pre+self.synapses_post:
+            synapses.data[:]=np.sort(inverse[synapses.data])
+        for queue in self.queues:
+            queue.update_synapses()
+
+    def partition(self,npartitions):
+        '''
+        Partitions the synapses in ``npartitions`` ranges of postsynaptic
+        neurons, with about the same number of synapses in each partition.
+        Returns the boundaries of the ranges: partition ``k`` contains the
+        synapses onto neurons ``bounds[k]`` to ``bounds[k+1]-1``. This is
+        called by :meth:`compress` if there are several partitions (keyword
+        ``partitions``).
+        '''
+        postsynaptic=self.postsynaptic.data
+        counts=np.cumsum(np.bincount(postsynaptic,minlength=len(self.target)))
+        targets=np.arange(1,npartitions)*len(self)/float(npartitions)
+        bounds=np.minimum(np.searchsorted(counts,targets)+1,len(self.target))
+        bounds=np.hstack((0,bounds,len(self.target)))
+        self._partition=np.array(np.searchsorted(bounds[1:-1],postsynaptic,side='right'),dtype=int)
+        self._npartitions=npartitions
+        self._partition_bounds=np.zeros(npartitions+1,dtype=int)
+        return bounds
+
     def synapse_index(self,i):
         '''
         Returns the synapse indexes correspond to i, which is a tuple.
@@ -1038,9 +1292,37 @@ class Synapses(NeuronGroup): # This way we inherit a lot of useful stuff
         self._delay_pre = data['_delay_pre']
         self._delay_post = data['_delay_post']
 
+    def save(self, filename):
+        '''
+        Saves the synapses, all synaptic variables and the pending synaptic
+        events to the binary file ``filename``, which can be memory mapped
+        when it is loaded with :meth:`load`. See :func:`save_synapses`.
+        '''
+        from brian.synapses.synapsesfile import save_synapses
+        save_synapses(self, filename)
+
+    def load(self, filename, mmap_mode='r'):
+        '''
+        Loads synapses saved with :meth:`save` in this (empty) object. By
+        default the file is memory mapped read-only, see
+        :func:`load_synapses` for details.
+        '''
+        from brian.synapses.synapsesfile import load_synapses
+        load_synapses(self, filename, mmap_mode=mmap_mode)
+
     def __repr__(self):
         return 'Synapses object with '+ str(len(self))+ ' synapses'
 
+def synapse_blocks(pre,npost):
+    '''
+    Splits the array of presynaptic indexes ``pre`` in blocks of at most
+    ``synapses_max_candidates`` (global preference) candidate synapses (with
+    ``npost`` postsynaptic neurons), with at least one neuron per block.
+    '''
+    size=max(1,get_global_preference('synapses_max_candidates')//max(npost,1))
+    for k in xrange(0,len(pre),size):
+        yield pre[k:k+size]
+
 def smallest_inttype(N):
     '''
     Returns the smallest signed integer dtype that can store N indexes.
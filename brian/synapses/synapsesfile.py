@@ -0,0 +1,114 @@
+'''
+Binary files storing the state of :class:`Synapses` objects
+
+The files have the same layout as connection files (see
+:mod:`brian.connections.connectionfile`), with the magic string
+``BRIANSYN``. They contain the synapses (pre and postsynaptic neurons and
+delays), the state matrix with all synaptic variables, the mappings from
+neurons to synapses (in CSR format) and the events pending in the spike
+queues, so that a simulation can be resumed. Each array is aligned on a 64
+bytes boundary, so that it can be memory mapped with ``numpy.memmap``.
+'''
+import numpy as np
+
+from brian.connections.connectionfile import write_array_file, read_array_file
+from brian.synapses.spikequeue import synapses_csr
+
+__all__ = ['save_synapses', 'load_synapses']
+
+MAGIC = 'BRIANSYN'
+VERSION = 1
+
+
+def _variables(S):
+    '''
+    Returns the names of the synaptic variables, in the order of the rows of
+    the state matrix.
+    '''
+    rows = sorted((i, var) for var, i in S.var_index.iteritems() if isinstance(var, str))
+    return [var for _, var in rows]
+
+
+def save_synapses(S, filename):
+    '''
+    Saves the synapses of the :class:`Synapses` object ``S`` to the file
+    ``filename``: pre and postsynaptic neurons, delays, all synaptic
+    variables and the events pending in the spike queues. The file can be
+    loaded with :func:`load_synapses`.
+    '''
+    header = {'version': VERSION,
+              'class': S.__class__.__name__,
+              'shape': (len(S.source), len(S.target)),
+              'variables': _variables(S),
+              'pre': len(S._delay_pre),
+              'queues': len(S.queues),
+              'dt': float(S.clock.dt)}
+    arrays = {'S': S._S[:, :],
+              'presynaptic': S.presynaptic[:],
+              'postsynaptic': S.postsynaptic[:],
+              'delay_post': S._delay_post[:]}
+    for k, delay_pre in enumerate(S._delay_pre):
+        arrays['delay_pre_%d' % k] = delay_pre[:]
+    for name, synapses in [('synapses_pre', S.synapses_pre),
+                           ('synapses_post', S.synapses_post)]:
+        ind, flat = synapses_csr(synapses)
+        arrays[name + '_ind'] = ind
+        arrays[name + '_flat'] = np.asarray(flat, dtype=synapses[0].dtype)
+    # Future events, as (delay, synapse) pairs
+    for k, queue in enumerate(S.queues):
+        events = queue._pending_events()
+        if sum(len(targets) for targets in events):
+            arrays['queue_%d_delays' % k] = np.repeat(np.arange(len(events)),
+                                                      [len(targets) for targets in events])
+            arrays['queue_%d_synapses' % k] = np.hstack(events)
+    write_array_file(filename, MAGIC, header, arrays)
+
+
+def load_synapses(S, filename, mmap_mode='r'):
+    '''
+    Loads the synapses saved with :func:`save_synapses` (or
+    :meth:`Synapses.save`) in the :class:`Synapses` object ``S``, which
+    should have no synapses and the same model, source and target sizes and
+    timestep as the saved object.
+
+    By default the arrays are memory mapped read-only (``mmap_mode='r'``),
+    so that many processes loading the same file share the same memory.
+    This is fine for analysing the synapses, but the synaptic variables
+    cannot be modified (this includes ``lastupdate`` and the synaptic
+    differential equations): use ``mmap_mode='c'`` (copy-on-write) or
+    ``mmap_mode=None`` (load in memory) to run a simulation. Arrays are
+    copied if synapses are added afterwards.
+
+    Events pending in the spike queues are restored relative to the current
+    time of the queues (the clock is not changed).
+    '''
+    if len(S):
+        raise ValueError('Synapses can only be loaded in an empty Synapses object')
+    header, arrays = read_array_file(filename, MAGIC, VERSION, mmap_mode=mmap_mode)
+    if header['shape'] != (len(S.source), len(S.target)):
+        raise ValueError('Source and target groups should have sizes ' + str(header['shape']))
+    if header['variables'] != _variables(S) or header['pre'] != len(S._delay_pre) or \
+       header['queues'] != len(S.queues):
+        raise ValueError('The Synapses object does not have the same model as the saved one')
+    if abs(header['dt'] - float(S.clock.dt)) > 1e-9 * header['dt']:
+        raise ValueError('The Synapses object should have timestep ' + str(header['dt']) + ' s')
+    if S._iscompressed:
+        S.uncompress()
+    S._S.set_data(arrays['S'])
+    S.presynaptic.set_data(arrays['presynaptic'])
+    S.postsynaptic.set_data(arrays['postsynaptic'])
+    S._delay_post.set_data(arrays['delay_post'])
+    for k, delay_pre in enumerate(S._delay_pre):
+        delay_pre.set_data(arrays['delay_pre_%d' % k])
+    for name, synapses in [('synapses_pre', S.synapses_pre),
+                           ('synapses_post', S.synapses_post)]:
+        ind = arrays[name + '_ind']
+        flat = arrays[name + '_flat']
+        for i, x in enumerate(synapses):
+            x.set_data(flat[ind[i]:ind[i + 1]])
+    S.compress()
+    for k, queue in enumerate(S.queues):
+        if 'queue_%d_delays' % k in arrays:
+            queue.compress()
+            queue.insert(np.array(arrays['queue_%d_delays' % k]),
+                         np.array(arrays['queue_%d_synapses' % k]))
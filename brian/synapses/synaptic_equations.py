@@ -4,6 +4,8 @@ Synaptic equations
 import re
 
 from brian.equations import Equations
+from brian.inspection import get_identifiers
+from brian.optimiser import AffineFunction
 from brian.units import Quantity, scalar_representation, second
 from brian.stdunits import ms
 
@@ -16,6 +18,10 @@ class SynapticEquations(Equations):
     can be marked for an event-driven implementation, e.g.:
     
     ``dx/dt=-x/tau : 1 (event-driven)``
+    
+    Event-driven variables are not integrated at every timestep, but only
+    updated when a pre or postsynaptic event reaches the synapse. See also
+    :meth:`linear_diffeq_names` and :meth:`set_event_driven`.
     '''
     def __init__(self, expr='', level=0, **kwds):
         self._eventdriven={} # dictionary event driven variables (RHS)
@@ -44,6 +50,56 @@ class SynapticEquations(Equations):
         else:
             Equations.add_diffeq(self,name, eq, unit, global_namespace, local_namespace, nonzero)
 
+    def set_event_driven(self, name):
+        '''
+        Marks the (already defined) differential equation of variable
+        ``name`` for an event-driven implementation.
+        '''
+        self._eventdriven[name]=self._string[name]
+        self._diffeq_names_nonzero.remove(name)
+        self._string[name]='0*_unit/second'
+        self._namespace[name]['_unit']=self._units[name]
+        self._namespace[name]['second']=second
+
+    def linear_diffeq_names(self):
+        '''
+        Returns the names of the differential equations that can be turned
+        into event-driven code, i.e., linear equations that only depend on
+        the variable itself, on parameters and on external constants (not
+        on time or noise), and whose variable is not used in other equations.
+        '''
+        parameters=[name for name in self._diffeq_names
+                    if name not in self._diffeq_names_nonzero and name not in self._eventdriven]
+        candidates=[]
+        for name in self._diffeq_names_nonzero:
+            RHS=self._string[name]
+            ids=get_identifiers(RHS)
+            constant=True
+            for id in ids:
+                if id==name or id in parameters:
+                    continue
+                # time, noise, other variables, pre/postsynaptic variables
+                # and functions are excluded
+                if id in ('t','xi') or id in self._string or id not in self._namespace[name] or \
+                   not isinstance(self._namespace[name][id],(int,long,float)):
+                    constant=False
+                    break
+            if not constant:
+                continue
+            # linearity test, as in Equations.is_linear
+            _namespace=dict.fromkeys(ids,1.)
+            _namespace[name]=AffineFunction()
+            try:
+                eval(RHS,self._namespace[name],_namespace)
+            except:
+                continue
+            candidates.append(name)
+        # Variables used in other equations must be continuously updated
+        used=set()
+        for name,RHS in self._string.items()+self._eventdriven.items():
+            used.update([id for id in get_identifiers(RHS) if id!=name])
+        return [name for name in candidates if name not in used]
+
     def is_linear(self):
         if self.refers_others:
             return False
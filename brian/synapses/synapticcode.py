@@ -0,0 +1,288 @@
+'''
+Compiled (weave) code for the pre/post pathways of Synapses.
+
+The pathway code is translated to a C++ loop over the synaptic events
+returned by ``SpikeQueue.peek()``. Since events are processed one at a
+time, several synapses onto the same postsynaptic neuron are handled
+naturally, without the argsort/unique rounds of the Python code.
+
+Only simple code can be translated: assignments (``=``, ``+=``, ``-=``,
+``*=``, ``/=``) of synaptic or postsynaptic variables, with arithmetic
+expressions and comparisons of synaptic, presynaptic (``_pre`` suffix) and
+postsynaptic variables, ``t``, scalar constants and a few mathematical
+functions. For anything else (random numbers, ``n``, control flow...)
+:func:`generate_weave_pathway_code` returns ``None`` and the Python code is
+used. Constants are passed as doubles, so that divisions of two integers
+(integer divisions in Python) are not compiled either. The translation of expressions (:func:`translate_weave_expression`)
+is also used for the compiled STDP codes.
+
+The code can also be executed in parallel with OpenMP, with the synapses
+partitioned by ranges of postsynaptic neurons (see
+:attr:`WeavePathwayCode.partitioned_code`): the events are sorted by
+partition and each thread processes the events of one partition, so that
+different threads never write to the same synaptic or postsynaptic
+variables.
+'''
+import ast
+import re
+import tokenize
+from StringIO import StringIO
+
+import numpy as np
+
+__all__ = ['generate_weave_pathway_code', 'WeavePathwayCode',
+           'weave_pathway_support_code']
+
+# Python functions that can be used in compiled code and their C equivalent
+weave_pathway_functions = {'exp': 'exp', 'log': 'log', 'sqrt': 'sqrt',
+                           'sin': 'sin', 'cos': 'cos', 'tan': 'tan',
+                           'sinh': 'sinh', 'cosh': 'cosh', 'tanh': 'tanh',
+                           'floor': 'floor', 'ceil': 'ceil', 'abs': 'fabs',
+                           'clip': '_brian_clip'}
+
+weave_pathway_support_code = '''
+inline double _brian_clip(const double x, const double low, const double high)
+{
+    if(x<low) return low;
+    if(x>high) return high;
+    return x;
+}
+'''
+
+_allowed_operators = set(['+', '-', '*', '/', '(', ')', ',',
+                          '<', '>', '<=', '>=', '==', '!='])
+# A statement "var op expr" with op in =, +=, -=, *=, /=
+weave_assignment = re.compile(r'^\s*(\w+)\s*([+\-*/]?=)(?!=)\s*(.+)$')
+
+
+class WeavePathwayCode(object):
+    '''
+    C++ code for a Synapses pathway.
+
+    ``code``
+        The C++ code, a loop over the ``_nsynapses`` synapses in
+        ``_synapses``.
+    ``partitioned_code``
+        The parallel (OpenMP) version of ``code``, which also takes the
+        partition of each synapse (``_partition``), the number of partitions
+        (``_npartitions``) and two buffers (``_sorted``, at least as long as
+        ``_synapses``, and ``_bounds``, of length ``_npartitions+1``).
+    ``synaptic_vars``, ``pre_vars``, ``post_vars``
+        The names of the synaptic, presynaptic and postsynaptic variables
+        used, which are passed to the code as ``name``, ``_source_name``
+        and ``_target_name``.
+    ``constants``
+        The names of the scalar constants, which are passed as doubles with
+        the prefix ``_c_``.
+    '''
+    def __init__(self, statements, synaptic_vars, pre_vars, post_vars, constants):
+        self.code = '''
+    for(int _k=0; _k<_nsynapses; _k++)
+    {
+        const int _s = _synapses[_k];
+        const int _i = _pre[_s];
+        const int _j = _post[_s];
+        %s
+    }
+    ''' % '\n        '.join(statements)
+        self.partitioned_code = '''
+    // Stable counting sort of the events by partition
+    for(int _p=0; _p<=_npartitions; _p++)
+        _bounds[_p] = 0;
+    for(int _k=0; _k<_nsynapses; _k++)
+        _bounds[_partition[_synapses[_k]]+1]++;
+    for(int _p=0; _p<_npartitions; _p++)
+        _bounds[_p+1] += _bounds[_p];
+    for(int _k=0; _k<_nsynapses; _k++)
+    {
+        const int _p = _partition[_synapses[_k]];
+        _sorted[_bounds[_p]++] = _synapses[_k];
+    }
+    for(int _p=_npartitions; _p>0; _p--)
+        _bounds[_p] = _bounds[_p-1];
+    _bounds[0] = 0;
+    // Each partition is processed by one thread
+    #pragma omp parallel for schedule(dynamic)
+    for(int _p=0; _p<_npartitions; _p++)
+    {
+        for(int _k=_bounds[_p]; _k<_bounds[_p+1]; _k++)
+        {
+            const int _s = _sorted[_k];
+            const int _i = _pre[_s];
+            const int _j = _post[_s];
+            %s
+        }
+    }
+    ''' % '\n            '.join(statements)
+        self.synaptic_vars = synaptic_vars
+        self.pre_vars = pre_vars
+        self.post_vars = post_vars
+        self.constants = constants
+        self.arg_names = (['_synapses', '_nsynapses', '_pre', '_post', 't'] +
+                          list(synaptic_vars) +
+                          ['_source_' + var for var in pre_vars] +
+                          ['_target_' + var for var in post_vars] +
+                          ['_c_' + name for name in constants])
+        self.partitioned_arg_names = self.arg_names + ['_partition', '_npartitions',
+                                                       '_sorted', '_bounds']
+
+
+def _is_constant(value):
+    return isinstance(value, (int, long, float, np.number)) and \
+           not isinstance(value, bool)
+
+
+def _is_integer(node, integer_names):
+    # whether the value of the expression node is an integer in Python
+    if isinstance(node, ast.Num):
+        return isinstance(node.n, (int, long))
+    elif isinstance(node, ast.Name):
+        return node.id in integer_names
+    elif isinstance(node, ast.UnaryOp):
+        return _is_integer(node.operand, integer_names)
+    elif isinstance(node, ast.BinOp):
+        return _is_integer(node.left, integer_names) and \
+               _is_integer(node.right, integer_names)
+    elif isinstance(node, ast.Compare): # booleans
+        return True
+    elif isinstance(node, ast.Call): # abs keeps integers
+        return getattr(node.func, 'id', None) == 'abs' and \
+               all(_is_integer(arg, integer_names) for arg in node.args)
+    return False
+
+
+def has_integer_division(expr, integer_names=()):
+    '''
+    Whether the Python expression ``expr`` divides two integers (an integer
+    division in Python 2, but not in C if the operands are doubles), where
+    ``integer_names`` are the names of the integer variables.
+    '''
+    try:
+        tree = ast.parse(expr.strip(), mode='eval')
+    except SyntaxError:
+        return False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Div) and \
+           _is_integer(node.left, integer_names) and \
+           _is_integer(node.right, integer_names):
+            return True
+    return False
+
+
+def translate_weave_expression(expr, translate_name, integer_names=()):
+    '''
+    Translates the Python expression ``expr`` to C, or returns ``None`` if it
+    is not supported. Numbers, arithmetic operators, comparisons and the
+    functions of ``weave_pathway_functions`` are allowed, and the other
+    identifiers are translated by the function ``translate_name``, which
+    returns their C version or ``None`` if they are not allowed. Divisions of
+    two integers (integer literals or ``integer_names``) are not supported,
+    because they do not give the same result in Python and C.
+    '''
+    try:
+        tokens = list(tokenize.generate_tokens(StringIO(expr).readline))
+    except (tokenize.TokenError, IndentationError):
+        return None
+    if has_integer_division(expr, integer_names):
+        return None
+    result = []
+    for k, (toktype, tok, _, _, _) in enumerate(tokens):
+        next_tok = tokens[k + 1][1] if k + 1 < len(tokens) else ''
+        if toktype in (tokenize.ENDMARKER, tokenize.NEWLINE, tokenize.NL):
+            continue
+        elif toktype == tokenize.NUMBER:
+            if tok[-1] in 'lLjJ':
+                return None
+            result.append(tok)
+        elif toktype == tokenize.OP:
+            if tok not in _allowed_operators:
+                return None
+            result.append(tok)
+        elif toktype == tokenize.NAME:
+            if next_tok == '(':
+                if tok not in weave_pathway_functions:
+                    return None
+                result.append(weave_pathway_functions[tok])
+            else:
+                name = translate_name(tok)
+                if name is None:
+                    return None
+                result.append(name)
+        else:
+            return None
+    return ' '.join(result)
+
+
+def _translate_expression(expr, synaptic_vars, pre_vars, post_vars,
+                          namespace, used):
+    '''
+    Translates a pathway expression to C, or returns ``None`` if it is not
+    supported. The names of the variables are added to the sets in the
+    dictionary ``used``.
+    '''
+    def translate_name(tok):
+        if tok in synaptic_vars:
+            used['synaptic'].add(tok)
+            return tok + '[_s]'
+        elif tok.endswith('_post') and tok[:-5] in post_vars:
+            used['post'].add(tok[:-5])
+            return '_target_' + tok[:-5] + '[_j]'
+        elif tok in post_vars:
+            used['post'].add(tok)
+            return '_target_' + tok + '[_j]'
+        elif tok.endswith('_pre') and tok[:-4] in pre_vars:
+            used['pre'].add(tok[:-4])
+            return '_source_' + tok[:-4] + '[_i]'
+        elif tok == 't':
+            return 't'
+        elif tok in namespace and _is_constant(namespace[tok]):
+            used['constants'].add(tok)
+            return '_c_' + tok
+        return None
+    integer_names = [name for name, value in namespace.iteritems()
+                     if _is_constant(value) and
+                        isinstance(value, (int, long, np.integer))]
+    return translate_weave_expression(expr, translate_name, integer_names)
+
+
+def generate_weave_pathway_code(code, synaptic_vars, pre_vars, post_vars,
+                                namespace):
+    '''
+    Returns a :class:`WeavePathwayCode` object for the pathway code ``code``
+    (multiple statements separated by newlines or ``;``), or ``None`` if the
+    code cannot be compiled.
+
+    ``synaptic_vars``, ``pre_vars`` and ``post_vars`` are the names of the
+    variables of the Synapses object and of the source and target groups,
+    ``namespace`` is the namespace of the code (for constants).
+    '''
+    used = {'synaptic': set(), 'pre': set(), 'post': set(), 'constants': set()}
+    statements = []
+    for line in re.split(r'[\n;]', code):
+        line = line.split('#')[0].strip()
+        if not line:
+            continue
+        m = weave_assignment.match(line)
+        if m is None:
+            return None
+        var, op, expr = m.groups()
+        if var in synaptic_vars:
+            used['synaptic'].add(var)
+            lhs = var + '[_s]'
+        elif var.endswith('_post') and var[:-5] in post_vars:
+            used['post'].add(var[:-5])
+            lhs = '_target_' + var[:-5] + '[_j]'
+        elif var in post_vars:
+            used['post'].add(var)
+            lhs = '_target_' + var + '[_j]'
+        else:
+            return None
+        rhs = _translate_expression(expr, synaptic_vars, pre_vars, post_vars,
+                                    namespace, used)
+        if rhs is None:
+            return None
+        statements.append(lhs + ' ' + op + ' ' + rhs + ';')
+    if not statements:
+        return None
+    return WeavePathwayCode(statements, sorted(used['synaptic']), sorted(used['pre']),
+                            sorted(used['post']), sorted(used['constants']))
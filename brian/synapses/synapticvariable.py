@@ -35,7 +35,8 @@ class SynapticVariable(object):
         vectorised operation, where ``i`` is the presynaptic neuron index (a vector
         of length the number of synapses), ``j`` is the postsynaptic neuron index and
         ``n`` is the number of synapses. The methods ``rand`` and ``randn`` return
-        arrays of n random values.
+        arrays of n random values (drawn from the random stream of the Synapses
+        object).
         
     Initialised with arguments:
 
@@ -81,8 +82,8 @@ class SynapticVariable(object):
         for var in self.synapses.var_index: # maybe synaptic variables should have higher priority
             if isinstance(var,str):
                 _namespace[var] = self.synapses.state(var)[synapses]
-        _namespace['rand'] = self._Replacer(np.random.rand, len(synapses))
-        _namespace['randn'] = self._Replacer(np.random.randn, len(synapses))
+        _namespace['rand'] = self._Replacer(self.synapses._random.rand, len(synapses))
+        _namespace['randn'] = self._Replacer(self.synapses._random.randn, len(synapses))
         return eval(code, _namespace)
         
     def to_matrix(self, multiple_synapses='last'):
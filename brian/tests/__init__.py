@@ -39,13 +39,8 @@ def repeat_with_global_opts(opt_list):
     def decorator(func):
         def wrapper(*args, **kwds):
             for opts in opt_list:
-                # save old preferences
-                old_preferences = get_global_preferences()
-                set_global_preferences(**opts)
                 print 'Repeating test %s with options: %s' % (func.__name__, opts)
-                func(*args, **kwds)
-                # reset preferences
-                set_global_preferences(**old_preferences)
+                call_with_global_opts(opts, func, *args, **kwds)
 
         #make sure that the wrapper has the same name as the original function
         #otherwise nose will ignore the functions as they are not called
@@ -56,6 +51,32 @@ def repeat_with_global_opts(opt_list):
         return wrapper
     
     return decorator
+
+def call_with_global_opts(opts, func, *args, **kwds):
+    '''
+    Calls ``func(*args, **kwds)`` with the global options ``opts`` (a
+    dictionary of keyword/value combinations for the `set_global_preferences`
+    function) and returns its result. The global preferences are reset to
+    their previous values after the call, even if it fails.
+    '''
+    old_preferences = get_global_preferences()
+    set_global_preferences(**opts)
+    try:
+        return func(*args, **kwds)
+    finally:
+        set_global_preferences(**old_preferences)
+
+def python_and_weave_results(func, *args, **kwds):
+    '''
+    Returns the results of ``func(*args, **kwds)`` without and with weave
+    (global option ``useweave``), to compare compiled and Python codes.
+    
+    Example usage:
+    
+        python_result, weave_result = python_and_weave_results(run_model, N=10)
+    '''
+    return tuple(call_with_global_opts({'useweave': useweave}, func, *args, **kwds)
+                 for useweave in [False, True])
         
 if __name__ == '__main__':
     go()
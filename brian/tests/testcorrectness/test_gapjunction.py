@@ -0,0 +1,89 @@
+'''
+Gap junction currents computed from a sparse matrix.
+'''
+from brian import *
+from brian.tests import call_with_global_opts, python_and_weave_results
+from numpy.random import RandomState
+from numpy.testing import assert_array_almost_equal
+
+def gap_currents(W, vs, vt, source_is_target=False):
+    eqs = '''
+    v : 1
+    I_gap : 1
+    '''
+    target = NeuronGroup(W.shape[1], eqs)
+    target.v = vt
+    if source_is_target:
+        source = target
+    else:
+        source = NeuronGroup(W.shape[0], eqs)
+        source.v = vs
+    G = GapJunction(source, target, W)
+    G()
+    return target.I_gap[:].copy()
+
+def test_gapjunction_currents():
+    '''
+    Compare the currents with a dense computation, with and without weave.
+    '''
+    rng = RandomState(3)
+    W = rng.rand(20, 30) * (rng.rand(20, 30) < 0.2)
+    vs, vt = rng.randn(20), rng.randn(30)
+    expected = dot(W.T, vs) - W.sum(axis=0) * vt
+    for I in python_and_weave_results(gap_currents, W, vs, vt) + \
+             python_and_weave_results(gap_currents, sparse.lil_matrix(W), vs, vt):
+        assert_array_almost_equal(I, expected)
+    # coupling within a group
+    W = rng.rand(30, 30) * (rng.rand(30, 30) < 0.2)
+    W = W + W.T
+    I = call_with_global_opts({'useweave': False}, gap_currents, W, vt, vt,
+                              source_is_target=True)
+    assert_array_almost_equal(I, dot(W.T, vt) - W.sum(axis=0) * vt)
+    # the currents are conserved
+    assert abs(I.sum()) < 1e-10
+
+def test_gapjunction_network_operation():
+    '''
+    Same simulation as with a network operation and a dense matrix.
+    '''
+    N = 10
+    v0 = 1.05
+    tau = 10 * ms
+    eqs = '''
+    dv/dt=(v0-v+I_gap)/tau : 1
+    I_gap : 1
+    '''
+    W = .02 * (1 - eye(N))
+    reinit_default_clock()
+    P1 = NeuronGroup(N, model=eqs, threshold=1, reset=0)
+    P1.v = linspace(0, 1, N)
+    @network_operation(when='before_groups')
+    def gap():
+        P1.I_gap = dot(W.T, P1.v) - W.sum(axis=0) * P1.v
+    M1 = SpikeMonitor(P1)
+    net = Network(P1, gap, M1)
+    net.run(50 * ms)
+    reinit_default_clock()
+    P2 = NeuronGroup(N, model=eqs, threshold=1, reset=0)
+    P2.v = linspace(0, 1, N)
+    G = GapJunction(P2, P2, W)
+    assert G.W.getnnz() == N * (N - 1)
+    M2 = SpikeMonitor(P2)
+    net = Network(P2, G, M2)
+    net.run(50 * ms)
+    assert len(M1.spikes) > 0
+    assert_array_almost_equal(P1.v[:], P2.v[:])
+    assert M1.spikes == M2.spikes
+
+def test_gapjunction_shape():
+    P = NeuronGroup(3, 'v : 1\nI_gap : 1')
+    try:
+        GapJunction(P, P, ones((2, 3)))
+        raise AssertionError('ValueError not raised')
+    except ValueError:
+        pass
+
+if __name__ == '__main__':
+    test_gapjunction_currents()
+    test_gapjunction_network_operation()
+    test_gapjunction_shape()
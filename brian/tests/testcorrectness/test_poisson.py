@@ -0,0 +1,93 @@
+'''
+Make sure that the Poisson spikes generated by skipping ahead have the same
+statistics as those generated with one random number per neuron.
+'''
+from brian import *
+from brian.threshold import skip_ahead_indices
+from numpy.testing import assert_array_almost_equal
+
+def test_skip_ahead_indices():
+    '''
+    Each index is selected with probability p.
+    '''
+    for n, p in [(20, 0.01), (20, 0.2), (20, 0.5), (1, 0.1)]:
+        counts = zeros(n)
+        for _ in range(20000):
+            indices = skip_ahead_indices(n, p)
+            assert all(diff(indices) > 0)
+            assert all((indices >= 0) & (indices < n))
+            counts[indices] += 1
+        assert_array_almost_equal(counts / 20000., p * ones(n), decimal=1)
+        assert max(abs(counts / 20000. - p)) < 5 * sqrt(p / 20000.)
+    assert len(skip_ahead_indices(0, 0.1)) == 0
+    assert len(skip_ahead_indices(10, 0)) == 0
+
+def test_poissongroup_max_rate():
+    '''
+    Constant and time-varying rates with thinning.
+    '''
+    reinit_default_clock()
+    N = 10000
+    rates = linspace(0, 20, N) * Hz
+    P = PoissonGroup(N, rates, max_rate=20 * Hz)
+    M = SpikeCounter(P)
+    # time-varying rates
+    Q = PoissonGroup(N, lambda t: 10 * Hz * (t > 50 * ms), max_rate=10 * Hz)
+    MQ = SpikeCounter(Q)
+    run(100 * ms)
+    counts = M.count
+    # 1 spike/neuron on average, compare the two halves of the group
+    assert abs(sum(counts[:N / 2]) - 0.25 * N) < 5 * sqrt(0.25 * N)
+    assert abs(sum(counts[N / 2:]) - 0.75 * N) < 5 * sqrt(0.75 * N)
+    assert counts[0] == 0
+    assert abs(sum(MQ.count) - 0.5 * N) < 5 * sqrt(0.5 * N)
+
+def test_poissongroup_block():
+    '''
+    Time-varying rates evaluated for blocks of timesteps.
+    '''
+    reinit_default_clock()
+    N = 10000
+    # vectorised function, TimedArray and function of a scalar t
+    P1 = PoissonGroup(N, lambda t: 20 * Hz * (t > 50 * ms), block=64)
+    P2 = PoissonGroup(N, TimedArray(hstack((zeros(500), 20 * ones(500))) * Hz),
+                      block=64, max_rate=20 * Hz)
+    def f(t):
+        if t > 50 * ms:
+            return 20 * Hz
+        return 0 * Hz
+    P3 = PoissonGroup(N, f, block=64)
+    assert all(isinstance(P._threshold, PoissonScheduleThreshold) for P in [P1, P2, P3])
+    M1, M2, M3 = SpikeCounter(P1), SpikeCounter(P2), SpikeCounter(P3)
+    R = StateMonitor(P1, 'rate', record=[0])
+    run(100 * ms)
+    assert P1._threshold._vectorised
+    assert not P3._threshold._vectorised
+    for M in [M1, M2, M3]:
+        # 1 spike/neuron on average
+        assert abs(sum(M.count) - N) < 5 * sqrt(N)
+    assert_array_almost_equal(R[0], 20 * (R.times > 50 * ms))
+    # the clock goes back in time
+    reinit_default_clock()
+    P1.reinit()
+    M1.reinit()
+    run(50 * ms)
+    assert sum(M1.count) == 0
+
+def test_poissoninput():
+    '''
+    Number of events received by each target neuron.
+    '''
+    reinit_default_clock()
+    G = NeuronGroup(1000, 'v : 1')
+    inp = PoissonInput(G, N=100, rate=10 * Hz, weight=1., state='v')
+    run(100 * ms)
+    # 100 events per neuron on average
+    assert abs(mean(G.v) - 100) < 5 * sqrt(100. / 1000)
+    assert abs(var(G.v) - 100) < 20
+
+if __name__ == '__main__':
+    test_skip_ahead_indices()
+    test_poissongroup_max_rate()
+    test_poissongroup_block()
+    test_poissoninput()
@@ -0,0 +1,64 @@
+'''
+Make sure that the compiled STDP codes do the same thing as the Python
+codes.
+'''
+from brian import *
+from scipy import sparse
+from brian.stdp import generate_weave_stdp_code
+from brian.tests import python_and_weave_results
+from numpy.testing import assert_array_almost_equal
+
+def run_stdp(structure, interactions, update):
+    reinit_default_clock()
+    N, M = 5, 4
+    # presynaptic spikes on odd time steps, postsynaptic spikes on even
+    # time steps (the order of the pre and post updates is not defined
+    # for simultaneous spikes)
+    spikes = [(i, (30 * k + 6 * i + 1.5) * 0.1 * ms) for i in range(N) for k in range(8)]
+    source = SpikeGeneratorGroup(N, spikes)
+    spikes = [(j, (20 * k + 6 * j + 5.5) * 0.1 * ms) for j in range(M) for k in range(12)]
+    driver = SpikeGeneratorGroup(M, spikes)
+    target = NeuronGroup(M, model='v : 1', threshold=1, reset=0)
+    drive = IdentityConnection(driver, target, 'v', weight=2)
+    W = linspace(0, 1, N * M).reshape((N, M))
+    W[W < 0.2] = 0
+    C = Connection(source, target, 'v', structure=structure,
+                   weight=sparse.csr_matrix(W))
+    stdp = ExponentialSTDP(C, 10 * ms, 15 * ms, 0.2, -0.25,
+                           interactions=interactions, wmax=0.9,
+                           update=update)
+    net = Network(source, driver, target, C, drive, stdp)
+    net.run(25 * ms)
+    return C.W.todense(), stdp
+
+def test_weave_stdp():
+    '''
+    Compare compiled and Python STDP codes.
+    '''
+    for structure in ['sparse', 'dense']:
+        for interactions in ['all', 'nearest', 'nearest_pre', 'nearest_post']:
+            for update in ['additive', 'multiplicative', 'mixed']:
+                (W_python, stdp_python), (W_weave, stdp_weave) = \
+                    python_and_weave_results(run_stdp, structure, interactions, update)
+                for updater in stdp_weave.contained_objects[:2]:
+                    assert updater._weave_code is not None
+                assert_array_almost_equal(W_python, W_weave)
+                assert_array_almost_equal(stdp_python.A_pre, stdp_weave.A_pre)
+                assert_array_almost_equal(stdp_python.A_post, stdp_weave.A_post)
+
+def test_weave_stdp_fallback():
+    '''
+    Codes that cannot be compiled.
+    '''
+    def generate(code):
+        return generate_weave_stdp_code(code, ['A_pre'], ['A_post'], False, 0, 1)
+    code = generate('A_pre+=0.1 # comment\nw=clip(w+exp(-A_post), 0, 1)')
+    assert code.vars == ['A_post', 'A_pre']
+    assert len(code.blocks) == 2
+    for code in ['A_pre+=rand()', 'A_pre+=A_post', 'A_post+=1', 'A_pre+=w',
+                 'w+=B', 'w**=2', 'if A_pre>1: w=0', 'w+=A_post[0]']:
+        assert generate(code) is None
+
+if __name__ == '__main__':
+    test_weave_stdp()
+    test_weave_stdp_fallback()
@@ -0,0 +1,76 @@
+'''
+Make sure that per-synapse STP gives the same results as STP with variables
+stored per presynaptic neuron.
+'''
+from brian import *
+from brian.tests import repeat_with_global_opts
+from scipy import sparse
+from numpy.testing import assert_array_almost_equal
+
+def run_stp(per_synapse, structure, W, taud, tauf, U):
+    reinit_default_clock()
+    N, M = W.shape
+    spikes = [(i, (3 * k + i + 0.55) * ms) for i in range(N) for k in range(10)]
+    source = SpikeGeneratorGroup(N, spikes)
+    target = NeuronGroup(M, model='v : 1')
+    C = Connection(source, target, 'v', structure=structure,
+                   weight=sparse.csr_matrix(W), delay=0.5 * ms)
+    stp = STP(C, taud=taud, tauf=tauf, U=U, per_synapse=per_synapse)
+    net = Network(source, target, C, stp)
+    net.run(40 * ms)
+    return target.v[:], stp
+
+@repeat_with_global_opts([{'useweave': False}, {'useweave': True}])
+def test_per_synapse_stp():
+    '''
+    Per-synapse STP with homogeneous parameters, and with heterogeneous
+    parameters on a one-to-one connection.
+    '''
+    W = array([[0.5, 0, 1.],
+               [0, 2., 0.5],
+               [1.5, 1., 0]])
+    for structure in ['sparse', 'dense']:
+        v, _ = run_stp(False, structure, W, 100 * ms, 10 * ms, 0.3)
+        v_synapses, stp = run_stp(True, structure, W, 100 * ms, 10 * ms, 0.3)
+        assert_array_almost_equal(v, v_synapses)
+        if structure == 'sparse':
+            assert len(stp.vars.u) == 6
+
+    W = diag([0.5, 1., 2., 1.5])
+    taud = array([50., 100., 200., 300.]) * ms
+    tauf = array([5., 10., 20., 50.]) * ms
+    U = array([0.1, 0.2, 0.5, 0.9])
+    v, _ = run_stp(False, 'sparse', W, taud, tauf, U)
+    v_synapses, _ = run_stp(True, 'sparse', W, taud, tauf, U)
+    assert_array_almost_equal(v, v_synapses)
+    assert (v > 0).all()
+
+def test_per_synapse_stp_connection():
+    '''
+    The connection keeps its source and delay, and is not propagated twice
+    when it is fused with other connections from the same source.
+    '''
+    reinit_default_clock()
+    source = SpikeGeneratorGroup(2, [(0, 1 * ms), (1, 2 * ms)])
+    target = NeuronGroup(2, model='v : 1\nw : 1')
+    C = Connection(source, target, 'v', weight=1., delay=0.5 * ms)
+    C2 = Connection(source, target, 'w', weight=1., delay=0.5 * ms)
+    C3 = Connection(source, target, 'w', weight=1., delay=0.5 * ms)
+    stp = STP(C, taud=100 * ms, tauf=10 * ms, U=0.3, per_synapse=True)
+    assert C.source is source
+    net = Network(source, target, C, C2, C3, stp)
+    net.run(5 * ms)
+    assert_array_almost_equal(target.v[:], [0.6, 0.6])
+    assert_array_almost_equal(target.w[:], [4., 4.])
+    # dynamic matrices are rejected before the connection is modified
+    D = Connection(source, target, 'v', structure='dynamic', weight=1.)
+    try:
+        STP(D, taud=100 * ms, tauf=10 * ms, U=0.3, per_synapse=True)
+        raise AssertionError('TypeError not raised')
+    except TypeError:
+        pass
+    assert not D.iscompressed
+
+if __name__ == '__main__':
+    test_per_synapse_stp()
+    test_per_synapse_stp_connection()
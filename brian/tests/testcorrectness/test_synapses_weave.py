@@ -0,0 +1,126 @@
+'''
+Make sure that the compiled pre/post codes of the Synapses class do the same
+thing as the Python codes.
+'''
+from brian import *
+from brian.synapses.synapticcode import generate_weave_pathway_code, translate_weave_expression
+from brian.tests import call_with_global_opts, python_and_weave_results
+from numpy.testing import assert_array_almost_equal
+
+def run_synapses(partitions=1):
+    reinit_default_clock()
+    N = 5
+    spikes = [(i, (2 * k + i * 0.1) * ms) for i in range(N) for k in range(5)]
+    source = SpikeGeneratorGroup(N, spikes)
+    target = NeuronGroup(3, model='''dv/dt = (1.2 - v) / (10 * ms) : 1
+                                     x : 1''', threshold=1, reset=0)
+    target.x = [0.5, 1., 2.]
+    A = 0.05
+    wmax = 0.4
+    # several synapses onto the same postsynaptic neuron
+    S = Synapses(source, target, model='w : 1',
+                 pre='''v += w * x_post
+                        w = clip(w + A * exp(-v_post) - 0.01 * x_post, 0, wmax)''',
+                 post='w -= A / 2', partitions=partitions)
+    S[:, :] = True
+    S.w[:] = linspace(0, 0.3, len(S))
+    S.delay[:, 0] = 1 * ms
+    net = Network(source, target, S)
+    net.run(15 * ms)
+    return S, target
+
+def test_weave_pathways():
+    '''
+    Compare compiled and Python pre/post codes.
+    '''
+    (S_python, target_python), (S_weave, target_weave) = \
+        python_and_weave_results(run_synapses)
+    assert all(code is None for code in S_python._weave_codes)
+    assert all(code is not None for code in S_weave._weave_codes)
+    assert_array_almost_equal(S_python.w[:], S_weave.w[:])
+    assert_array_almost_equal(target_python.v[:], target_weave.v[:])
+
+def test_partitioned_pathways():
+    '''
+    Compare the parallel compiled codes (with synapses partitioned by
+    postsynaptic neurons) and Python codes.
+    '''
+    S_python, target_python = call_with_global_opts({'useweave': False}, run_synapses)
+    S_weave, target_weave = call_with_global_opts({'useweave': True}, run_synapses,
+                                                  partitions=2)
+    assert S_weave._npartitions == 2
+    assert all(code is not None for code in S_weave._weave_codes)
+    # synapses onto the same neuron are in the same partition
+    for j in range(len(target_weave)):
+        assert len(unique(S_weave._partition[S_weave.postsynaptic[:] == j])) == 1
+    assert_array_almost_equal(S_python.w[:], S_weave.w[:])
+    assert_array_almost_equal(target_python.v[:], target_weave.v[:])
+
+def test_integer_constants():
+    '''
+    Integer constants give the same results in compiled and Python codes.
+    '''
+    def run_integer_division():
+        a, b = 1, 2
+        reinit_default_clock()
+        source = SpikeGeneratorGroup(1, [(0, 1 * ms)])
+        target = NeuronGroup(1, 'v : 1')
+        S = Synapses(source, target, model='w : 1',
+                     pre=['v += a/b', 'v += 3*a/2.'])
+        S[:, :] = True
+        net = Network(source, target, S)
+        net.run(3 * ms)
+        return S, target.v[:].copy()
+    (S_python, v_python), (S_weave, v_weave) = python_and_weave_results(run_integer_division)
+    # the integer division is not compiled
+    assert S_weave._weave_codes[0] is None
+    assert S_weave._weave_codes[1] is not None
+    assert_array_almost_equal(v_python, [1.5])
+    assert_array_almost_equal(v_weave, [1.5])
+
+def test_openmp_flags():
+    '''
+    OpenMP is only used with gcc and the openmp preference.
+    '''
+    G = NeuronGroup(2, 'v : 1')
+    for openmp, compiler, args in [(False, 'gcc', []), (True, 'msvc', []),
+                                   (True, 'gcc', ['-fopenmp'])]:
+        S = call_with_global_opts({'openmp': openmp, 'weavecompiler': compiler},
+                                  Synapses, G, G, model='w : 1', pre='v += w',
+                                  partitions=2)
+        assert S._openmp_args == args
+
+def test_weave_pathway_fallback():
+    '''
+    Codes that cannot be compiled.
+    '''
+    synaptic_vars, pre_vars, post_vars = ['w'], ['u'], ['v']
+    namespace = {'A': 0.1, 'f': lambda x: x, 'a': 1, 'b': 2}
+    def generate(code):
+        return generate_weave_pathway_code(code, synaptic_vars, pre_vars,
+                                           post_vars, namespace)
+    code = generate('v+=w*A\nw=clip(w+u_pre, 0, 1) # comment')
+    assert code.synaptic_vars == ['w']
+    assert code.pre_vars == ['u']
+    assert code.post_vars == ['v']
+    assert code.constants == ['A']
+    for code in ['w+=rand()', 'v+=n', 'u_pre+=w', 'w=f(v)', 'w**=2',
+                 'w+=B', 'if v>1: w=0', 'w+=v[0]']:
+        assert generate(code) is None
+    # integer divisions are floored in Python
+    for code in ['w+=a/b', 'w+=1/2', 'w+=(a+1)/-b', 'w+=w*(a/2)', 'w+=abs(a)/b']:
+        assert generate(code) is None
+    for code in ['w+=a/A', 'w+=1./b', 'w+=w*a/b', 'w/=b', 'v+=exp(a)/b']:
+        assert generate(code) is not None
+    # the expression translator shared with STDP
+    names = {'x': 'x[_i]'}
+    assert translate_weave_expression('exp(-x)*2.5', names.get) == 'exp ( - x[_i] ) * 2.5'
+    for expr in ['x**2', 'y+x', 'f(x)', 'x[0]', '3j', 'x+(']:
+        assert translate_weave_expression(expr, names.get) is None
+
+if __name__ == '__main__':
+    test_weave_pathways()
+    test_partitioned_pathways()
+    test_integer_constants()
+    test_openmp_flags()
+    test_weave_pathway_fallback()
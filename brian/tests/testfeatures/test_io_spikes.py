@@ -8,11 +8,15 @@ Bad news:
 - stacking of spikes makes this test fail if dt is too big. In this case in the SpikeGeneratorGroup some spikes are discarded.
 
 '''
+import os
+import tempfile
 import time
 from brian import *
 from brian.tools.io import *
 
 N = 1000
+# the spikes are saved in the temporary directory, not in the current one
+aer_filename = os.path.join(tempfile.gettempdir(), 'dummy.aedat')
 
 def do_spikeio_test(test = 'save', dt = .1*ms):
     '''
@@ -32,13 +36,13 @@ def do_spikeio_test(test = 'save', dt = .1*ms):
         # first generate some spikes
         g = PoissonGroup(N, 200*Hz)
         # with a monitor
-        Maer = AERSpikeMonitor(g, './dummy.aedat')
+        Maer = AERSpikeMonitor(g, aer_filename)
         M = SpikeMonitor(g)
         run(100*ms)
         Maer.close()
 
         # reload the spikes
-        addr, timestamps = load_aer('./dummy.aedat')
+        addr, timestamps = load_aer(aer_filename)
 
         # compare the recorded spikes number etc...
         if len(addr) == M.nspikes:
@@ -49,7 +53,7 @@ def do_spikeio_test(test = 'save', dt = .1*ms):
 
 
     elif test == 'reload':
-        addr, timestamps = load_aer('./dummy.aedat')
+        addr, timestamps = load_aer(aer_filename)
 
         # check interface with SpikeGeneratorGroup
         group = SpikeGeneratorGroup(N, (addr, timestamps))
@@ -69,7 +73,7 @@ def do_speedtest_saving():
     t0 = time.time()
     g = PoissonGroup(N, 200*Hz)
     # with a monitor
-    Maer = AERSpikeMonitor(g, './dummy.aedat')
+    Maer = AERSpikeMonitor(g, aer_filename)
     run(1000*ms)
     print "AERSpikeMonitor ", time.time()-t0
 
@@ -79,7 +83,7 @@ def do_speedtest_saving():
     t0 = time.time()
     g = PoissonGroup(N, 200*Hz)
     # with a monitor
-    Maer = FileSpikeMonitor(g, './dummy.txt')
+    Maer = FileSpikeMonitor(g, os.path.join(tempfile.gettempdir(), 'dummy.txt'))
     run(1000*ms)
     print "FileSpikeMonitor ", time.time()-t0
 
@@ -0,0 +1,53 @@
+from numpy.testing import assert_equal
+
+from brian import *
+from numpy.random import seed
+
+def test_noisebuffer():
+    '''
+    Blocks of random numbers.
+    '''
+    B = NoiseBuffer('normal', blocksize=1000, seed=42)
+    x = hstack([B.get(300).copy() for _ in range(10)])
+    assert len(x) == 3000
+    # the rest of a block is discarded
+    assert_equal(x[:900], RandomStream(42).standard_normal(1000)[:900])
+    # same stream in a background thread
+    B2 = NoiseBuffer('normal', blocksize=1000, seed=42, background=True)
+    x2 = hstack([B2.get(300).copy() for _ in range(10)])
+    assert_equal(x2, x)
+    # numbers larger than a block
+    x = B.get(2500)
+    assert len(x) == 2500
+    assert_equal(B2.get(2500), x)
+    B2.stop()
+    # independent streams, reproducible with numpy.random.seed
+    seed(1)
+    B1, B2 = NoiseBuffer('uniform'), NoiseBuffer('uniform')
+    x1, x2 = B1.get(10).copy(), B2.get(10).copy()
+    assert not any(x1 == x2)
+    assert all((x1 >= 0) & (x1 < 1))
+    seed(1)
+    assert_equal(NoiseBuffer('uniform').get(10), x1)
+    assert all(NoiseBuffer('exponential').get(100) > 0)
+    try:
+        NoiseBuffer('cauchy')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('Unknown distributions should raise a ValueError')
+
+def test_synaptic_noise():
+    '''
+    Diffusion driven by the noise term xi.
+    '''
+    reinit_default_clock()
+    G = NeuronGroup(10000, 'dv/dt = xi / (10 * ms) ** .5 : 1')
+    run(100 * ms)
+    # variance t/(10 ms)
+    assert abs(var(G.v) - 10) < 0.5
+    assert abs(mean(G.v)) < 0.2
+
+if __name__ == '__main__':
+    test_noisebuffer()
+    test_synaptic_noise()
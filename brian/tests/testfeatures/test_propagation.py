@@ -1,4 +1,7 @@
 from brian import *
+from nose.tools import *
+from numpy.testing import assert_array_almost_equal
+from brian.tests import repeat_with_global_opts
 
 def test_structures():
     reinit_default_clock()
@@ -34,5 +37,73 @@ def test_structures():
         else:
             assert (j == (1 + arange(10))).all(), 'Problem with connection ' + str(k) + ': j=' + str(j)
 
+@repeat_with_global_opts([{'useweave': False}, {'useweave': True}])
+def test_dense_propagation_strategies():
+    reinit_default_clock()
+    G = NeuronGroup(40, 'V:1\nmod:1')
+    H = NeuronGroup(30, 'V:1')
+    G.mod = rand(40)
+    W = rand(40, 30)
+    for modulation in [None, 'mod']:
+        for propagation in ['rows', 'gather', 'indicator', 'auto']:
+            C = Connection(G, H, 'V', structure='dense', modulation=modulation,
+                           propagation=propagation)
+            C.connect(G, H, W)
+            for spikes in [[], [3], [0, 5, 7, 39], range(0, 40, 3), range(40)]:
+                H.V = 0
+                C.propagate(spikes)
+                if modulation is None:
+                    expected = W[spikes, :].sum(axis=0)
+                else:
+                    expected = dot(G.mod[spikes], W[spikes, :])
+                assert_array_almost_equal(H.V, expected)
+    # automatic selection of the strategy
+    C = Connection(G, H, 'V', structure='dense', weight=1)
+    C.compress()
+    assert C.W.propagation_strategy(1) == 'rows'
+    assert C.W.propagation_strategy(1, useaccel=True) == 'rows'
+    assert C.W.propagation_strategy(8) == 'gather'
+    assert C.W.propagation_strategy(20) == 'indicator'
+    C = Connection(G, H, 'V', structure='dense', weight=1, propagation='gather')
+    C.compress()
+    assert C.W.propagation_strategy(1) == 'gather'
+    # the keyword is checked when the connection is created
+    assert_raises(ValueError, Connection, G, H, 'V', structure='dense', propagation='blas')
+    for structure in ['sparse', 'dynamic']:
+        assert_raises(ValueError, Connection, G, H, 'V', structure=structure,
+                      propagation='gather')
+    assert_raises(ValueError, Connection, G, H, 'V', delay=True, structure='sparse',
+                  propagation='gather')
+
+@repeat_with_global_opts([{'useweave': False}, {'useweave': True}])
+def test_fused_propagation():
+    reinit_default_clock()
+    G = NeuronGroup(20, 'V:1\nmod:1')
+    H1 = NeuronGroup(10, 'V:1\nW:1')
+    H2 = NeuronGroup(15, 'V:1')
+    G.mod = rand(20)
+    C1 = Connection(G, H1, 'V', sparseness=0.5, weight=lambda: rand())
+    C2 = Connection(G, H1, 'W', sparseness=0.5, weight=lambda: rand(),
+                    modulation='mod')
+    C3 = Connection(G, H2, 'V', sparseness=0.3, weight=lambda: rand())
+    C4 = Connection(G, H2, 'V', structure='dense', weight=lambda i, j: rand())
+    connections = [C1, C2, C3, C4]
+    M = MultiConnection(G, connections)
+    M.compress()
+    assert len(M._fused) == 3 and M._others == [C4]
+    for spikes in [[], [4], [0, 3, 7, 19], range(20)]:
+        spikes = array(spikes, dtype=int)
+        H1.V = H1.W = H2.V = 0
+        M.propagate(spikes)
+        values = [array(H1.V), array(H1.W), array(H2.V)]
+        H1.V = H1.W = H2.V = 0
+        for C in connections:
+            C.propagate(spikes)
+        assert_array_almost_equal(values[0], H1.V)
+        assert_array_almost_equal(values[1], H1.W)
+        assert_array_almost_equal(values[2], H2.V)
+
 if __name__ == '__main__':
     test_structures()
+    test_dense_propagation_strategies()
+    test_fused_propagation()
@@ -0,0 +1,131 @@
+from numpy.testing import assert_equal, assert_array_almost_equal
+
+from brian import *
+from brian.connections.construction import random_matrix, random_row_func
+from numpy.random import seed
+
+def test_random_stream():
+    '''
+    Counter-based streams.
+    '''
+    R = RandomStream(1)
+    x = hstack((R.rand(10), R.rand(5)))
+    assert R.counter == 15
+    assert_equal(x, RandomStream(1).rand(15))
+    assert not any(RandomStream(2).rand(15) == x)
+    assert not any(RandomStream(1, identity='P').rand(15) == x)
+    # substreams do not depend on the counter
+    assert_equal(R.substream(3).rand(5), RandomStream(1).substream(3).rand(5))
+    assert not any(R.substream(3).rand(5) == R.substream(4).rand(5))
+    # distributions
+    n = 100000
+    u = R.rand(n)
+    assert all((u >= 0) & (u < 1))
+    assert abs(mean(u) - 0.5) < 0.01
+    z = R.randn(n)
+    assert abs(mean(z)) < 0.02 and abs(std(z) - 1) < 0.02
+    assert R.randn(3, 2).shape == (3, 2)
+    assert abs(mean(R.standard_exponential(n)) - 1) < 0.02
+    assert abs(mean(R.geometric(0.1, size=n)) - 10) < 0.2
+    k = R.binomial(20, 0.1, size=n)
+    assert abs(mean(k) - 2) < 0.03 and abs(var(k) - 1.8) < 0.05
+    # large means (rejection sampling), p>0.5 and array arguments
+    k = R.binomial(1000, 0.5, size=n)
+    assert abs(mean(k) - 500) < 0.3 and abs(var(k) - 250) < 5
+    k = R.binomial(100, 0.9, size=n)
+    assert abs(mean(k) - 90) < 0.1 and abs(var(k) - 9) < 0.3
+    assert k.max() <= 100
+    k = R.binomial([0, 5, 5, 10 ** 6], [0.5, 0., 1., 0.3])
+    assert k[0] == 0 and k[1] == 0 and k[2] == 5 and abs(k[3] - 300000) < 3000
+    assert R.binomial(arange(4), 0.5, size=(2, 4)).shape == (2, 4)
+    assert_equal(RandomStream(3).binomial(50, 0.4, size=10),
+                 RandomStream(3).binomial(50, 0.4, size=10))
+    s = R.sample(10, 4)
+    assert len(unique(s)) == 4 and all((s >= 0) & (s < 10))
+    assert_equal(sort(R.sample(10, 10)), arange(10))
+
+def test_seed_random_streams():
+    '''
+    Objects created after seed_random_streams draw the same numbers.
+    '''
+    def spikes():
+        reinit_default_clock()
+        P = PoissonGroup(100, 100 * Hz)
+        Q = PoissonGroup(100, 100 * Hz, max_rate=100 * Hz)
+        M, MQ = SpikeMonitor(P), SpikeMonitor(Q)
+        seed(0) # the global numpy state does not matter
+        run(20 * ms)
+        return M.spikes, MQ.spikes
+    try:
+        seed_random_streams(5)
+        spikes1 = spikes()
+        seed_random_streams(5)
+        spikes2 = spikes()
+        assert len(spikes1[0]) and len(spikes1[1])
+        assert spikes1 == spikes2
+        assert spikes1[0] != spikes1[1]
+    finally:
+        seed_random_streams(None)
+
+def test_connect_random_streams():
+    '''
+    Random connectivity with a seed, built row by row from substreams.
+    '''
+    G = NeuronGroup(50, 'v : 1')
+    C1 = Connection(G, G, 'v')
+    C1.connect_random(p=0.1, seed=3)
+    C2 = Connection(G, G, 'v')
+    C2.connect_random(p=0.1, seed=3)
+    assert_equal(C1.W.todense(), C2.W.todense())
+    assert C1.W.nnz > 0
+    # row i only depends on the substream i
+    W = random_matrix(50, 50, 0.1, rng=RandomStream(3))
+    assert_equal(W.todense(), C1.W.todense())
+    W = random_matrix(10, 50, 0.1, rng=RandomStream(3).substream(7))
+    assert_equal(W.todense()[2], random_matrix(3, 50, 0.1, rng=RandomStream(3).substream(7)).todense()[2])
+    # fixed number of synapses per column
+    C3 = Connection(G, G, 'v')
+    C3.connect_random(p=0.2, fixed=True, seed=3)
+    assert_equal(asarray(C3.W.todense()).sum(axis=0), 10 * ones(50))
+    # user-computed rows
+    row_func = random_row_func(50, 0.1, initseed=3)
+    row = row_func(4).copy()
+    seed(0)
+    row_func(5)
+    assert_equal(row_func(4), row)
+    assert row.sum() > 0
+
+def test_synapses_random_streams():
+    '''
+    Random synapses do not depend on how the candidate synapses are split in
+    blocks, nor on the global state of numpy.random.
+    '''
+    def build(max_candidates, numpy_seed):
+        old_max = get_global_preference('synapses_max_candidates')
+        set_global_preferences(synapses_max_candidates=max_candidates)
+        try:
+            seed_random_streams(5)
+            seed(numpy_seed)
+            G = NeuronGroup(40, 'v : 1')
+            S = Synapses(G, G, model='w : 1', pre='v+=w')
+            S[:, :] = 0.1
+            S[:, :] = 'rand()<0.1'
+            S[:, :] = 'exp(-abs(i-j)/5.)'
+            S[:, :] = 'int(i)%2==0 and rand()<0.2' # evaluated row by row
+            S.w = 'rand()'
+            return (S.presynaptic[:].copy(), S.postsynaptic[:].copy(),
+                    S.w[:].copy())
+        finally:
+            set_global_preferences(synapses_max_candidates=old_max)
+            seed_random_streams(None)
+    S1 = build(2 ** 20, 0)
+    assert len(S1[0]) > 0
+    for max_candidates, numpy_seed in [(2 ** 20, 1), (100, 0), (1, 2)]:
+        for x, y in zip(S1, build(max_candidates, numpy_seed)):
+            assert_equal(x, y)
+
+if __name__ == '__main__':
+    test_random_stream()
+    test_seed_random_streams()
+    test_connect_random_streams()
+    test_synapses_random_streams()
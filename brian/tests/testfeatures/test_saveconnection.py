@@ -0,0 +1,66 @@
+import os
+import tempfile
+
+from numpy.testing import assert_equal, assert_array_almost_equal
+
+from brian import *
+
+def test_save_load_connection():
+    '''
+    Tests saving and loading the connectivity of Connection objects
+    '''
+    reinit_default_clock()
+    G = NeuronGroup(10, 'V:1\nmod:1')
+    H = NeuronGroup(5, 'V:1')
+    G.mod = rand(len(G))
+    fd, filename = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        for structure in ['sparse', 'dense', 'dynamic']:
+            for delay in [False, True]:
+                if delay:
+                    C = Connection(G, H, 'V', structure=structure, delay=True,
+                                   max_delay=3*ms)
+                    C.connect_random(G, H, 0.5, weight=lambda: rand(), delay=(0*ms, 2*ms))
+                else:
+                    C = Connection(G, H, 'V', structure=structure, modulation='mod',
+                                   delay=1*ms)
+                    C.connect_random(G, H, 0.5, weight=lambda: rand())
+                C.save(filename)
+                for mmap_mode in ['r', None]:
+                    D = Connection.load(filename, G, H, mmap_mode=mmap_mode)
+                    assert D.__class__ is C.__class__
+                    assert D.nstate == C.nstate
+                    assert D._nstate_mod == C._nstate_mod
+                    assert_equal(D.W.todense(), C.W.todense())
+                    if delay:
+                        assert D._max_delay == C._max_delay
+                        assert_equal(D.delay.todense(), C.delay.todense())
+                    else:
+                        assert D.delay == C.delay
+                    if structure == 'sparse':
+                        if mmap_mode is not None:
+                            assert isinstance(D.W.alldata, memmap)
+                        for j in range(len(H)):
+                            assert_equal(D.W.get_col(j), C.W.get_col(j))
+                    # propagation with the loaded connection
+                    H.V = 0
+                    D.propagate(arange(len(G)))
+                    if delay:
+                        assert_array_almost_equal(D._delayedreaction.sum(axis=0),
+                                                  C.W.todense().sum(axis=0))
+                    else:
+                        assert_array_almost_equal(H.V, dot(G.mod, C.W.todense()))
+                    del D
+        # wrong sizes
+        try:
+            Connection.load(filename, H, G)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('Loading with the wrong groups should fail')
+    finally:
+        os.remove(filename)
+
+if __name__ == '__main__':
+    test_save_load_connection()
@@ -0,0 +1,75 @@
+import os
+import tempfile
+
+from numpy.testing import assert_equal, assert_array_almost_equal
+
+from brian import *
+
+def make_synapses(source, target):
+    return Synapses(source, target, model='''w : 1
+                                             dx/dt = -x / (5 * ms) : 1''',
+                    pre='v += w; x += 1', post='w += 0.1 * x')
+
+def test_save_load_synapses():
+    '''
+    Tests saving and loading Synapses objects
+    '''
+    fd, filename = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        # reference simulation, interrupted at 5 ms
+        reinit_default_clock()
+        source = SpikeGeneratorGroup(4, [(i, (i + 2) * ms) for i in range(4)])
+        target = NeuronGroup(3, model='v : 1', threshold=1.5, reset=0)
+        S = make_synapses(source, target)
+        S[:, :] = 'i != j'
+        S.w = 'rand()'
+        S.delay = '(i + j) * ms'
+        net = Network(source, target, S)
+        net.run(5 * ms)
+        S.save(filename)
+        v_saved = target.v[:].copy()
+        net.run(5 * ms)
+        w_end, v_end = S.w[:].copy(), target.v[:].copy()
+        assert (v_end != v_saved).any()
+
+        for mmap_mode in ['r', 'c', None]:
+            reinit_default_clock()
+            # spikes are in the queues
+            source = SpikeGeneratorGroup(4, [(3, 0 * ms)])
+            target = NeuronGroup(3, model='v : 1', threshold=1.5, reset=0)
+            S2 = make_synapses(source, target)
+            S2.load(filename, mmap_mode=mmap_mode)
+            assert len(S2) == len(S)
+            assert_equal(S2.presynaptic[:], S.presynaptic[:])
+            assert_equal(S2.postsynaptic[:], S.postsynaptic[:])
+            assert_equal(S2.delay[:], S.delay[:])
+            for i in range(len(source)):
+                assert_equal(S2.synapses_pre[i][:], S.synapses_pre[i][:])
+            if mmap_mode is not None:
+                assert isinstance(S2._S, memmap)
+            # events from the spikes at 2-4 ms
+            assert sum(len(x) for x in S2.queues[0]._pending_events()) > 0
+            if mmap_mode == 'r':
+                continue
+            # resume the simulation
+            target.v = v_saved
+            Network(source, target, S2).run(5 * ms)
+            assert_array_almost_equal(S2.w[:], w_end)
+            assert_array_almost_equal(target.v[:], v_end)
+        # wrong models and sizes
+        for args, model in [((target, source), 'w : 1\nx : 1'),
+                            ((source, target), 'w : 1')]:
+            S3 = Synapses(*args, model=model, pre='v += w', post='w += 0.1')
+            try:
+                S3.load(filename)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError('Loading in the wrong Synapses object should fail')
+        del S2
+    finally:
+        os.remove(filename)
+
+if __name__ == '__main__':
+    test_save_load_synapses()
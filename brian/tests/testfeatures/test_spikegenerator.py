@@ -0,0 +1,81 @@
+import os
+import tempfile
+
+from numpy.testing import assert_equal, assert_array_almost_equal
+
+from brian import *
+
+def run_generator(spiketimes, duration=50*ms, period=None, restart=False):
+    reinit_default_clock()
+    G = SpikeGeneratorGroup(5, spiketimes, period=period)
+    M = SpikeMonitor(G)
+    net = Network(G, M)
+    net.run(duration)
+    if restart:
+        # the clock goes back in time without reinitialising the group
+        defaultclock.t = 0*ms
+        net.run(duration)
+    return G, array(M.spikes)
+
+def test_compressed_spike_source():
+    '''
+    Only timesteps with spikes are stored, the spikes are the same as before.
+    '''
+    idx = array([0, 3, 1, 4, 2, 0, 1])
+    times = array([1, 1, 5, 5, 17.3, 40, 49.9]) * 0.001
+    G, spikes = run_generator((idx, times))
+    thresh = G._threshold
+    assert_equal(thresh.steps, [10, 50, 173, 400, 499])
+    assert_equal(thresh.offsets, [0, 2, 4, 5, 6, 7])
+    assert_equal(spikes[:, 0], [0, 3, 1, 4, 2, 0, 1])
+    assert_array_almost_equal(spikes[:, 1], [1e-3, 1e-3, 5e-3, 5e-3, 17.3e-3, 40e-3, 49.9e-3])
+    assert_array_almost_equal(array(G.spiketimes, dtype=float),
+                              spikes)
+    # the times are quantities in seconds
+    assert G.spiketimes[0] == (0, 1 * msecond)
+    assert all(have_same_dimensions(t, second) for _, t in G.spiketimes)
+    # a very long and sparse input
+    G, spikes = run_generator(([1, 2], [1e-3, 3600.]), duration=2*ms)
+    assert len(G._threshold.offsets) == 3
+    assert_equal(spikes[:, 0], [1])
+    # the clock goes back in time
+    G, spikes = run_generator((idx, times), restart=True)
+    assert_equal(spikes[:, 0], [0, 3, 1, 4, 2, 0, 1] * 2)
+    # periodic input
+    G, spikes = run_generator(([0, 1], [1e-3, 5e-3]), duration=26*ms,
+                              period=10*ms)
+    assert_equal(spikes[:, 0], [0, 1] * 3)
+    assert_array_almost_equal(spikes[:, 1], array([1, 5, 11, 15, 21, 25]) * 1e-3)
+    # no spikes
+    G, spikes = run_generator([])
+    assert len(spikes) == 0
+
+def test_save_load_spikes():
+    '''
+    Spikes saved to a file and memory mapped.
+    '''
+    idx = randint(5, size=1000)
+    times = rand(1000) * 0.05
+    fd, filename = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        G, spikes = run_generator((idx, times))
+        G.save(filename)
+        G2, spikes2 = run_generator(filename)
+        assert isinstance(G2._threshold.I, memmap)
+        assert_equal(spikes2, spikes)
+        defaultclock.dt = 0.2*ms
+        try:
+            SpikeGeneratorGroup(5, filename)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('Loading spikes with a different dt should fail')
+        reinit_default_clock()
+        defaultclock.dt = 0.1*ms
+    finally:
+        os.remove(filename)
+
+if __name__ == '__main__':
+    test_compressed_spike_source()
+    test_save_load_spikes()
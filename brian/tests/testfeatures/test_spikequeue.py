@@ -0,0 +1,129 @@
+'''
+Tests the spike queues of the Synapses class: the Python version, the weave
+version and the C++ version (if compiled) must give the same events.
+'''
+from brian import *
+from brian.synapses import spikequeue
+from brian.synapses.spikequeue import SpikeQueue, synapses_csr, synaptic_events, ranks
+from brian.utils.dynamicarray import DynamicArray1D
+from brian.tests import repeat_with_global_opts
+from numpy.testing import assert_array_equal
+
+def make_synapses(N, nsynapses):
+    pre = randint(N, size=nsynapses)
+    pre[0] = N - 1
+    pre.sort()
+    synapses = []
+    for i in range(N):
+        targets = DynamicArray1D(0, dtype=int32)
+        idx = (pre == i).nonzero()[0]
+        targets.resize(len(idx))
+        targets[:] = idx
+        synapses.append(targets)
+    return synapses
+
+def test_synaptic_events():
+    '''
+    Synapses in CSR format.
+    '''
+    synapses = make_synapses(10, 50)
+    ind, flat = synapses_csr(synapses)
+    spikes = array([7, 2, 3, 9, 2])
+    assert_array_equal(synaptic_events(ind, flat, spikes),
+                       hstack([synapses[i].data for i in spikes]))
+    assert len(synaptic_events(ind, flat, array([], dtype=int))) == 0
+
+def test_ranks():
+    '''
+    Offsets of events with the same delay.
+    '''
+    assert_array_equal(ranks(array([7, 5, 7, 3, 7, 5])), [0, 0, 1, 0, 2, 1])
+    assert len(ranks(array([], dtype=int))) == 0
+    x = randint(5, size=100)
+    expected = [sum(x[:k] == x[k]) for k in range(len(x))]
+    assert_array_equal(ranks(x), expected)
+
+def run_queue(queue_class, synapses, delays, spikes, max_delay=0*ms):
+    reinit_default_clock()
+    G = NeuronGroup(len(synapses), 'v:1')
+    queue = queue_class(G, synapses, delays, max_delay=max_delay)
+    queue.compress()
+    events = []
+    for step_spikes in spikes:
+        queue.propagate(step_spikes)
+        events.append(sort(queue.peek()))
+        queue.next()
+    return events
+
+@repeat_with_global_opts([{'useweave': False}, {'useweave': True}])
+def test_spikequeue_backends():
+    '''
+    Compare spike queues with heterogeneous and homogeneous delays.
+    '''
+    seed(3210)
+    N, nsynapses = 20, 300
+    synapses = make_synapses(N, nsynapses)
+    spikes = [randint(N, size=randint(8)) for _ in range(50)]
+    queue_classes = [SpikeQueue]
+    if spikequeue.has_cspikequeue:
+        queue_classes.append(spikequeue.CSpikeQueue)
+    for delays in [randint(1, 10, size=nsynapses), 3*ones(nsynapses, dtype=int)]:
+        # events are checked against a simple implementation
+        expected = [[] for _ in range(len(spikes) + 10)]
+        for t, step_spikes in enumerate(spikes):
+            for i in step_spikes:
+                for k in synapses[i].data:
+                    expected[t + delays[k]].append(k)
+        for queue_class in queue_classes:
+            for max_delay in [0*ms, 2*ms]:
+                events = run_queue(queue_class, synapses, delays, spikes,
+                                   max_delay=max_delay)
+                for t in range(len(spikes)):
+                    assert_array_equal(events[t], sort(expected[t]))
+
+@repeat_with_global_opts([{'useweave': False}, {'useweave': True}])
+def test_spikequeue_bins():
+    '''
+    Time bins grow independently and shrink after a burst.
+    '''
+    reinit_default_clock()
+    N = 1000
+    synapses = make_synapses(N, N)
+    delays = randint(1, 6, size=N)
+    G = NeuronGroup(N, 'v:1')
+    queue = SpikeQueue(G, synapses, delays)
+    queue.compress()
+    nevents = 0
+    for t in range(200):
+        if t == 10:
+            before = queue.capacity.copy()
+            n = queue.n.copy()
+            queue.propagate(arange(N)) # burst
+            burst = queue.n - n
+            hit = burst > 0
+            # only the bins receiving the burst have grown
+            assert len(queue.capacity) == 6
+            assert hit.sum() == 5
+            assert (queue.capacity[hit] >= burst[hit]).all()
+            assert (queue.capacity[hit] > before[hit]).all()
+            assert_array_equal(queue.capacity[~hit], before[~hit])
+            grown = queue.capacity.copy()
+        elif t < 190:
+            queue.propagate(array([t]))
+        nevents += len(queue.peek())
+        queue.next()
+    assert nevents == N + sum(len(synapses[t].data) for t in range(190) if t != 10)
+    peak, mean = queue.statistics()
+    assert peak.sum() >= N
+    assert (mean < 50).all()
+    # the structure has shrunk back after the burst has drained
+    assert (queue.n == 0).all()
+    assert (queue.capacity[hit] < grown[hit]).all()
+    assert queue.capacity.max() < N / 5
+    assert len(queue.pool) < N
+
+if __name__ == '__main__':
+    test_synaptic_events()
+    test_ranks()
+    test_spikequeue_backends()
+    test_spikequeue_bins()
@@ -0,0 +1,43 @@
+'''
+Tests of summed (lumped) variables, i.e. postsynaptic variables that are the
+sum of a synaptic variable over the synapses of each neuron.
+'''
+from brian import *
+from brian.tests import repeat_with_global_opts
+from numpy.testing import assert_array_almost_equal
+
+@repeat_with_global_opts([{'useweave': False}, {'useweave': True}])
+def test_summed_variables():
+    '''
+    Summed synaptic state variables and static equations.
+    '''
+    reinit_default_clock()
+    G = NeuronGroup(3, model='''v : 1
+                                gtot : 1
+                                Itot : 1''')
+    G.v = [1., 2., 4.]
+    # the last neuron has no synapse
+    S = Synapses(G, model='''g : 1
+                             I = g * (v_pre - v_post) : 1''')
+    S[:, 0] = True
+    S[0, 1] = True
+    S.g[:] = arange(1, len(S) + 1)
+    G.gtot = S.g
+    G.Itot = S.I
+    net = Network(G, S)
+    net.run(defaultclock.dt)
+    expected_gtot = zeros(3)
+    expected_Itot = zeros(3)
+    for i, j, g in zip(S.presynaptic[:], S.postsynaptic[:], S.g[:]):
+        expected_gtot[j] += g
+        expected_Itot[j] += g * (G.v[i] - G.v[j])
+    assert_array_almost_equal(G.gtot, expected_gtot)
+    assert_array_almost_equal(G.Itot, expected_Itot)
+    assert G.gtot[2] == 0
+    # values are updated at every timestep
+    S.g[:] = 1
+    net.run(defaultclock.dt)
+    assert_array_almost_equal(G.gtot, [3, 1, 0])
+
+if __name__ == '__main__':
+    test_summed_variables()
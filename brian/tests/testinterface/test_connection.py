@@ -265,7 +265,127 @@ def test_access():
                       [0., 0., 0.]])))    
     
 
+def test_structural_plasticity():
+    'Test inserting and removing many synapses in a DynamicConnectionMatrix'
+    G = NeuronGroup(20, model=LazyStateUpdater())
+    C = Connection(G, G, structure='dynamic')
+    C.connect_random(G, G, 0.2, weight=1.)
+    C.compress()
+    W = C.W
+    dense = W.todense()
+    # insertion, including existing and repeated elements
+    i = randint(20, size=100)
+    j = randint(20, size=100)
+    x = rand(100)
+    W.insert_many(i, j, x)
+    for k in xrange(100):
+        dense[i[k], j[k]] = x[k]
+    assert all(W.todense() == dense)
+    assert W.getnnz() == (dense != 0).sum()
+    # columns are rebuilt when needed
+    for k in xrange(20):
+        col = W.get_col(k)
+        assert all(col.ind == dense[:, k].nonzero()[0])
+        assert all(asarray(col) == dense[col.ind, k])
+    # removal
+    i, j = dense.nonzero()
+    remove = permutation(len(i))[:len(i) // 2]
+    W.remove_many(i[remove], j[remove])
+    dense[i[remove], j[remove]] = 0
+    assert all(W.todense() == dense)
+    assert W.getnnz() == (dense != 0).sum()
+    for k in xrange(20):
+        assert all(W.get_col(k).ind == dense[:, k].nonzero()[0])
+    # single insertions and removals are still consistent
+    i, j = dense.nonzero()
+    W.remove(i[0], j[0])
+    dense[i[0], j[0]] = 0
+    W.insert(0, 0, 2.)
+    dense[0, 0] = 2.
+    assert all(W.todense() == dense)
+    # single insertions shift the row in place while the buffer has room
+    cols = dense[3].nonzero()[0]
+    if len(cols):
+        W.remove_many([3] * len(cols), cols)
+        dense[3] = 0
+    inplace = 0
+    for k, col in enumerate([10, 5, 15, 0, 12, 7]):
+        buf = W._rowjbuf[3]
+        room = len(W.rowj[3]) < len(buf)
+        W.insert(3, col, k + 1.)
+        dense[3, col] = k + 1.
+        if room:
+            assert W._rowjbuf[3] is buf
+            inplace += 1
+    assert inplace > 0
+    assert all(W.rowj[3] == dense[3].nonzero()[0])
+    assert all(W.todense() == dense)
+    for k in xrange(20):
+        assert all(W.get_col(k).ind == dense[:, k].nonzero()[0])
+    # single edits update the valid columns instead of invalidating them
+    for k in xrange(50):
+        i, j = randint(20), randint(20)
+        if dense[i, j]:
+            W.remove(i, j)
+            dense[i, j] = 0
+        else:
+            W.insert(i, j, 1.)
+            dense[i, j] = 1.
+        col = W.get_col(j)
+        assert W._cols_valid
+        assert all(col.ind == dense[:, j].nonzero()[0])
+        assert all(asarray(col) == dense[col.ind, j])
+    # removing everything compacts the matrix
+    i, j = dense.nonzero()
+    W.remove_many(i, j)
+    assert W.getnnz() == 0
+    assert W.nnzmax <= 1
+    assert all(W.todense() == 0)
+    # removing non-existing synapses fails
+    assert_raises(ValueError, W.remove_many, [0], [0])
+    W.insert_many([1, 2], [3, 4], 5.)
+    assert W[1, 3] == 5. and W[2, 4] == 5.
+    assert_raises(ValueError, W.remove_many, [1, 2], [3, 5])
+    assert W[1, 3] == 5. and W[2, 4] == 5.
+
+def test_sparse_column_access():
+    'Test column access in a SparseConnectionMatrix'
+    G = NeuronGroup(20, model=LazyStateUpdater())
+    C = Connection(G, G, delay=True)
+    C.connect_random(G, G, 0.3, weight=lambda: rand(), delay=(0 * ms, 2 * ms))
+    C.compress()
+    W = C.W
+    dense = W.todense()
+    nonzero = dense != 0
+    for j in xrange(20):
+        col = W.get_col(j)
+        assert all(col.ind == dense[:, j].nonzero()[0])
+        assert all(asarray(col) == dense[col.ind, j])
+        # in place update with a sparse vector, a dense vector or a scalar
+        W.set_col(j, col * 2)
+        dense[:, j] *= 2
+        assert all(W.todense() == dense)
+        W.set_col(j, arange(20.))
+        dense[col.ind, j] = col.ind
+        assert all(W.todense() == dense)
+    W[:, 3] = 5.
+    dense[nonzero[:, 3], 3] = 5.
+    assert all(W.todense() == dense)
+    # several columns at once
+    cols = [5, 2, 17]
+    dataind, i, j = W.get_cols_dataindices(cols)
+    assert all(W.alldata[dataind] == dense[i, j])
+    assert len(dataind) == sum(nonzero[:, cols])
+    assert all(sort(i[j == 2]) == nonzero[:, 2].nonzero()[0])
+    # the delay matrix shares the structure of the weight matrix
+    assert C.delay.allj is W.allj
+    assert C.delay.allcoldataindices is W.allcoldataindices
+    assert C.delay.alldata is not W.alldata
+    assert all((C.delay.todense() != 0) <= nonzero)
+
 if __name__ == '__main__':
     test_construction()
     test_access()
     test_utility_functions()
+    test_structural_plasticity()
+    test_sparse_column_access()
@@ -90,6 +90,29 @@ def test_linked_var():
     
     assert(sum(abs(2 * mon1[0] - mon2[0])) == 0)    
     
+    # Several linked variables are copied by a single operation
+    
+    reinit_default_clock()
+    
+    G1 = NeuronGroup(4, model='''dv/dt = -v/(10*ms) : 1
+                                 w = 2 * v : 1''')
+    G2 = NeuronGroup(4, model='''a : 1
+                                 b : 1
+                                 c : 1''')
+    G2.a = linked_var(G1, 'v', when='middle')
+    G2.b = linked_var(G1, 'w', when='middle')
+    G2[2:].c = linked_var(G1[:2], 'v', when='middle', func=lambda x: -x)
+    assert len(G2.contained_objects) == 1
+    G1.v = [1, 2, 3, 4]
+    net = Network(G1, G2)
+    net.run(5*ms)
+    assert all(G2.a == G1.v) and all(G2.b == 2 * G1.v)
+    assert all(G2.c == [0, 0, -G1.v[0], -G1.v[1]])
+    
+    # No copy between a variable and itself
+    G1.v = linked_var(G1, 'v')
+    assert len(G1.contained_objects) == 0
+    
 
 def test_variable_setting():
     '''
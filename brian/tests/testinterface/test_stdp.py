@@ -1,5 +1,8 @@
 from brian import *
+from brian.stdp import EventDrivenSTDPGroup
 from brian.tests import repeat_with_global_opts
+from numpy.testing import assert_array_almost_equal
+from nose.tools import assert_raises
 
 @repeat_with_global_opts([{'usecstdp': False,  'useweave': False},
                           {'usecstdp': True,  'useweave': True}])
@@ -36,5 +39,47 @@ def test_stdp():
     # Postsynaptic spike came after presynaptic spike: weight should increase
     assert(con.W[0, 0] > 1) 
 
+@repeat_with_global_opts([{'useweave': False}, {'useweave': True}])
+def test_event_driven_stdp():
+    '''
+    Test that event-driven STDP variables give the same results as variables
+    integrated at every time step.
+    '''
+    def run_stdp(event_driven, structure):
+        reinit_default_clock()
+        inp = SpikeGeneratorGroup(3, [(i, (4 * k + i + 0.55) * ms)
+                                      for i in range(3) for k in range(5)])
+        driver = SpikeGeneratorGroup(2, [(j, (3 * k + 2 * j + 1.25) * ms)
+                                         for j in range(2) for k in range(7)])
+        G = NeuronGroup(2, model='v : 1', threshold=1, reset=0)
+        drive = IdentityConnection(driver, G, 'v', weight=2)
+        con = Connection(inp, G, 'v', structure=structure, weight=0.5)
+        stdp = ExponentialSTDP(con, 10 * ms, 20 * ms, 0.1, -0.12, wmax=1,
+                               interactions='nearest_pre', update='mixed',
+                               event_driven=event_driven)
+        net = Network(inp, driver, G, drive, con, stdp)
+        net.run(21 * ms)
+        return con.W.todense(), stdp
+
+    for structure in ['sparse', 'dense']:
+        W, stdp = run_stdp(False, structure)
+        W_event_driven, stdp_event_driven = run_stdp(True, structure)
+        assert isinstance(stdp_event_driven.pre_group, EventDrivenSTDPGroup)
+        assert_array_almost_equal(W, W_event_driven)
+        assert_array_almost_equal(stdp.A_pre, stdp_event_driven.A_pre)
+        assert_array_almost_equal(stdp.A_post, stdp_event_driven.A_post)
+    
+    # nonlinear and coupled equations
+    G = NeuronGroup(1, model='v : 1')
+    for eqs in ['''dA_pre/dt = -A_pre**2/(10*ms) : 1
+                   dA_post/dt = -A_post/(10*ms) : 1''',
+                '''dA_pre/dt = (B_pre-A_pre)/(10*ms) : 1
+                   dB_pre/dt = -B_pre/(10*ms) : 1
+                   dA_post/dt = -A_post/(10*ms) : 1''']:
+        con = Connection(G, G, 'v')
+        assert_raises(ValueError, STDP, con, eqs=eqs, pre='A_pre+=1; w+=A_post',
+                      post='A_post+=1; w+=A_pre', event_driven=True)
+
 if __name__ == '__main__':
-    test_stdp()
\ No newline at end of file
+    test_stdp()
+    test_event_driven_stdp()
\ No newline at end of file
@@ -9,15 +9,18 @@ import sys
 
 from nose.tools import assert_raises
 import numpy as np
+from numpy.testing import assert_array_almost_equal
 
 from brian.network import Network
 from brian.clock import defaultclock, reinit_default_clock
+from brian.globalprefs import get_global_preference, set_global_preferences
 from brian.synapses import Synapses, SynapticEquations
 from brian.neurongroup import NeuronGroup
 from brian.directcontrol import SpikeGeneratorGroup
 from brian.monitor import StateMonitor
 from brian.threshold import NoThreshold
 from brian.stdunits import ms, mV, nS, nF
+from brian.units import second
 
 
 def test_construction_single_synapses():
@@ -536,6 +539,141 @@ def test_smallest_inttype():
         inttype = smallest_inttype(value)
         assert inttype(value) == value
 
+def test_construction_by_blocks():
+    '''
+    Tests the construction of synapses by blocks of presynaptic neurons.
+    '''
+    G = NeuronGroup(20, model='v:1', threshold=NoThreshold())
+    max_candidates = get_global_preference('synapses_max_candidates')
+    set_global_preferences(synapses_max_candidates=7) # blocks of 1 presynaptic neuron
+    try:
+        for condition in ['(i + j) % 3 == 0',
+                          'abs(i - j) < 2',
+                          'int(i) == 4', # not vectorised over i
+                          'i * 0.']:
+            syn = Synapses(G[:8], G[10:], model='w:1')
+            syn[:, :] = condition
+            expected = [(i, j) for i in range(8) for j in range(10)
+                        if eval(condition.replace('abs', 'np.abs'))]
+            assert len(syn) == len(expected)
+            assert zip(syn.presynaptic[:], syn.postsynaptic[:]) == expected
+        syn = Synapses(G, G, model='w:1')
+        syn.connect_random(sparseness=0.5)
+        assert 100 < len(syn) < 300
+        # synapses with the same presynaptic neuron are contiguous
+        presynaptic = syn.presynaptic[:]
+        assert (np.diff(presynaptic) >= 0).all()
+        for i in range(20):
+            assert (presynaptic[syn.synapses_pre[i][:]] == i).all()
+        # postsynaptic neurons are all different
+        for i in range(20):
+            post = syn.postsynaptic[syn.synapses_pre[i][:]]
+            assert len(np.unique(post)) == len(post)
+        # the postsynaptic mapping is built for all blocks
+        for j in range(20):
+            assert (syn.postsynaptic[syn.synapses_post[j][:]] == j).all()
+        assert sum(len(syn.synapses_post[j]) for j in range(20)) == len(syn)
+        syn = Synapses(G, G, model='w:1')
+        syn.connect_random(sparseness=1.)
+        assert len(syn) == 400
+        assert all(len(syn.synapses_post[j]) == 20 for j in range(20))
+    finally:
+        set_global_preferences(synapses_max_candidates=max_candidates)
+
+def test_reorder():
+    '''
+    Tests the reordering of synapses.
+    '''
+    np.random.seed(42)
+    pre = np.random.randint(5, size=30)
+    post = np.random.randint(4, size=30)
+    delays = np.random.randint(1, 4, size=30)
+    results = []
+    for reorder in [False, True]:
+        reinit_default_clock()
+        G = SpikeGeneratorGroup(5, [(i, 0 * ms) for i in range(5)])
+        H = NeuronGroup(4, model='v:1')
+        S = Synapses(G, H, model='w:1', pre='v += w', reorder=reorder)
+        S.create_synapses(pre, post)
+        S.w[:] = np.arange(30)
+        S.delay[:] = delays * ms
+        net = Network(G, H, S)
+        net.run(5 * ms)
+        results.append(H.v[:].copy())
+        if reorder:
+            # synapses are sorted by (pre, delay, post)
+            keys = zip(S.presynaptic[:], S.delay[:], S.postsynaptic[:])
+            assert keys == sorted(keys)
+            assert sorted(S.w[:]) == range(30)
+            k = np.argsort(S.w[:])
+            assert (S.presynaptic[:][k] == pre).all()
+            assert (S.postsynaptic[:][k] == post).all()
+            assert (S.delay[:][k] == delays * ms).all()
+            for i in range(5):
+                assert (S.presynaptic[:][S.synapses_pre[i][:]] == i).all()
+            for j in range(4):
+                assert (S.postsynaptic[:][S.synapses_post[j][:]] == j).all()
+    assert (results[0] == results[1]).all()
+    assert (results[0] > 0).all()
+
+def test_event_driven():
+    '''
+    Tests the automatic detection of event-driven variables.
+    '''
+    reinit_default_clock()
+    G = NeuronGroup(2, model='v:1')
+    tau = 10 * ms
+    model = '''w : 1
+               tauf : second
+               dApre/dt = -Apre / tau : 1
+               du/dt = (0.5 - u) / tauf : 1
+               dg/dt = (x - g) / tau : 1
+               dx/dt = -x / tau : 1
+               dy/dt = -y * y / tau : 1
+               dz/dt = (v_post - z) / tau : 1
+               dr/dt = -r / tau + t / second ** 2 : 1
+               ds/dt = -s / tau : 1
+               I = w * s : 1'''
+    S = Synapses(G, model=model, pre='v += w', event_driven=True)
+    # x is used by g, s is used by I
+    assert sorted(S._eqs._eventdriven.keys()) == ['Apre', 'u']
+    assert 'lastupdate' in S.var_index
+    # only the identifiers of the event-driven updates are copied
+    S = Synapses(G, model=model, pre='v += w', event_driven=True)
+    assert 'tau' in S.namespaces[0]
+    assert '_unit' not in S.namespaces[0]
+    assert 'xi' not in S.namespaces[0]
+    S = Synapses(G, model=model, pre='v += w')
+    assert len(S._eqs._eventdriven) == 0
+
+    # event-driven and integrated variables give the same results
+    results = []
+    for event_driven in [False, True]:
+        reinit_default_clock()
+        source = SpikeGeneratorGroup(3, [(i, (3 * k + 0.4 * i) * ms)
+                                         for i in range(3) for k in range(5)])
+        target = NeuronGroup(2, model='v:1')
+        S = Synapses(source, target, model='''w : 1
+                                              dApre/dt = -Apre / tau : 1
+                                              dApost/dt = -Apost / tau : 1
+                                              dx/dt = (1 - x) / (20 * ms) : 1''',
+                     pre='''v += w * x
+                            x *= 0.8
+                            Apre += 0.01
+                            w += Apost''',
+                     post='''Apost -= 0.01
+                             w += Apre''',
+                     event_driven=event_driven)
+        S[:, :] = True
+        S.w = 0.5
+        S.x = 1
+        net = Network(source, target, S)
+        net.run(20 * ms)
+        results.append((S.w[:].copy(), target.v[:].copy()))
+    # integration errors only
+    assert_array_almost_equal(results[0][0], results[1][0], decimal=4)
+    assert_array_almost_equal(results[0][1], results[1][1], decimal=4)
+
 def test_indent():
     '''
     Tests the indent function.
@@ -559,3 +697,6 @@ if __name__ == '__main__':
     test_smallest_inttype()
     test_indent()
     test_max_delay()
+    test_construction_by_blocks()
+    test_reorder()
+    test_event_driven()
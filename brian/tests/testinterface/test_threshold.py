@@ -200,6 +200,10 @@ def test():
     G = NeuronGroup(3, model=LazyStateUpdater(), reset=NoReset(),
                     threshold=PoissonThreshold())
     test_poisson_threshold(G)
+
+    G = NeuronGroup(3, model=LazyStateUpdater(), reset=NoReset(),
+                    threshold=PoissonThreshold(max_rate=1. / get_default_clock().dt))
+    test_poisson_threshold(G)
     
     # Poisson threshold via a string threshold using the rand() function
     eqs = '''v : 1
@@ -1,4 +1,4 @@
-from numpy import array
+from numpy import array, arange
 
 from brian.utils.dynamicarray import DynamicArray, DynamicArray1D
 
@@ -95,5 +95,29 @@ def test_dynamicarray():
     assert(x.shape == y.shape)
     assert((x == y).all())
 
+def test_set_data():
+    # The data is used without copy until the array is enlarged
+    for cls, shape in [(DynamicArray, (2, 3)), (DynamicArray1D, (3,))]:
+        for use_numpy_resize in [False, True]:
+            x = cls(shape, dtype=int, use_numpy_resize=use_numpy_resize)
+            base = arange(12)
+            data = base[:6].reshape(shape) if len(shape) == 2 else base[:3]
+            x.set_data(data)
+            assert x.shape == data.shape
+            x[0] = 7
+            assert (data[0] == 7).all() and base[0] == 7
+            newshape = (4, 3) if len(shape) == 2 else 5
+            x.resize(newshape)
+            x[:] = 1
+            # base is not modified by a copy
+            assert base[-1] == 11
+            assert (x.data == 1).all()
+    try:
+        DynamicArray((2, 3)).set_data(arange(3))
+        raise AssertionError('ValueError not raised')
+    except ValueError:
+        pass
+
 if __name__ == '__main__':
-    test_dynamicarray()
\ No newline at end of file
+    test_dynamicarray()
+    test_set_data()
\ No newline at end of file
@@ -47,6 +47,7 @@ from brian.clock import guess_clock
 from brian.globalprefs import get_global_preference
 from brian.inspection import namespace, get_identifiers
 from brian.log import log_warn
+from brian.randomstreams import RandomStream, skip_ahead_indices
 from brian.units import check_units, second, msecond, mvolt
 from brian.utils.approximatecomparisons import is_approx_equal
 
@@ -212,6 +213,7 @@ class StringThreshold(Threshold):
         self._vars = unknowns
         self._expr = expr
         self._code = compile(expr, "StringThreshold", "eval")
+        self._random = RandomStream()
         class Replacer(object):
             def __init__(self, func, n):
                 self.n = n
@@ -223,8 +225,8 @@ class StringThreshold(Threshold):
     def __call__(self, P):
         for var in self._vars: # couldn't we do this just once?
             self._namespace[var] = P.state(var)
-        self._namespace['rand'] = self._Replacer(rand, len(P))
-        self._namespace['randn'] = self._Replacer(randn, len(P))
+        self._namespace['rand'] = self._Replacer(self._random.rand, len(P))
+        self._namespace['randn'] = self._Replacer(self._random.randn, len(P))
         return eval(self._code, self._namespace).nonzero()[0]
 
     def __repr__(self):
@@ -455,15 +457,39 @@ class PoissonThreshold(Threshold):
     '''
     Poisson threshold: a spike is produced with some probability S[0]*dt,
     or S[state]*dt.
+    
+    If an upper bound ``max_rate`` of the rates is given, candidate spikes
+    are generated at rate ``max_rate`` by skipping ahead over the neurons
+    (see :func:`skip_ahead_indices`), and then accepted with probability
+    ``rate/max_rate`` (thinning). Only the rates of the candidate neurons are
+    read, so that the cost is proportional to the number of spikes rather
+    than to the number of neurons. Rates above ``max_rate`` are truncated.
+    
+    The random numbers are drawn from a :class:`RandomStream` owned by the
+    threshold.
     '''
     # TODO: check the state has units in Hz
-    def __init__(self, state=0):
+    def __init__(self, state=0, max_rate=None):
         self.state = state
+        self.max_rate = max_rate
+        self._random = RandomStream()
 
     def __call__(self, P):
-        return (random.rand(len(P)) < P.state_(self.state)[:] * P.clock.dt).nonzero()[0]
+        if self.max_rate is None:
+            return (self._random.rand(len(P)) < P.state_(self.state)[:] * P.clock.dt).nonzero()[0]
+        dt = P.clock._dt
+        p = min(float(self.max_rate) * dt, 1.)
+        candidates = skip_ahead_indices(len(P), p, self._random)
+        if len(candidates) == 0:
+            return candidates
+        rates = P.state_(self.state)[candidates]
+        return candidates[self._random.rand(len(candidates)) * p < rates * dt]
 
     def __repr__(self):
+        if self.max_rate is not None:
+            return '%s(state=%s, max_rate=%s)' % (self.__class__.__name__,
+                                                  repr(self.state),
+                                                  repr(self.max_rate))
         return '%s(state=%s)' % (self.__class__.__name__,
                                  repr(self.state))
     
@@ -45,6 +45,7 @@ class DynamicArray(object):
     
     .. automethod:: resize
     .. automethod:: shrink
+    .. automethod:: set_data
     
     Some numpy methods are implemented and can work directly on the array object,
     including ``len(arr)``, ``arr[...]`` and ``arr[...]=...``. In other cases,
@@ -115,7 +116,8 @@ class DynamicArray(object):
             minnewshapearr[resizedimensions] = newdims
             newshapearr = maximum(newshapearr, minnewshapearr)
             do_resize = False
-            if self.use_numpy_resize and self._data.flags['C_CONTIGUOUS']:
+            if self.use_numpy_resize and self._data.flags['C_CONTIGUOUS'] and \
+               self._data.flags['OWNDATA']:
                 if sum(resizedimensions)==resizedimensions[0]:
                     do_resize = True
             if do_resize:
@@ -148,6 +150,19 @@ class DynamicArray(object):
             self._data = newdata
             self.shape = tuple(newshapearr)
             self.data = self._data
+
+    def set_data(self, data):
+        '''
+        Makes the array use the Numpy array ``data`` as its data, without
+        copying it (e.g. a memory mapped array). The data is copied to a new
+        block of memory when the array is enlarged.
+        '''
+        if data.ndim != len(self.shape):
+            raise ValueError('The data should have ' + str(len(self.shape)) + ' dimensions')
+        self._data = data
+        self.data = data
+        self.shape = data.shape
+        self.dtype = data.dtype
     
     def __getitem__(self, item):
         return self.data.__getitem__(item)
@@ -183,7 +198,8 @@ class DynamicArray1D(DynamicArray):
         datashape, = self._data.shape
         if newshape>datashape:
             newdatashape = max(newshape, int(shape*self.factor)+1)
-            if self.use_numpy_resize and self._data.flags['C_CONTIGUOUS']:
+            if self.use_numpy_resize and self._data.flags['C_CONTIGUOUS'] and \
+               self._data.flags['OWNDATA']:
                 self.data = None
                 self._data.resize(newdatashape, refcheck=self.refcheck)
             else:
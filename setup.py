@@ -73,6 +73,13 @@ if not os.getenv('BRIAN_SETUP_NO_EXTENSIONS', False):
                                                         'circular.cpp')],
                                      include_dirs=[numpy.get_include()]
                                      ))    
+    cspikequeue_path = os.path.join('brian', 'experimental', 'cspikequeue')
+    ext_modules.append(Extension('brian.experimental.cspikequeue._cspikequeue',
+                                 sources=[os.path.join(cspikequeue_path, x) for x in
+                                                       ('spikequeue_wrap.cxx',
+                                                        'spikequeue.cpp')],
+                                     include_dirs=[numpy.get_include()]
+                                     ))
 
 
 setup(name='brian',